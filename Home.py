@@ -1,4 +1,9 @@
 import streamlit as st
+from profiling import profile_page
+from tenants import check_password, load_tenants
+
+# Profile this rerun when profiling is enabled
+profile_page()
 
 def authenticate():
     # Display the logo on the top of the page
@@ -15,11 +20,18 @@ def authenticate():
 
     # Authentication form
     with st.form(key='login_form'):
+        tenants = load_tenants()
+        # The club picks the database every page works on; only asked when there are several
+        if len(tenants) > 1:
+            tenant = st.selectbox('Clube', list(tenants), format_func=lambda key: tenants[key]['name'])
+        else:
+            tenant = next(iter(tenants))
         password = st.text_input('Insira Password:', type='password')
         login_button = st.form_submit_button('Login')
         
         if login_button:  # Trigger when form is submitted
-            if password == 'aac':
+            if check_password(tenant, password):
+                st.session_state.tenant = tenant
                 st.session_state.authenticated = True
                 st.success('Password Correta!')
                 # Switch to "1_Next_Match"
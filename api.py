@@ -0,0 +1,232 @@
+# Read-only JSON API for phones and other light clients, next to the Streamlit app.
+#
+# Parents mostly want to know which car their kid is in, which doesn't need the whole
+# app and its websocket session. This serves the same reads as the pages (through
+# storage.py) over plain HTTP:
+#   GET /api/<club>/teams
+#   GET /api/<club>/teams/<team>/next-match
+#   GET /api/<club>/matches/<id>/roster
+#   GET /api/<club>/matches/past?team=&search=&from=&to=&after=<date>,<id>&limit=
+# Requests authenticate with HTTP Basic auth: the club key of tenants.py as the user
+# and the club password.
+#
+# Responses carry an ETag and a Last-Modified built from the change counters of the
+# tables they read (db.load_table_versions()), so a client sending If-None-Match or
+# If-Modified-Since gets 304 Not Modified without any query being run while nothing
+# changed. Clubs on a non-SQLite backend are served without them. The ETag is the
+# authoritative check: Last-Modified only has one-second resolution, so it is left out
+# while the last change is in the current second (a write later in that second would
+# carry the same time).
+#
+# Run it as a separate process next to Streamlit:
+#   python api.py --port 8502
+
+import argparse
+import base64
+import binascii
+import json
+import re
+import traceback
+from datetime import datetime, time, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from db import load_table_versions, using_database
+from storage import StorageError, get_storage
+from tenants import check_password, load_tenants, tenant_database
+
+# Largest page of past matches a client can ask for
+MAX_PAGE_SIZE = 100
+
+# Range of the integers SQLite can store (larger ids can't match any row)
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+# Raised by the routes for a request they can't answer, with its HTTP status
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Function to parse an integer parameter, answering 400 if it isn't one in the given range
+def _int_param(value, name, minimum=MIN_INTEGER, maximum=MAX_INTEGER):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(400, f"'{name}' must be an integer") from None
+    if not minimum <= number <= maximum:
+        raise ApiError(400, f"'{name}' must be between {minimum} and {maximum}")
+    return number
+
+
+# Function to get the cursor of the next page of a keyset-paginated list (see pagination.py)
+def _next_cursor(rows, page_size):
+    if len(rows) <= page_size:
+        return None
+    last_row = rows[page_size - 1]
+    return f'{last_row.date},{last_row.id}'
+
+
+# Functions answering each route, from the storage of the club, the groups of the
+# path and the query parameters
+def _teams(storage, groups, query):
+    return {'teams': [team._asdict() for team in storage.teams()]}
+
+
+def _next_match(storage, groups, query):
+    match = storage.next_match(unquote(groups[0]))
+    return {'match': match._asdict() if match else None}
+
+
+def _roster(storage, groups, query):
+    # The history roster covers the live and the archived matches
+    cars, athletes_by_car = storage.past_match_roster(_int_param(groups[0], 'id'))
+    return {'cars': [
+        dict(car._asdict(), athletes=[athlete._asdict() for athlete in athletes_by_car.get(car.id, [])])
+        for car in cars
+    ]}
+
+
+def _past_matches(storage, groups, query):
+    page_size = _int_param(query.get('limit', '25'), 'limit', 1, MAX_PAGE_SIZE)
+    after = None
+    if query.get('after'):
+        after_date, _, after_id = query['after'].rpartition(',')
+        after = (after_date, _int_param(after_id, 'after'))
+    teams = tuple(team for team in query.get('team', '').split(',') if team)
+    rows = storage.past_matches_page(teams, query.get('search', ''), query.get('from') or None,
+                                     query.get('to') or None, after, page_size)
+    return {'matches': [match._asdict() for match in rows[:page_size]], 'next': _next_cursor(rows, page_size)}
+
+
+# Routes: path pattern (after /api/<club>), tables read, whether the answer also depends
+# on today's date (next and past matches), and the function answering it
+ROUTES = [
+    (re.compile(r'/teams'), ('teams',), False, _teams),
+    (re.compile(r'/teams/([^/]+)/next-match'), ('matches',), True, _next_match),
+    (re.compile(r'/matches/(\d+)/roster'), ('cars', 'assignments', 'athletes'), False, _roster),
+    (re.compile(r'/matches/past'), ('matches',), True, _past_matches),
+]
+
+
+# Function to get the ETag and Last-Modified time of a route from the change counters of
+# its tables (None for databases without counters)
+def _validators(database, tables, dated):
+    if '://' in database:
+        return None
+    with using_database(database):
+        versions = load_table_versions()
+    last_modified = max(versions[table][1] for table in tables)
+    # The time of the last change keeps a recreated database from reusing old tags
+    etag = '-'.join(str(versions[table][0]) for table in tables) + f'-{last_modified}'
+    if dated:
+        # Matches move from next to past at midnight (UTC, like SQLite's DATE('now'))
+        today = datetime.now(timezone.utc).date()
+        last_modified = max(last_modified, int(datetime.combine(today, time(), timezone.utc).timestamp()))
+        etag += f'-{today.isoformat()}'
+    return f'W/"{etag}"', last_modified
+
+
+# Function to check whether the client already has the current version of a response
+def _not_modified(headers, etag, last_modified):
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= last_modified
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = 'AACCarpoolAPI/1.0'
+
+    def do_GET(self):
+        try:
+            self._answer()
+        except ApiError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except StorageError as e:
+            self._send_json(503, {'error': str(e)})
+        except Exception:
+            # Log the traceback and still answer, instead of dropping the connection
+            self.log_error('Error answering %s:\n%s', self.path, traceback.format_exc())
+            self._send_json(500, {'error': 'internal error'})
+
+    # Function to find the club and route of the request and answer it
+    def _answer(self):
+        url = urlsplit(self.path)
+        parts = url.path.rstrip('/').split('/', 3)
+        if len(parts) < 4 or parts[1] != 'api':
+            raise ApiError(404, 'not found')
+        tenant, path = parts[2], '/' + parts[3]
+        if tenant not in load_tenants():
+            raise ApiError(404, 'unknown club')
+        self._authenticate(tenant)
+
+        for pattern, tables, dated, answer in ROUTES:
+            match = pattern.fullmatch(path)
+            if match:
+                break
+        else:
+            raise ApiError(404, 'not found')
+
+        database = tenant_database(tenant)
+        validators = _validators(database, tables, dated)
+        if validators and _not_modified(self.headers, *validators):
+            self.send_response(304)
+            self._send_validators(validators)
+            self.end_headers()
+            return
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        self._send_json(200, answer(get_storage(database), match.groups(), query), validators)
+
+    # Function to check the Basic credentials of the request against the club password
+    def _authenticate(self, tenant):
+        scheme, _, credentials = self.headers.get('Authorization', '').partition(' ')
+        try:
+            user, _, password = base64.b64decode(credentials).decode('utf-8').partition(':')
+        except (binascii.Error, UnicodeDecodeError):
+            user = password = None
+        if scheme.lower() != 'basic' or user != tenant or not check_password(tenant, password):
+            raise ApiError(401, 'authentication required')
+
+    def _send_validators(self, validators):
+        # Clients may keep the answer but must check it is still current before using it
+        self.send_header('Cache-Control', 'private, no-cache')
+        if validators:
+            etag, last_modified = validators
+            self.send_header('ETag', etag)
+            if last_modified < int(datetime.now(timezone.utc).timestamp()):
+                self.send_header('Last-Modified', formatdate(last_modified, usegmt=True))
+
+    def _send_json(self, status, data, validators=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200:
+            self._send_validators(validators)
+        elif status == 401:
+            self.send_header('WWW-Authenticate', 'Basic realm="AAC carpool", charset="UTF-8"')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the read-only JSON API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    print(f"Serving the API of {len(load_tenants())} club(s) on http://{args.host}:{args.port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,105 @@
+# Archiving of finished seasons.
+#
+# Matches of seasons that have ended, with their cars and assignments, are moved from
+# the live tables to the archive database (athletes_archive.db, attached to every
+# connection as `archive`) and the live database is then VACUUMed, so the tables and
+# indexes the live board uses only hold the current season. The history page and the
+# export read the live and archived rows together through the history_* views.
+#
+# Meant to run from a scheduler once a season has ended, e.g. with cron:
+#   0 4 1 8 * cd /path/to/app && python archive.py
+# or for an explicit cutoff: python archive.py --before 2024-08-01
+# Every club of the registry (see tenants.py) is archived, or only the one given with --tenant.
+
+import argparse
+from datetime import date
+
+from db import get_connection, write_transaction
+
+# Month in which a new season starts (seasons run from August to July)
+SEASON_START_MONTH = 8
+
+
+# Function to get the first day of the season a day belongs to
+def season_start(day):
+    year = day.year if day.month >= SEASON_START_MONTH else day.year - 1
+    return date(year, SEASON_START_MONTH, 1)
+
+
+# Function to move every match played before `cutoff` (YYYY-MM-DD) to the archive.
+# Returns the number of matches, cars and assignments moved.
+#
+# SQLite doesn't commit atomically across attached databases in WAL mode, so the rows are
+# first copied and committed to the archive, then deleted from the live database in a
+# second transaction. A crash in between leaves the rows in both files: the history views
+# skip archived rows still live, and running the job again finishes the move.
+def archive_before(cutoff):
+    old_matches = 'SELECT id FROM main.matches WHERE date < ?'
+    with write_transaction('matches', 'cars', 'assignments') as conn:
+        # INSERT OR REPLACE keeps the job idempotent if it's interrupted and run again
+        matches = conn.execute('''
+            INSERT OR REPLACE INTO archive.matches (id, name, date, google_maps_link, team)
+            SELECT id, name, date, google_maps_link, team FROM main.matches WHERE date < ?
+        ''', (cutoff,)).rowcount
+        cars = conn.execute(f'''
+            INSERT OR REPLACE INTO archive.cars (id, match_id, driver, contact, seats)
+            SELECT id, match_id, driver, contact, seats FROM main.cars WHERE match_id IN ({old_matches})
+        ''', (cutoff,)).rowcount
+        assignments = conn.execute(f'''
+            INSERT OR REPLACE INTO archive.assignments (id, match_id, car_id, athlete_id, athlete_name, athlete_contact)
+            SELECT s.id, s.match_id, s.car_id, s.athlete_id, a.name, a.contact
+            FROM main.assignments s LEFT JOIN main.athletes a ON a.id = s.athlete_id
+            WHERE s.match_id IN ({old_matches})
+        ''', (cutoff,)).rowcount
+
+    with write_transaction('matches', 'cars', 'assignments') as conn:
+        # Only rows already in the archive are deleted: cars or athletes added to an old
+        # match in between keep it live until the next run
+        conn.execute(f'''
+            DELETE FROM main.assignments
+            WHERE match_id IN ({old_matches}) AND id IN (SELECT id FROM archive.assignments)
+        ''', (cutoff,))
+        conn.execute(f'''
+            DELETE FROM main.cars
+            WHERE match_id IN ({old_matches}) AND id IN (SELECT id FROM archive.cars)
+            AND NOT EXISTS (SELECT 1 FROM main.assignments s WHERE s.car_id = main.cars.id)
+        ''', (cutoff,))
+        conn.execute('''
+            DELETE FROM main.matches
+            WHERE date < ? AND id IN (SELECT id FROM archive.matches)
+            AND NOT EXISTS (SELECT 1 FROM main.cars c WHERE c.match_id = main.matches.id)
+            AND NOT EXISTS (SELECT 1 FROM main.assignments s WHERE s.match_id = main.matches.id)
+        ''', (cutoff,))
+
+    if matches:
+        vacuum()
+    return {'matches': matches, 'cars': cars, 'assignments': assignments}
+
+
+# Function to move every season that has already ended to the archive
+def archive_finished_seasons(today=None):
+    return archive_before(season_start(today or date.today()).isoformat())
+
+
+# Function to give the space freed in the live database back and fold both WAL files
+# into their databases
+def vacuum():
+    conn = get_connection()
+    conn.execute('VACUUM main')
+    conn.execute('PRAGMA main.wal_checkpoint(TRUNCATE)')
+    conn.execute('PRAGMA archive.wal_checkpoint(TRUNCATE)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move finished seasons to the archive database')
+    parser.add_argument('--before', help='archive the matches played before this date (YYYY-MM-DD); '
+                                         'defaults to the start of the current season')
+    parser.add_argument('--tenant', action='append', help='club to archive (repeatable); defaults to every club')
+    args = parser.parse_args()
+
+    from tenants import load_tenants, use_tenant
+
+    for tenant in args.tenant or load_tenants():
+        use_tenant(tenant)
+        moved = archive_before(args.before) if args.before else archive_finished_seasons()
+        print(f"{tenant}: archived {moved['matches']} matches, {moved['cars']} cars and {moved['assignments']} assignments")
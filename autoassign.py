@@ -0,0 +1,67 @@
+# Automatic assignment of athletes to cars.
+#
+# Works on plain dicts so it can be used from the pages and from scripts:
+# athletes need 'id' and 'contact', cars need 'id', 'contact' and 'seats'
+# (the free seats left in the car).
+
+
+# Function to normalize a contact so "912 345 678" and "912345678" match
+def _contact_key(contact):
+    return ''.join(ch for ch in str(contact or '') if ch.isalnum()).lower()
+
+
+# Function to split the athletes into groups that should travel together.
+# Athletes sharing a contact (usually the parents' phone) are treated as siblings.
+def _group_athletes(athletes, keep_siblings_together):
+    if not keep_siblings_together:
+        return [[athlete] for athlete in athletes]
+    groups = {}
+    for athlete in athletes:
+        key = _contact_key(athlete['contact']) or f"athlete-{athlete['id']}"
+        groups.setdefault(key, []).append(athlete)
+    return list(groups.values())
+
+
+# Function to compute a full assignment in one pass.
+# Returns the list of (athlete_id, car_id) pairs and the athletes left without a seat.
+def plan_assignments(athletes, cars, keep_siblings_together=True, prefer_own_driver=True):
+    free_seats = {car['id']: int(car['seats']) for car in cars if int(car['seats']) > 0}
+    car_by_contact = {_contact_key(car['contact']): car['id'] for car in cars if _contact_key(car['contact'])}
+    plan = []
+    unassigned = []
+
+    def place(group, car_id):
+        seats = min(len(group), free_seats[car_id])
+        for athlete in group[:seats]:
+            plan.append((athlete['id'], car_id))
+        free_seats[car_id] -= seats
+        return group[seats:]
+
+    groups = _group_athletes(athletes, keep_siblings_together)
+
+    # Athletes whose family is driving go in their own car first
+    remaining_groups = []
+    for group in groups:
+        own_car_id = car_by_contact.get(_contact_key(group[0]['contact'])) if prefer_own_driver else None
+        if own_car_id is not None and free_seats.get(own_car_id, 0) > 0:
+            group = place(group, own_car_id)
+        if group:
+            remaining_groups.append(group)
+
+    # Then the biggest groups first, each in the fullest car that still fits it whole
+    # (best fit keeps the larger gaps for the larger groups); groups that fit nowhere
+    # whole are split across the emptiest cars
+    for group in sorted(remaining_groups, key=len, reverse=True):
+        while group:
+            open_cars = [car_id for car_id, seats in free_seats.items() if seats > 0]
+            if not open_cars:
+                unassigned.extend(group)
+                break
+            fitting_cars = [car_id for car_id in open_cars if free_seats[car_id] >= len(group)]
+            if fitting_cars:
+                car_id = min(fitting_cars, key=lambda car_id: free_seats[car_id])
+            else:
+                car_id = max(open_cars, key=lambda car_id: free_seats[car_id])
+            group = place(group, car_id)
+
+    return plan, unassigned
@@ -0,0 +1,113 @@
+# Seeded generator of synthetic athletes.db files for the benchmarks.
+#
+# Usage: python benchmarks/generate_data.py --scale medium --output athletes.db
+
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate
+
+# Size of every scale: teams, athletes, matches, cars per match and assignments
+SCALES = {
+    'small': {'teams': 6, 'athletes': 100, 'matches': 60, 'cars_per_match': 3, 'assignments': 600},
+    'medium': {'teams': 10, 'athletes': 5000, 'matches': 2000, 'cars_per_match': 4, 'assignments': 30000},
+    'large': {'teams': 14, 'athletes': 50000, 'matches': 10000, 'cars_per_match': 5, 'assignments': 200000},
+}
+
+FIRST_NAMES = ['João', 'Inês', 'Maria', 'Tiago', 'Beatriz', 'Rodrigo', 'Leonor', 'Martim', 'Matilde', 'Tomás',
+               'Francisca', 'Duarte', 'Carolina', 'Afonso', 'Mariana', 'Gonçalo', 'Sofia', 'Diogo', 'Ana', 'Rui']
+LAST_NAMES = ['Silva', 'Santos', 'Ferreira', 'Pereira', 'Oliveira', 'Costa', 'Rodrigues', 'Martins', 'Jesus',
+              'Sousa', 'Fernandes', 'Gonçalves', 'Gomes', 'Lopes', 'Marques', 'Alves', 'Almeida', 'Ribeiro']
+PLACES = ['Coimbra', 'Porto', 'Lisboa', 'Aveiro', 'Leiria', 'Viseu', 'Figueira da Foz', 'Braga', 'Guarda', 'Tomar']
+
+
+# Function to fill a new database file with the given scale of synthetic data
+def generate(path, scale='small', seed=42):
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    today = datetime.date.today()
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+
+    with conn:
+        teams = [f'Sub-{age}' for age in range(6, 6 + 2 * sizes['teams'], 2)]
+        conn.executemany('INSERT INTO teams (name) VALUES (?)', [(team,) for team in teams])
+        team_ids = dict(conn.execute('SELECT name, id FROM teams'))
+
+        # Athletes, each in one team (a few also play in the team above)
+        athletes = []
+        memberships = []
+        for athlete_id in range(1, sizes['athletes'] + 1):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+            contact = f"9{rng.randint(10000000, 99999999)}"
+            athletes.append((athlete_id, name, contact))
+            team_index = rng.randrange(len(teams))
+            memberships.append((athlete_id, team_ids[teams[team_index]]))
+            if team_index + 1 < len(teams) and rng.random() < 0.1:
+                memberships.append((athlete_id, team_ids[teams[team_index + 1]]))
+        conn.executemany('INSERT INTO athletes (id, name, contact) VALUES (?, ?, ?)', athletes)
+        conn.executemany('INSERT INTO athlete_teams (athlete_id, team_id) VALUES (?, ?)', memberships)
+
+        athletes_by_team = {}
+        for athlete_id, team_id in memberships:
+            athletes_by_team.setdefault(team_id, []).append(athlete_id)
+
+        # Matches spread over the past three years, with the next few weeks for every team
+        matches = []
+        for match_id in range(1, sizes['matches'] + 1):
+            team = teams[match_id % len(teams)]
+            if match_id <= 3 * len(teams):
+                date = today + datetime.timedelta(days=rng.randint(1, 30))
+            else:
+                date = today - datetime.timedelta(days=rng.randint(1, 3 * 365))
+            link = f"https://maps.google.com/?q={rng.choice(PLACES).replace(' ', '+')}"
+            matches.append((match_id, rng.choice(PLACES), date.isoformat(), link, team))
+        conn.executemany('INSERT INTO matches (id, name, date, google_maps_link, team) VALUES (?, ?, ?, ?, ?)', matches)
+
+        # Cars with 3 to 6 seats for every match
+        cars = []
+        for match_id, _, _, _, team in matches:
+            for _ in range(sizes['cars_per_match']):
+                driver = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                cars.append([len(cars) + 1, match_id, driver, f"9{rng.randint(10000000, 99999999)}", rng.randint(3, 6)])
+
+        # Assignments: athletes of the match's team into cars that still have free seats
+        assignments = []
+        per_match = max(1, sizes['assignments'] // len(matches))
+        cars_by_match = {}
+        for car in cars:
+            cars_by_match.setdefault(car[1], []).append(car)
+        for match_id, _, _, _, team in matches:
+            candidates = athletes_by_team.get(team_ids[team], [])
+            open_cars = list(cars_by_match.get(match_id, []))
+            for athlete_id in rng.sample(candidates, min(per_match, len(candidates))):
+                open_cars = [car for car in open_cars if car[4] > 0]
+                if not open_cars:
+                    break
+                car = rng.choice(open_cars)
+                car[4] -= 1
+                assignments.append((match_id, car[0], athlete_id))
+        conn.executemany('INSERT INTO cars (id, match_id, driver, contact, seats) VALUES (?, ?, ?, ?, ?)', cars)
+        conn.executemany('INSERT INTO assignments (match_id, car_id, athlete_id) VALUES (?, ?, ?)', assignments)
+
+    conn.execute('ANALYZE')
+    conn.close()
+    return {'teams': len(teams), 'athletes': len(athletes), 'matches': len(matches), 'cars': len(cars), 'assignments': len(assignments)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic athletes.db')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='athletes.db')
+    args = parser.parse_args()
+    print(generate(args.output, args.scale, args.seed))
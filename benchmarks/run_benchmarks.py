@@ -0,0 +1,263 @@
+# Headless benchmarks of every page through Streamlit's AppTest.
+#
+# For every scale a synthetic athletes.db is generated (see generate_data.py) and each
+# page is rendered and then driven through its interactions (filter, assign, remove,
+# edit, ...). Every step reports wall time, number of SQL statements and peak Python
+# memory, and the results are written as JSON so runs can be compared.
+#
+# Usage: python benchmarks/run_benchmarks.py --scale small medium --output results.json
+#
+# Peak memory is measured with tracemalloc, which slows Python down; use --no-memory
+# when only the timings matter.
+#
+# The pages read the generated data from SQLite by default; --storage memory or
+# --storage postgresql://localhost/carpool copies it to another backend (see storage.py)
+# and benchmarks the pages on that one.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from generate_data import SCALES, generate
+
+# Statements counted as queries (PRAGMA, BEGIN and COMMIT are left out)
+QUERY_PREFIXES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+_query_count = [0]
+
+
+# Function to count the statements run on every connection the pool opens
+def _install_query_counter():
+    import db
+
+    configure_connection = db._configure_connection
+
+    def counting_configure_connection(path):
+        conn = configure_connection(path)
+        conn.set_trace_callback(
+            lambda statement: _query_count.__setitem__(0, _query_count[0] + 1)
+            if statement.lstrip().upper().startswith(QUERY_PREFIXES) else None
+        )
+        return conn
+
+    db._configure_connection = counting_configure_connection
+
+
+# Functions to find widgets by label in an AppTest (the last one, with `last`,
+# for forms further down the page that reuse a label)
+def _widget(elements, label, last=False):
+    matches = [element for element in elements if element.label == label]
+    if not matches:
+        raise LookupError(f"widget '{label}' not found")
+    return matches[-1] if last else matches[0]
+
+
+def _button(at, label, last=False):
+    return _widget(at.button, label, last)
+
+
+# Interactions of every page, each one a function driving the AppTest through reruns
+def _select_second_team(at):
+    selectbox = _widget(at.selectbox, 'Escolher Escalão')
+    selectbox.select_index(min(1, len(selectbox.options) - 1)).run()
+
+
+def _assign(at):
+    _button(at, 'Confirmar').click().run()
+
+
+def _remove(at):
+    _button(at, 'Remover').click().run()
+
+
+def _edit_car(at):
+    _button(at, 'Atualizar').click().run()
+
+
+def _toggle_overview(value):
+    def toggle_overview(at):
+        _widget(at.toggle, 'Ver todos os escalões').set_value(value).run()
+    return toggle_overview
+
+
+def _filter_first_team(at):
+    multiselect = _widget(at.multiselect, 'Escolher Escalões')
+    multiselect.select(multiselect.options[0]).run()
+
+
+def _search(label, text):
+    def search(at):
+        _widget(at.text_input, label).input(text).run()
+    return search
+
+
+def _next_page(at):
+    _button(at, 'Seguinte').click().run()
+
+
+def _edit_and_confirm(at):
+    _button(at, 'Editar').click().run()
+    _button(at, 'Confirmar', last=True).click().run()
+
+
+def _edit_team(at):
+    _button(at, 'Editar').click().run()
+    _button(at, 'Atualizar').click().run()
+
+
+def _select_past_match(at):
+    _widget(at.selectbox, 'Escolha um Jogo para ver Detalhes').select_index(1).run()
+
+
+SCENARIOS = [
+    ('1_Próximos_Jogos.py', [
+        ('filter', _select_second_team),
+        ('overview', _toggle_overview(True)),
+        ('board', _toggle_overview(False)),
+        ('assign', _assign),
+        ('remove', _remove),
+        ('edit', _edit_car),
+        ('search', _search('Procurar Atleta', 'ines')),
+    ]),
+    ('2_Atletas.py', [
+        ('next_page', _next_page),
+        ('filter', _filter_first_team),
+        ('search', _search('Procurar por Nome ou Contacto', 'goncalves')),
+        ('edit', _edit_and_confirm),
+    ]),
+    ('3_Jogos.py', [
+        ('filter', _filter_first_team),
+        ('search', _search('Procurar por Local', 'Porto')),
+        ('edit', _edit_and_confirm),
+    ]),
+    ('4_Escalões.py', [
+        ('edit', _edit_team),
+    ]),
+    ('5_Jogos_Antigos.py', [
+        ('filter', _filter_first_team),
+        ('select_match', _select_past_match),
+    ]),
+]
+
+
+# Function to run one step and measure it
+def _measure(page, step, action, memory):
+    queries_before = _query_count[0]
+    if memory:
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    error = None
+    try:
+        at = action()
+        if at is not None and at.exception:
+            error = at.exception[0].message
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    result = {
+        'page': page,
+        'step': step,
+        'wall_time_ms': round((time.perf_counter() - start) * 1000, 2),
+        'queries': _query_count[0] - queries_before,
+    }
+    if memory:
+        result['peak_memory_kb'] = round((tracemalloc.get_traced_memory()[1] - memory_before) / 1024, 1)
+    if error:
+        result['error'] = error
+    return result
+
+
+# Function to serve the generated database from another storage backend, through a
+# tenant registry pointing the benchmark club at it
+def _use_storage(location, path, workdir):
+    from storage import get_storage
+
+    get_storage(location).load_sqlite(path)
+    registry = os.path.join(workdir, 'tenants.json')
+    with open(registry, 'w') as f:
+        json.dump({'aac': {'name': 'AAC', 'database': location, 'password_salt': '', 'password_scrypt': ''}}, f)
+    os.environ['AAC_TENANTS_FILE'] = registry
+
+
+# Function to benchmark every page on one scale, in the current process
+def run_scale(scale, seed, memory, storage='sqlite'):
+    from streamlit.testing.v1 import AppTest
+
+    workdir = tempfile.mkdtemp(prefix=f'aac-bench-{scale}-')
+    data = generate(os.path.join(workdir, 'athletes.db'), scale, seed)
+    shutil.copy(os.path.join(REPO_ROOT, 'logo_aac.png'), workdir)
+    os.chdir(workdir)
+    if storage != 'sqlite':
+        _use_storage('memory://benchmark' if storage == 'memory' else storage, 'athletes.db', workdir)
+    _install_query_counter()
+    if memory:
+        tracemalloc.start()
+
+    steps = []
+    for page, interactions in SCENARIOS:
+        at = AppTest.from_file(os.path.join(REPO_ROOT, 'pages', page), default_timeout=600)
+        at.session_state['authenticated'] = True
+        at.session_state['tenant'] = 'aac'
+        steps.append(_measure(page, 'render', at.run, memory))
+        for step, interaction in interactions:
+            steps.append(_measure(page, step, lambda: interaction(at) or at, memory))
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {'data': data, 'steps': steps}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every page headlessly')
+    parser.add_argument('--scale', nargs='+', choices=SCALES, default=['small'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip tracemalloc')
+    parser.add_argument('--storage', default='sqlite', help="'sqlite', 'memory' or a postgresql:// URL")
+    parser.add_argument('--single-scale', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: one scale, written as JSON to --output
+    if args.single_scale:
+        with open(args.output, 'w') as f:
+            json.dump(run_scale(args.single_scale, args.seed, args.memory, args.storage), f)
+        sys.exit(0)
+
+    # Every scale runs in its own process, so the connection pool and caches start empty
+    results = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'memory': args.memory,
+        'scales': {},
+    }
+    for scale in args.scale:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            scale_output = f.name
+        command = [sys.executable, os.path.abspath(__file__), '--single-scale', scale,
+                   '--seed', str(args.seed), '--output', scale_output, '--storage', args.storage]
+        if not args.memory:
+            command.append('--no-memory')
+        subprocess.run(command, check=True)
+        with open(scale_output) as f:
+            results['scales'][scale] = json.load(f)
+        os.remove(scale_output)
+
+        for step in results['scales'][scale]['steps']:
+            memory_column = f"{step['peak_memory_kb']:>10.1f} KB" if 'peak_memory_kb' in step else ''
+            print(f"{scale:<7} {step['page']:<24} {step['step']:<13} {step['wall_time_ms']:>10.1f} ms "
+                  f"{step['queries']:>5} queries {memory_column} {step.get('error', '')}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
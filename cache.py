@@ -0,0 +1,90 @@
+import copy
+import functools
+import threading
+from collections import OrderedDict
+
+# Maximum number of cached results kept in memory, per namespace
+MAX_ENTRIES = 256
+
+# Every table has a generation counter that is bumped whenever it is written to.
+# Cached results are stored under the generations of the tables they read, so a
+# write makes every older entry unreachable and it is evicted in LRU order.
+#
+# Generations and entries are kept per namespace (the database of the current club,
+# see db.py), so clubs never see each other's results and a busy club can't evict
+# the cache of the others.
+#
+# Writes of this process invalidate their tables directly; writes of other processes
+# (scripts such as archive.py, other replicas) are found by the change check set with
+# set_change_check(), run before every cached read (db.py compares the change counters
+# of the database). Results depending on the date take it as an argument, so it is
+# part of their key.
+_generations = {}
+_entries = {}
+_lock = threading.Lock()
+
+
+# Function returning the namespace of the caller, replaced with set_namespace_provider()
+def _namespace():
+    return None
+
+
+# Function to choose how the namespace of the caller is found
+def set_namespace_provider(provider):
+    global _namespace
+    _namespace = provider
+
+
+# Function invalidating the tables changed by other processes, replaced with set_change_check()
+def _check_changes():
+    pass
+
+
+# Function to choose how the changes made by other processes are found
+def set_change_check(check):
+    global _check_changes
+    _check_changes = check
+
+
+# Function to mark tables as changed, called after a write transaction commits
+def invalidate(*tables):
+    namespace = _namespace()
+    with _lock:
+        generations = _generations.setdefault(namespace, {})
+        for table in tables:
+            generations[table] = generations.get(table, 0) + 1
+
+
+# Function to drop every cached result (used by tests and scripts)
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+# Decorator caching a read function for all sessions until one of the given tables changes.
+# Arguments must be hashable; callers get a copy so they can't alter the cached value.
+def cached(*tables):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            _check_changes()
+            namespace = _namespace()
+            with _lock:
+                generations = _generations.get(namespace, {})
+                entries = _entries.setdefault(namespace, OrderedDict())
+                # The generations are read before running the query: if a write
+                # lands meanwhile, the result is stored under the old generations
+                key = (func.__qualname__, args, tuple(generations.get(table, 0) for table in tables))
+                if key in entries:
+                    entries.move_to_end(key)
+                    return copy.copy(entries[key])
+
+            value = func(*args)
+
+            with _lock:
+                entries[key] = value
+                while len(entries) > MAX_ENTRIES:
+                    entries.popitem(last=False)
+            return copy.copy(value)
+        return wrapper
+    return decorator
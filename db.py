@@ -0,0 +1,497 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from cache import cached, invalidate, set_change_check, set_namespace_provider
+from instrumentation import InstrumentedConnection
+from migrations import migrate, migrate_archive
+from rows import Team, Match, Athlete, Passenger, MatchSummary, group_roster
+from search import fts_query
+
+# Path of the database used when no club is selected (scripts, single-club deployments)
+DB_PATH = 'athletes.db'
+
+# Maximum number of idle connections kept around for reuse
+MAX_IDLE_CONNECTIONS = 8
+
+# Retry policy for taking the write lock while another writer holds it (SQLITE_BUSY).
+# Each attempt already waits up to busy_timeout; between attempts we back off
+# exponentially with jitter so writers piling up on match morning spread out.
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05  # seconds, doubled after every attempt
+
+
+# Views over the live tables and the archived seasons together, read by the history page.
+# They are TEMP views (one set per connection) because they span two database files.
+# Archived rows still in the live tables (a move to the archive interrupted between its
+# two commits, see archive.py) are read from the live tables only.
+_HISTORY_VIEWS = [
+    '''
+    CREATE TEMP VIEW IF NOT EXISTS history_matches AS
+    SELECT id, name, date, google_maps_link, team FROM main.matches
+    UNION ALL
+    SELECT id, name, date, google_maps_link, team FROM archive.matches am
+    WHERE NOT EXISTS (SELECT 1 FROM main.matches m WHERE m.id = am.id)
+    ''',
+    '''
+    CREATE TEMP VIEW IF NOT EXISTS history_cars AS
+    SELECT id, match_id, driver, contact, seats FROM main.cars
+    UNION ALL
+    SELECT id, match_id, driver, contact, seats FROM archive.cars ac
+    WHERE NOT EXISTS (SELECT 1 FROM main.cars c WHERE c.id = ac.id)
+    ''',
+    '''
+    CREATE TEMP VIEW IF NOT EXISTS history_assignments AS
+    SELECT s.id, s.match_id, s.car_id, s.athlete_id, a.name AS athlete_name, a.contact AS athlete_contact
+    FROM main.assignments s LEFT JOIN main.athletes a ON a.id = s.athlete_id
+    UNION ALL
+    SELECT id, match_id, car_id, athlete_id, athlete_name, athlete_contact FROM archive.assignments ass
+    WHERE NOT EXISTS (SELECT 1 FROM main.assignments s WHERE s.id = ass.id)
+    ''',
+]
+
+
+# Function to get the path of the archive database kept next to a live database
+def archive_path(path):
+    return os.path.splitext(path)[0] + '_archive.db'
+
+
+# Open a new connection and apply the settings every page relies on
+def _configure_connection(path):
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False, factory=InstrumentedConnection)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA busy_timeout = 5000')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path(path),))
+    conn.execute('PRAGMA archive.journal_mode = WAL')
+    for view in _HISTORY_VIEWS:
+        conn.execute(view)
+    return conn
+
+
+# Holds the connection of a single thread and hands it back to the pool
+# once the thread finishes (when its thread-local storage is cleared)
+class _Lease:
+    def __init__(self, pool, conn):
+        self.conn = conn
+        weakref.finalize(self, pool._release, conn)
+
+
+# Process-wide pool of configured connections, one connection per thread
+class ConnectionPool:
+    def __init__(self, path, max_idle=MAX_IDLE_CONNECTIONS):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # Return the connection of the current thread, reusing an idle one if possible
+    def connection(self):
+        lease = getattr(self._local, 'lease', None)
+        if lease is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = _configure_connection(self.path)
+            lease = _Lease(self, conn)
+            self._local.lease = lease
+        return lease.conn
+
+    # Give a connection back to the pool, closing it if the pool is full
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    # Close every idle connection (used by tests and scripts)
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+# Every database (one per club, see tenants.py) has its own pool, so the clubs
+# served by one process never share connections or wait on each other's locks
+_pools = {}
+_pools_lock = threading.Lock()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_current = threading.local()
+
+
+# Function returning the database of the caller when no thread database is set,
+# replaced with set_database_provider() (tenants.py reads it from the session)
+def _provided_database():
+    return None
+
+
+# Function to choose how the database of the caller is found
+def set_database_provider(provider):
+    global _provided_database
+    _provided_database = provider
+
+
+# Function to make the current thread work on a database (background workers and scripts)
+def use_database(path):
+    _current.path = path
+
+
+# Context manager to work on a database for a while, then go back to the previous one
+@contextmanager
+def using_database(path):
+    previous = getattr(_current, 'path', None)
+    _current.path = path
+    try:
+        yield
+    finally:
+        _current.path = previous
+
+
+# Function to get the path of the database the caller works on
+def current_database():
+    return getattr(_current, 'path', None) or _provided_database() or DB_PATH
+
+
+# The cached reads are kept apart per database
+set_namespace_provider(current_database)
+
+
+# Function to get the connection pool of a database, creating it on first use
+def _pool_for(path):
+    if '://' in path:
+        # A client-server database of storage.py, which has no SQLite tables to offer
+        raise sqlite3.OperationalError(f"'{path}' não é uma base de dados SQLite")
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+# Watches the change counters of a database (table_changes, see migrations.py) from a
+# connection of its own. PRAGMA data_version only changes when another connection has
+# committed, so the counters are read again only after a write.
+class _TableVersions:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.versions = {}
+
+
+_table_versions = {}
+
+
+# Function to get the change counters of the tables of the current database, as
+# {table: (version, Unix time of the last change)}. Tables changed since the last call,
+# by this process or any other, also have their cached reads invalidated.
+def load_table_versions():
+    path = current_database()
+    get_connection()  # brings the schema up to date on first use
+    with _pools_lock:
+        if path not in _table_versions:
+            _table_versions[path] = _TableVersions(path)
+        watcher = _table_versions[path]
+    with watcher.lock:
+        data_version = watcher.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != watcher.data_version:
+            versions = {
+                table: (version, changed_at)
+                for table, version, changed_at in watcher.conn.execute(
+                    'SELECT table_name, version, changed_at FROM table_changes'
+                )
+            }
+            changed = [table for table, version in versions.items() if watcher.versions.get(table) != version]
+            if changed:
+                invalidate(*changed)
+            watcher.data_version, watcher.versions = data_version, versions
+        return watcher.versions
+
+
+# Before a cached read, the tables written by other processes since the last check are
+# invalidated (a PRAGMA data_version while nothing was written)
+set_change_check(load_table_versions)
+
+
+# Function to get today's date as SQLite's DATE('now') does (UTC). Reads depending on it
+# take it as an argument, so their cached results roll over at midnight without a write.
+def today():
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+# Function to bring the schema of a database up to date, once per process
+def _ensure_schema(conn, path):
+    with _schema_lock:
+        if path not in _schema_ready:
+            migrate(conn)
+            migrate_archive(conn)
+            _schema_ready.add(path)
+
+
+# Function used by the pages to get the database connection of the current thread.
+# The connection can be used as a context manager to commit or roll back a transaction.
+def get_connection():
+    path = current_database()
+    conn = _pool_for(path).connection()
+    if path not in _schema_ready:
+        _ensure_schema(conn, path)
+    return conn
+
+
+# Function to check whether an error means the database is locked by another writer
+def _is_busy(error):
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+# Function to start a write transaction, retrying with backoff while the database is busy.
+# In WAL mode only taking the write lock can hit SQLITE_BUSY: once BEGIN IMMEDIATE
+# succeeds, the rest of the transaction and its commit no longer wait on other writers.
+def _begin_immediate(conn):
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == BUSY_RETRIES:
+                raise
+            time.sleep(BUSY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+# Context manager for the add/update/delete functions: takes the write lock up front,
+# commits the transaction (or rolls it back on error) and then invalidates the cached
+# reads of the tables it writes to
+@contextmanager
+def write_transaction(*tables):
+    conn = get_connection()
+    _begin_immediate(conn)
+    with conn:
+        yield conn
+    invalidate(*tables)
+
+
+# Function to run a read query and build a record (see rows.py) from every row
+def _records(record, query, params=()):
+    with get_connection() as conn:
+        return [record._make(row) for row in conn.execute(query, params)]
+
+
+# Function to load all teams
+@cached('teams')
+def load_teams():
+    return _records(Team, "SELECT id, name FROM teams ORDER BY id")
+
+
+# Function to finish a keyset-paginated query: adds the WHERE conditions, the position
+# after the last row of the previous page (`after`) and the ORDER BY/LIMIT of one page
+def _keyset_page(query, conditions, params, sort_columns, after, descending, page_size):
+    if after is not None:
+        conditions.append(f"({', '.join(sort_columns)}) {'<' if descending else '>'} ({', '.join('?' * len(after))})")
+        params.extend(after)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    direction = 'DESC' if descending else 'ASC'
+    # One extra row tells the page whether there is a next page
+    query += f" ORDER BY {', '.join(f'{column} {direction}' for column in sort_columns)} LIMIT {int(page_size) + 1}"
+    return query, params
+
+
+_MATCHES_QUERY = "SELECT id, name, date, google_maps_link, team FROM matches"
+
+
+# Function to load one page of matches, optionally only those of the given teams
+# and whose name contains `search`, sorted by date
+@cached('matches')
+def load_matches_page(teams=(), search='', after=None, page_size=25, descending=False):
+    conditions, params = [], []
+    if teams:
+        conditions.append(f"team IN ({', '.join('?' * len(teams))})")
+        params.extend(teams)
+    if search:
+        conditions.append("name LIKE '%' || ? || '%'")
+        params.append(search)
+    query, params = _keyset_page(_MATCHES_QUERY, conditions, params, ('date', 'id'), after, descending, page_size)
+    return _records(Match, query, params)
+
+
+# Function to load a single match (None if it doesn't exist)
+@cached('matches')
+def load_match(match_id):
+    return next(iter(_records(Match, _MATCHES_QUERY + " WHERE id = ?", (match_id,))), None)
+
+
+# Function to load one page of the matches played before `today`, most recent first,
+# optionally only those of the given teams, whose name contains `search` and played
+# between `date_from` and `date_to`
+@cached('matches')
+def load_past_matches_page(today, teams=(), search='', date_from=None, date_to=None, after=None, page_size=25):
+    conditions, params = ["date < ?"], [today]
+    if teams:
+        conditions.append(f"team IN ({', '.join('?' * len(teams))})")
+        params.extend(teams)
+    if search:
+        conditions.append("name LIKE '%' || ? || '%'")
+        params.append(search)
+    if date_from:
+        conditions.append("date >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("date <= ?")
+        params.append(date_to)
+    # Finished seasons may have been moved to the archive, so read both
+    query, params = _keyset_page("SELECT id, name, date, google_maps_link, team FROM history_matches",
+                                 conditions, params, ('date', 'id'), after, True, page_size)
+    return _records(Match, query, params)
+
+
+# Query of the athletes with their teams as a comma-separated string built from athlete_teams
+_ATHLETES_QUERY = '''
+    SELECT a.id, a.name, a.contact,
+           (SELECT GROUP_CONCAT(t.name, ',') FROM athlete_teams atm
+            JOIN teams t ON t.id = atm.team_id
+            WHERE atm.athlete_id = a.id) AS teams
+    FROM athletes a
+'''
+
+
+# Function to get the condition keeping the athletes (as `a`) found by a search (see
+# search.py) from the full-text index, or None when the search has no words
+def _athlete_search(search, params):
+    query = fts_query(search)
+    if not query:
+        return None
+    params.append(query)
+    return 'a.id IN (SELECT rowid FROM athletes_fts WHERE athletes_fts MATCH ?)'
+
+
+# Function to load one page of athletes, optionally only those of the given teams
+# and found by `search` in their name or contact, sorted by name
+@cached('athletes', 'athlete_teams', 'teams')
+def load_athletes_page(teams=(), search='', after=None, page_size=25, descending=False):
+    conditions, params = [], []
+    if teams:
+        conditions.append(f'''
+            a.id IN (
+                SELECT atm.athlete_id FROM athlete_teams atm
+                JOIN teams t ON t.id = atm.team_id
+                WHERE t.name IN ({', '.join('?' * len(teams))})
+            )
+        ''')
+        params.extend(teams)
+    condition = _athlete_search(search, params)
+    if condition:
+        conditions.append(condition)
+    query, params = _keyset_page(_ATHLETES_QUERY, conditions, params, ('a.name', 'a.id'), after, descending, page_size)
+    return _records(Athlete, query, params)
+
+
+# Function to load a single athlete (None if it doesn't exist)
+@cached('athletes', 'athlete_teams', 'teams')
+def load_athlete(athlete_id):
+    return next(iter(_records(Athlete, _ATHLETES_QUERY + " WHERE a.id = ?", (athlete_id,))), None)
+
+
+# Function to load the next match of a team from `today` on (None if there is none)
+@cached('matches')
+def load_next_match(today, team):
+    return next(iter(_records(
+        Match, _MATCHES_QUERY + " WHERE team = ? AND date >= ? ORDER BY date, id LIMIT 1", (team, today)
+    )), None)
+
+
+# Function to load the cars of a match together with their assigned athletes in a single query.
+# Returns the cars and a dict mapping each car id to the list of its athletes (see rows.py).
+@cached('cars', 'assignments', 'athletes')
+def load_match_roster(match_id):
+    with get_connection() as conn:
+        return group_roster(conn.execute(
+            '''
+            SELECT c.id, c.match_id, c.driver, c.contact, c.seats,
+                   a.id AS athlete_id, a.name AS athlete_name, a.contact AS athlete_contact
+            FROM cars c
+            LEFT JOIN assignments ass ON ass.car_id = c.id
+            LEFT JOIN athletes a ON a.id = ass.athlete_id
+            WHERE c.match_id = ?
+            ORDER BY c.id, ass.id
+            ''', (match_id,)
+        ))
+
+
+# Function to load the cars and athletes of a past match, which may have been archived
+@cached('cars', 'assignments', 'athletes')
+def load_past_match_roster(match_id):
+    with get_connection() as conn:
+        return group_roster(conn.execute(
+            '''
+            SELECT c.id, c.match_id, c.driver, c.contact, c.seats,
+                   ass.athlete_id, ass.athlete_name, ass.athlete_contact
+            FROM history_cars c
+            LEFT JOIN history_assignments ass ON ass.car_id = c.id
+            WHERE c.match_id = ?
+            ORDER BY c.id, ass.id
+            ''', (match_id,)
+        ))
+
+
+# Function to load the athletes of a team not yet assigned to a car for a match,
+# optionally only those found by `search`
+@cached('athletes', 'athlete_teams', 'teams', 'assignments')
+def load_available_athletes(match_id, team, search=''):
+    params = [team, match_id]
+    condition = _athlete_search(search, params)
+    return _records(
+        Passenger,
+        f'''
+        SELECT a.id, a.name, a.contact FROM athletes a
+        JOIN athlete_teams atm ON atm.athlete_id = a.id
+        JOIN teams t ON t.id = atm.team_id
+        WHERE t.name = ? AND a.id NOT IN (
+            SELECT athlete_id FROM assignments WHERE match_id = ?
+        ) {f'AND {condition}' if condition else ''}
+        ORDER BY a.name
+        ''', params
+    )
+
+
+# Function to load the next match of every team from `today` on in a single query, with the
+# seat totals of its cars and the number of team athletes still without a car, all aggregated
+# in SQL. Teams without an upcoming match are included with empty match columns.
+@cached('matches', 'cars', 'assignments', 'athletes', 'athlete_teams', 'teams')
+def load_next_matches_overview(today):
+    return _records(
+        MatchSummary,
+        '''
+        WITH next_matches AS (
+            SELECT id, name, date, team, google_maps_link FROM (
+                SELECT m.*, ROW_NUMBER() OVER (PARTITION BY team ORDER BY date, id) AS position
+                FROM matches m
+                WHERE date >= ?
+            )
+            WHERE position = 1
+        )
+        SELECT t.name AS team, nm.id, nm.name, nm.date, nm.google_maps_link,
+               (SELECT COUNT(*) FROM cars c WHERE c.match_id = nm.id) AS cars,
+               (SELECT COALESCE(SUM(c.seats), 0) FROM cars c WHERE c.match_id = nm.id) AS free_seats,
+               (SELECT COUNT(*) FROM assignments ass WHERE ass.match_id = nm.id) AS filled_seats,
+               (SELECT COUNT(*) FROM athlete_teams atm
+                WHERE atm.team_id = t.id AND NOT EXISTS (
+                    SELECT 1 FROM assignments ass WHERE ass.match_id = nm.id AND ass.athlete_id = atm.athlete_id
+                )) AS unassigned
+        FROM teams t
+        LEFT JOIN next_matches nm ON nm.team = t.name
+        ORDER BY t.id
+        ''', (today,)
+    )
@@ -0,0 +1,87 @@
+# Append-only log of the carpool changes.
+#
+# The SQLite backend calls record_car_events() and record_assignment_events() inside
+# the transaction that changes the cars or the seats, writing one row per change to
+# the carpool_events table, so an event exists if and only if the change was
+# committed. Events are never updated or deleted (triggers refuse it, see
+# migrations.py), and their seq grows with every event: SQLite commits one write
+# transaction at a time, so events become visible in seq order and a consumer can
+# keep the seq of the last event it handled as its cursor and read only what came
+# after it with events_after(), instead of diffing whole tables.
+#
+# Events: car_added, car_updated and car_deleted, with the driver, contact and free
+# seats of the car, and athlete_assigned and athlete_removed, with the athlete's name.
+# Moving an athlete to another car is a removal followed by an assignment. Archiving
+# old matches (archive.py) moves rows without changing the carpool and logs nothing.
+#
+# Print the events after a cursor as JSON lines with:
+#   python events.py --after <seq> [--tenant <club>]
+
+import argparse
+import json
+
+from db import get_connection
+from rows import CarpoolEvent
+
+# Most events read in one call
+MAX_EVENTS = 1000
+
+
+# Function to record an event for each car selected by `where` (on `cars c`), inside the
+# transaction that changes them; deletions must be recorded before the rows are deleted
+def record_car_events(conn, event, where, params=()):
+    conn.execute(f'''
+        INSERT INTO carpool_events (event, match_id, car_id, data)
+        SELECT ?, c.match_id, c.id, json_object('driver', c.driver, 'contact', c.contact, 'seats', c.seats)
+        FROM cars c
+        WHERE {where}
+    ''', (event, *params))
+
+
+# Function to record an event for each assignment selected by `where` (on `assignments s`),
+# like record_car_events()
+def record_assignment_events(conn, event, where, params=()):
+    conn.execute(f'''
+        INSERT INTO carpool_events (event, match_id, car_id, athlete_id, data)
+        SELECT ?, s.match_id, s.car_id, s.athlete_id, json_object('athlete', a.name)
+        FROM assignments s
+        JOIN athletes a ON a.id = s.athlete_id
+        WHERE {where}
+    ''', (event, *params))
+
+
+# Function to read the events after the cursor `after` (a seq, 0 for all), oldest first,
+# optionally only those of one match
+def events_after(after=0, match_id=None, limit=MAX_EVENTS):
+    query = 'SELECT seq, event, match_id, car_id, athlete_id, data, created_at FROM carpool_events WHERE seq > ?'
+    params = [after]
+    if match_id is not None:
+        query += ' AND match_id = ?'
+        params.append(match_id)
+    query += ' ORDER BY seq LIMIT ?'
+    rows = get_connection().execute(query, (*params, min(limit, MAX_EVENTS))).fetchall()
+    return [CarpoolEvent(*row[:5], json.loads(row[5]), row[6]) for row in rows]
+
+
+# Function to read the latest events, newest first
+def latest_events(limit=50):
+    rows = get_connection().execute('''
+        SELECT seq, event, match_id, car_id, athlete_id, data, created_at FROM carpool_events
+        ORDER BY seq DESC LIMIT ?
+    ''', (min(limit, MAX_EVENTS),)).fetchall()
+    return [CarpoolEvent(*row[:5], json.loads(row[5]), row[6]) for row in rows]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the carpool events after a cursor as JSON lines')
+    parser.add_argument('--after', type=int, default=0, help='seq of the last event already handled')
+    parser.add_argument('--match', type=int, help='only the events of this match')
+    parser.add_argument('--tenant', help='club to read (default: the default database)')
+    parser.add_argument('--limit', type=int, default=MAX_EVENTS)
+    args = parser.parse_args()
+
+    if args.tenant:
+        from tenants import use_tenant
+        use_tenant(args.tenant)
+    for event in events_after(args.after, args.match, args.limit):
+        print(json.dumps(event._asdict(), ensure_ascii=False))
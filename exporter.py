@@ -0,0 +1,147 @@
+# Export of the carpool history (matches, cars and assigned athletes) to CSV or Parquet.
+#
+# One row per assigned athlete, plus one per car without athletes and one per match
+# without cars, so every match and car shows up in the report. Rows are read from
+# the cursor and written in chunks of CHUNK_ROWS, so memory stays flat however
+# large the history is (the Jogos Antigos page then holds the finished file in memory
+# for its download button; the command line below writes straight to disk).
+# Parquet needs pyarrow (pip install pyarrow).
+#
+# Usage: python exporter.py --tenant aac --from 2024-09-01 --to 2025-07-31 --team Sub-13 --format parquet --output season.parquet
+
+import argparse
+import csv
+import io
+import tempfile
+
+from db import get_connection
+
+FORMATS = ('csv', 'parquet')
+CHUNK_ROWS = 5000
+
+COLUMNS = [
+    'match_id', 'date', 'team', 'match', 'google_maps_link',
+    'car_id', 'driver', 'driver_contact', 'free_seats',
+    'athlete_id', 'athlete', 'athlete_contact',
+]
+
+# Reads the live tables and the archived seasons together (see archive.py)
+_EXPORT_QUERY = '''
+    SELECT m.id, m.date, m.team, m.name, m.google_maps_link,
+           c.id, c.driver, c.contact, c.seats,
+           s.athlete_id, s.athlete_name, s.athlete_contact
+    FROM history_matches m
+    LEFT JOIN history_cars c ON c.match_id = m.id
+    LEFT JOIN history_assignments s ON s.car_id = c.id
+'''
+
+
+# Raised when an export cannot be produced (e.g. Parquet without pyarrow)
+class ExportError(Exception):
+    pass
+
+
+# Function to run the export query and return its cursor, filtered by date range and teams
+def _export_cursor(date_from=None, date_to=None, teams=()):
+    conditions, params = [], []
+    if date_from:
+        conditions.append('m.date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('m.date <= ?')
+        params.append(date_to)
+    if teams:
+        conditions.append(f"m.team IN ({', '.join('?' * len(teams))})")
+        params.extend(teams)
+    query = _EXPORT_QUERY
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY m.date, m.id, c.id, s.athlete_name'
+    return get_connection().execute(query, params)
+
+
+# Function to read the cursor in chunks
+def _chunks(cursor):
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            return
+        yield rows
+
+
+# Function to write the rows as UTF-8 CSV (with BOM, so Excel reads the accents)
+def _write_csv(cursor, output):
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(COLUMNS)
+    for rows in _chunks(cursor):
+        writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+
+# Function to write the rows as Parquet, one row group per chunk
+def _write_parquet(cursor, output):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("A exportação para Parquet precisa do pacote pyarrow (pip install pyarrow).")
+    schema = pa.schema([
+        ('match_id', pa.int64()), ('date', pa.string()), ('team', pa.string()), ('match', pa.string()),
+        ('google_maps_link', pa.string()), ('car_id', pa.int64()), ('driver', pa.string()),
+        ('driver_contact', pa.string()), ('free_seats', pa.int64()), ('athlete_id', pa.int64()),
+        ('athlete', pa.string()), ('athlete_contact', pa.string()),
+    ])
+
+    # SQLite columns are loosely typed (a contact may be stored as a number)
+    def column(values, field):
+        if field.type == pa.string():
+            values = [None if value is None else str(value) for value in values]
+        return pa.array(values, type=field.type)
+
+    with pq.ParquetWriter(output, schema) as writer:
+        for rows in _chunks(cursor):
+            columns = [column(values, field) for values, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+
+
+# Function to export the carpool history to a binary file object
+def export(output, file_format='csv', date_from=None, date_to=None, teams=()):
+    if file_format not in FORMATS:
+        raise ExportError(f"Formato desconhecido: '{file_format}'.")
+    cursor = _export_cursor(date_from, date_to, tuple(teams))
+    try:
+        if file_format == 'csv':
+            _write_csv(cursor, output)
+        else:
+            _write_parquet(cursor, output)
+    finally:
+        cursor.close()
+
+
+# Function to export to a temporary file, rewound for reading (used by the download button)
+def export_to_tempfile(file_format='csv', date_from=None, date_to=None, teams=()):
+    output = tempfile.TemporaryFile()
+    export(output, file_format, date_from, date_to, teams)
+    output.seek(0)
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the carpool history to CSV or Parquet')
+    parser.add_argument('--from', dest='date_from', help='first match date (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', help='last match date (YYYY-MM-DD)')
+    parser.add_argument('--team', dest='teams', action='append', default=[], help='team name (repeatable)')
+    parser.add_argument('--format', dest='file_format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--tenant', help='club to export (see tenants.py); defaults to athletes.db')
+    args = parser.parse_args()
+
+    if args.tenant:
+        from tenants import use_tenant
+        use_tenant(args.tenant)
+
+    with open(args.output, 'wb') as f:
+        export(f, args.file_format, args.date_from, args.date_to, args.teams)
+    print(f"Export written to {args.output}")
@@ -0,0 +1,239 @@
+# Bulk import of teams, athletes and matches from CSV or Excel files.
+#
+# Files are read row by row (csv module, or openpyxl in read-only mode for .xlsx) and
+# every row is validated before the write lock is taken, so a large or slow upload
+# doesn't hold up the other writers. In a single transaction the valid rows are then
+# checked against the existing data and the rest of the file, and inserted with
+# executemany.
+# Rows with errors are skipped and reported with their line number; with
+# dry_run=True nothing is written and the report says what would be imported.
+#
+# Expected columns (header on the first row, extra columns are ignored):
+#   teams:    name
+#   athletes: name, contact, teams (team names separated by commas or semicolons)
+#   matches:  name, date (YYYY-MM-DD or DD/MM/YYYY), team, google_maps_link
+
+import csv
+import io
+import itertools
+import os
+import re
+from datetime import datetime
+
+from db import get_connection, write_transaction
+
+KINDS = ('teams', 'athletes', 'matches')
+
+REQUIRED_COLUMNS = {
+    'teams': ('name',),
+    'athletes': ('name',),
+    'matches': ('name', 'date', 'team'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+
+# Raised when a file cannot be read at all (unknown format, missing columns, ...)
+class ImportFileError(Exception):
+    pass
+
+
+# Function to normalize a value for duplicate detection
+def _key(value):
+    return ' '.join(str(value or '').split()).casefold()
+
+
+# Function to turn a cell into a stripped string
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+# Function to read the rows of a CSV file, guessing the delimiter from the header
+def _csv_rows(file):
+    text = file if isinstance(file, io.TextIOBase) else io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    header = text.readline()
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    yield from csv.reader(itertools.chain([header], text), delimiter=delimiter)
+
+
+# Function to read the rows of the first sheet of an Excel file
+def _excel_rows(file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("A importação de ficheiros Excel precisa do pacote openpyxl (pip install openpyxl).")
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [_text(value) for value in row]
+    finally:
+        workbook.close()
+
+
+# Function to read a file as a stream of (line number, {column: value}) pairs
+def read_rows(file, filename, required_columns=()):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(file)
+    elif extension in ('.xlsx', '.xlsm'):
+        rows = _excel_rows(file)
+    else:
+        raise ImportFileError(f"Formato de ficheiro não suportado: '{extension}'. Use CSV ou Excel (.xlsx).")
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("O ficheiro está vazio.")
+    columns = [_key(column).replace(' ', '_') for column in header]
+    missing = [column for column in required_columns if column not in columns]
+    if missing:
+        raise ImportFileError(f"Faltam colunas no ficheiro: {', '.join(missing)}.")
+    for line, row in enumerate(rows, start=2):
+        values = [_text(value) for value in row]
+        if any(values):
+            # Short rows leave the remaining columns empty
+            yield line, dict(zip(columns, values + [''] * (len(columns) - len(values))))
+
+
+# Function to parse a date in one of the accepted formats as YYYY-MM-DD
+def _parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    raise ValueError(f"data inválida '{value}'")
+
+
+# Functions to validate one row of each kind. Each returns the values to insert
+# and the duplicate key of the row, or raises ValueError with the reason.
+def _validate_team(row, team_ids):
+    name = row['name']
+    if not name:
+        raise ValueError("o nome está vazio")
+    return (name,), _key(name)
+
+
+def _validate_athlete(row, team_ids):
+    name = row['name']
+    if not name:
+        raise ValueError("o nome está vazio")
+    contact = row.get('contact', '')
+    teams = [team.strip() for team in re.split(r'[,;]', row.get('teams', '')) if team.strip()]
+    unknown = [team for team in teams if _key(team) not in team_ids]
+    if unknown:
+        raise ValueError(f"escalão desconhecido: {', '.join(unknown)}")
+    return (name, contact, [team_ids[_key(team)][0] for team in teams]), (_key(name), _key(contact))
+
+
+def _validate_match(row, team_ids):
+    name = row['name']
+    if not name:
+        raise ValueError("o local está vazio")
+    date = _parse_date(row['date'])
+    team = row['team']
+    if not team:
+        raise ValueError("o escalão está vazio")
+    if _key(team) not in team_ids:
+        raise ValueError(f"escalão desconhecido: {team}")
+    team = team_ids[_key(team)][1]
+    return (name, date, team, row.get('google_maps_link', '')), (_key(name), date, _key(team))
+
+
+# Functions to get the duplicate keys already in the database
+def _existing_team_keys(conn):
+    return {_key(name) for name, in conn.execute('SELECT name FROM teams')}
+
+
+def _existing_athlete_keys(conn):
+    return {(_key(name), _key(contact)) for name, contact in conn.execute('SELECT name, contact FROM athletes')}
+
+
+def _existing_match_keys(conn):
+    return {(_key(name), date, _key(team)) for name, date, team in conn.execute('SELECT name, date, team FROM matches')}
+
+
+# Functions to insert the validated rows of each kind
+def _insert_teams(conn, records):
+    conn.executemany('INSERT INTO teams (name) VALUES (?)', records)
+
+
+def _insert_athletes(conn, records):
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM athletes').fetchone()[0]
+    conn.executemany('INSERT INTO athletes (name, contact) VALUES (?, ?)', [(name, contact) for name, contact, _ in records])
+    # The new athletes got the ids after the previous maximum, in insertion order
+    new_ids = [athlete_id for athlete_id, in conn.execute('SELECT id FROM athletes WHERE id > ? ORDER BY id', (last_id,))]
+    conn.executemany(
+        'INSERT OR IGNORE INTO athlete_teams (athlete_id, team_id) VALUES (?, ?)',
+        [(athlete_id, team_id) for athlete_id, (_, _, team_ids) in zip(new_ids, records) for team_id in team_ids]
+    )
+
+
+def _insert_matches(conn, records):
+    conn.executemany('INSERT INTO matches (name, date, team, google_maps_link) VALUES (?, ?, ?, ?)', records)
+
+
+_IMPORTERS = {
+    'teams': (_validate_team, _existing_team_keys, _insert_teams, ('teams',)),
+    'athletes': (_validate_athlete, _existing_athlete_keys, _insert_athletes, ('athletes', 'athlete_teams')),
+    'matches': (_validate_match, _existing_match_keys, _insert_matches, ('matches',)),
+}
+
+
+# Function to get the teams of the database by their duplicate key, as (id, name)
+def _team_ids(conn):
+    return {_key(name): (team_id, name) for team_id, name in conn.execute('SELECT id, name FROM teams')}
+
+
+# Function to validate every row on its own, returning the (record, duplicate key) pairs
+# of the valid rows and the report
+def _validate_rows(kind, rows, team_ids):
+    validate = _IMPORTERS[kind][0]
+    report = {'rows': 0, 'imported': 0, 'duplicates': 0, 'errors': []}
+    valid = []
+    for line, row in rows:
+        report['rows'] += 1
+        try:
+            valid.append(validate(row, team_ids))
+        except ValueError as e:
+            report['errors'].append({'line': line, 'error': str(e)})
+    return valid, report
+
+
+# Function to keep the valid rows that are neither in the database nor earlier in the file
+def _new_records(conn, kind, valid, report):
+    seen = _IMPORTERS[kind][1](conn)
+    records = []
+    for record, key in valid:
+        if key in seen:
+            report['duplicates'] += 1
+            continue
+        seen.add(key)
+        records.append(record)
+    report['imported'] = len(records)
+    return records
+
+
+# Function to import a file of the given kind. Returns the report:
+# {'rows', 'imported', 'duplicates', 'errors': [{'line', 'error'}]}
+def import_file(kind, file, filename, dry_run=False):
+    rows = read_rows(file, filename, REQUIRED_COLUMNS[kind])
+    team_ids = _team_ids(get_connection())
+    valid, report = _validate_rows(kind, rows, team_ids)
+    if dry_run:
+        _new_records(get_connection(), kind, valid, report)
+        return report
+    _, _, insert, tables = _IMPORTERS[kind]
+    with write_transaction(*tables) as conn:
+        # The rows were validated against the teams read before the write lock
+        if _team_ids(conn) != team_ids:
+            raise ImportFileError("Os escalões mudaram durante a importação, tente novamente.")
+        records = _new_records(conn, kind, valid, report)
+        if records:
+            insert(conn, records)
+    return report
@@ -0,0 +1,196 @@
+# SQL query instrumentation.
+#
+# Pooled connections are created with InstrumentedConnection, whose cursors time
+# every statement (execution plus fetching its rows). Each statement is recorded
+# under its normalized SQL with the page that ran it; statements slower than
+# SLOW_QUERY_MS are also written to a rotating slow-query log.
+
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+# Statements taking longer than this many milliseconds go to the slow-query log
+SLOW_QUERY_MS = float(os.environ.get('AAC_SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('AAC_SLOW_QUERY_LOG', 'slow_queries.log')
+
+# Number of recent durations kept per statement to compute the percentiles
+DURATION_SAMPLES = 1000
+
+_stats = {}
+_stats_lock = threading.Lock()
+_slow_log = None
+
+
+# Function to normalize a statement so different parameters or whitespace share one entry
+def normalize_sql(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    return re.sub(r'\(\s*\?(\s*,\s*\?)+\s*\)', '(...)', sql)
+
+
+# Function to find the page whose script ran the statement
+def _calling_page():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if os.path.basename(os.path.dirname(filename)) == 'pages' or os.path.basename(filename) == 'Home.py':
+            return os.path.basename(filename)
+        frame = frame.f_back
+    return '-'
+
+
+# Function to get the slow-query logger, creating its rotating file handler the first time
+def _slow_query_logger():
+    global _slow_log
+    if _slow_log is None:
+        logger = logging.getLogger('aac.slow_queries')
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+        handler = logging.handlers.RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=1_000_000, backupCount=5, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        _slow_log = logger
+    return _slow_log
+
+
+# Function to record one finished statement
+def record(sql, duration, rows, page):
+    normalized = normalize_sql(sql)
+    with _stats_lock:
+        entry = _stats.get(normalized)
+        if entry is None:
+            entry = _stats[normalized] = {
+                'count': 0, 'total': 0.0, 'rows': 0, 'pages': set(), 'durations': deque(maxlen=DURATION_SAMPLES)
+            }
+        entry['count'] += 1
+        entry['total'] += duration
+        entry['rows'] += max(rows, 0)
+        entry['pages'].add(page)
+        entry['durations'].append(duration)
+    if duration * 1000 >= SLOW_QUERY_MS:
+        _slow_query_logger().warning('%.1f ms rows=%d page=%s sql=%s', duration * 1000, rows, page, normalized)
+
+
+# Function to get the per-statement aggregates of the running process, slowest in total first
+def query_stats():
+    with _stats_lock:
+        entries = [(sql, dict(entry, durations=sorted(entry['durations']))) for sql, entry in _stats.items()]
+    stats = []
+    for sql, entry in entries:
+        durations = entry['durations']
+        stats.append({
+            'sql': sql,
+            'count': entry['count'],
+            'total_ms': entry['total'] * 1000,
+            'p50_ms': durations[len(durations) // 2] * 1000,
+            'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000,
+            'rows': entry['rows'],
+            'pages': ', '.join(sorted(entry['pages'])),
+        })
+    return sorted(stats, key=lambda stat: stat['total_ms'], reverse=True)
+
+
+# Function to forget every recorded statement
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# Cursor timing its statements. A SELECT is only recorded once its rows have been
+# fetched (or the cursor is reused or closed), so the time includes fetching them.
+class InstrumentedCursor(sqlite3.Cursor):
+    _pending = None
+
+    def _start(self, sql):
+        self._finish()
+        self._pending = [sql, 0.0, 0, _calling_page()]
+
+    def _finish(self):
+        if self._pending is not None:
+            sql, duration, rows, page = self._pending
+            self._pending = None
+            record(sql, duration, rows, page)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._pending is not None:
+                self._pending[1] += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        result = self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            # Not a query: nothing to fetch, the statement is done
+            self._pending[2] = self.rowcount
+            self._finish()
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        result = self._timed(super().executemany, sql, seq_of_parameters)
+        self._pending[2] = self.rowcount
+        self._finish()
+        return result
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if self._pending is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._pending[2] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if self._pending is not None:
+            self._pending[2] += len(rows)
+            if len(rows) < (self.arraysize if size is None else size):
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[2] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[2] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+# Connection whose cursors (including the ones behind conn.execute) are instrumented
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
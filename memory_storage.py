@@ -0,0 +1,325 @@
+# In-memory storage backend (see storage.py) for tests and benchmarks: every table is
+# a dict in this process, so nothing survives a restart and replicas don't share data.
+# Writes hold a lock and check everything before changing anything, so they are
+# all-or-nothing like the transactions of the other backends.
+
+import sqlite3
+import threading
+from datetime import date
+
+from rows import Team, Match, Athlete, Car, Passenger, MatchSummary
+from search import search_terms, matches_search
+from storage import Storage, StorageError
+
+
+# Function to check whether a name contains the searched text (like SQL LIKE '%text%')
+def _contains(name, search):
+    return search.casefold() in (name or '').casefold()
+
+
+# Function to keep one page of rows sorted by `sort_key`, starting after the row `after`
+def _keyset_page(rows, sort_key, after, descending, page_size):
+    rows = sorted(rows, key=sort_key, reverse=descending)
+    if after is not None:
+        after = tuple(after)
+        rows = [row for row in rows if (sort_key(row) < after if descending else sort_key(row) > after)]
+    # One extra row tells the page whether there is a next page
+    return rows[:int(page_size) + 1]
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables = {'teams': {}, 'athletes': {}, 'athlete_teams': set(), 'matches': {}, 'cars': {}, 'assignments': {}}
+        self._last_ids = {}
+
+    # Function to fill the storage with the tables of a SQLite database (e.g. one made
+    # by benchmarks/generate_data.py)
+    def load_sqlite(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            with self._lock:
+                tables = self._tables
+                tables['teams'] = {team_id: name for team_id, name in conn.execute('SELECT id, name FROM teams')}
+                tables['athletes'] = {
+                    athlete_id: {'name': name, 'contact': contact}
+                    for athlete_id, name, contact in conn.execute('SELECT id, name, contact FROM athletes')
+                }
+                tables['athlete_teams'] = set(conn.execute('SELECT athlete_id, team_id FROM athlete_teams'))
+                for table, columns in (('matches', Match._fields), ('cars', Car._fields),
+                                       ('assignments', ('id', 'match_id', 'car_id', 'athlete_id'))):
+                    tables[table] = {
+                        row[0]: dict(zip(columns[1:], row[1:]))
+                        for row in conn.execute(f"SELECT {', '.join(columns)} FROM {table}")
+                    }
+                self._last_ids = {table: max(tables[table], default=0)
+                                  for table in ('teams', 'athletes', 'matches', 'cars', 'assignments')}
+        finally:
+            conn.close()
+
+    # Function to insert a row, giving it the next id of its table
+    def _insert(self, table, row):
+        row_id = self._last_ids.get(table, 0) + 1
+        self._last_ids[table] = row_id
+        self._tables[table][row_id] = row
+        return row_id
+
+    @staticmethod
+    def _today():
+        return date.today().isoformat()
+
+    def teams(self):
+        with self._lock:
+            return [Team(team_id, name) for team_id, name in sorted(self._tables['teams'].items())]
+
+    # Function to filter matches by team, name and date
+    def _matches(self, teams, search, date_from=None, date_to=None):
+        return [
+            Match(match_id, **match) for match_id, match in self._tables['matches'].items()
+            if (not teams or match['team'] in teams) and (not search or _contains(match['name'], search))
+            and (not date_from or (match['date'] or '') >= date_from) and (not date_to or (match['date'] or '') <= date_to)
+        ]
+
+    def matches_page(self, teams=(), search='', after=None, page_size=25, descending=False):
+        with self._lock:
+            return _keyset_page(self._matches(teams, search), lambda match: (match.date or '', match.id),
+                                after, descending, page_size)
+
+    def match(self, match_id):
+        with self._lock:
+            match = self._tables['matches'].get(match_id)
+            return Match(match_id, **match) if match else None
+
+    def next_match(self, team):
+        with self._lock:
+            today = self._today()
+            upcoming = [match for match in self._matches((team,), '') if (match.date or '') >= today]
+            return min(upcoming, key=lambda match: (match.date, match.id), default=None)
+
+    def past_matches_page(self, teams=(), search='', date_from=None, date_to=None, after=None, page_size=25):
+        with self._lock:
+            today = self._today()
+            past = [match for match in self._matches(teams, search, date_from, date_to) if (match.date or '') < today]
+            return _keyset_page(past, lambda match: (match.date or '', match.id), after, True, page_size)
+
+    # Function to give an athlete the comma-separated names of their teams
+    def _athlete(self, athlete_id, athlete):
+        names = [self._tables['teams'][team_id] for member_id, team_id in sorted(self._tables['athlete_teams'])
+                 if member_id == athlete_id]
+        return Athlete(athlete_id, athlete['name'], athlete['contact'], ','.join(names) if names else None)
+
+    def athletes_page(self, teams=(), search='', after=None, page_size=25, descending=False):
+        with self._lock:
+            if teams:
+                team_ids = {team_id for team_id, name in self._tables['teams'].items() if name in teams}
+                members = {athlete_id for athlete_id, team_id in self._tables['athlete_teams'] if team_id in team_ids}
+            terms = search_terms(search)
+            athletes = [
+                (athlete_id, athlete) for athlete_id, athlete in self._tables['athletes'].items()
+                if (not teams or athlete_id in members) and matches_search(terms, athlete['name'], athlete['contact'])
+            ]
+            rows = _keyset_page(athletes, lambda item: (item[1]['name'] or '', item[0]), after, descending, page_size)
+            return [self._athlete(*item) for item in rows]
+
+    def athlete(self, athlete_id):
+        with self._lock:
+            athlete = self._tables['athletes'].get(athlete_id)
+            return self._athlete(athlete_id, athlete) if athlete else None
+
+    def match_roster(self, match_id):
+        with self._lock:
+            cars = [Car(car_id, **car) for car_id, car in sorted(self._tables['cars'].items()) if car['match_id'] == match_id]
+            athletes_by_car = {}
+            for assignment_id, assignment in sorted(self._tables['assignments'].items()):
+                athlete = self._tables['athletes'].get(assignment['athlete_id'])
+                if assignment['match_id'] == match_id and athlete is not None:
+                    athletes_by_car.setdefault(assignment['car_id'], []).append(
+                        Passenger(assignment['athlete_id'], athlete['name'], athlete['contact'])
+                    )
+            return cars, athletes_by_car
+
+    # There is no archive in memory, so past matches are all in the live tables
+    def past_match_roster(self, match_id):
+        return self.match_roster(match_id)
+
+    def available_athletes(self, match_id, team, search=''):
+        with self._lock:
+            terms = search_terms(search)
+            team_ids = {team_id for team_id, name in self._tables['teams'].items() if name == team}
+            seated = {assignment['athlete_id'] for assignment in self._tables['assignments'].values()
+                      if assignment['match_id'] == match_id}
+            available = (
+                Passenger(athlete_id, self._tables['athletes'][athlete_id]['name'],
+                          self._tables['athletes'][athlete_id]['contact'])
+                for athlete_id, team_id in self._tables['athlete_teams']
+                if team_id in team_ids and athlete_id not in seated
+            )
+            return sorted(
+                (athlete for athlete in available if matches_search(terms, athlete.name, athlete.contact)),
+                key=lambda athlete: athlete.name or ''
+            )
+
+    def next_matches_overview(self):
+        with self._lock:
+            today = self._today()
+            summaries = []
+            for team_id, team in sorted(self._tables['teams'].items()):
+                upcoming = [match for match in self._matches((team,), '') if (match.date or '') >= today]
+                match = min(upcoming, key=lambda match: (match.date, match.id), default=None)
+                seated = set()
+                cars = []
+                if match:
+                    cars = [car for car in self._tables['cars'].values() if car['match_id'] == match.id]
+                    seated = {assignment['athlete_id'] for assignment in self._tables['assignments'].values()
+                              if assignment['match_id'] == match.id}
+                unassigned = sum(1 for athlete_id, member_team in self._tables['athlete_teams']
+                                 if member_team == team_id and athlete_id not in seated)
+                summaries.append(MatchSummary(
+                    team, match and match.id, match and match.name, match and match.date,
+                    match and match.google_maps_link, len(cars), sum(car['seats'] or 0 for car in cars),
+                    len(seated), unassigned,
+                ))
+            return summaries
+
+    def add_team(self, name):
+        with self._lock:
+            tables = self._tables
+            if name in tables['teams'].values():
+                raise StorageError(f"o escalão '{name}' já existe")
+            self._insert('teams', name)
+
+    def rename_team(self, team_id, name):
+        with self._lock:
+            tables = self._tables
+            old_name = tables['teams'].get(team_id)
+            if old_name is None:
+                return
+            if name != old_name and name in tables['teams'].values():
+                raise StorageError(f"o escalão '{name}' já existe")
+            # Matches store the team name, so rename it there too
+            for match in tables['matches'].values():
+                if match['team'] == old_name:
+                    match['team'] = name
+            tables['teams'][team_id] = name
+
+    def delete_team(self, team_id):
+        with self._lock:
+            tables = self._tables
+            tables['teams'].pop(team_id, None)
+            tables['athlete_teams'] = {(athlete_id, member_team) for athlete_id, member_team in tables['athlete_teams']
+                                       if member_team != team_id}
+
+    # Function to link an athlete to the teams with the given names
+    def _set_athlete_teams(self, athlete_id, teams):
+        tables = self._tables
+        tables['athlete_teams'] = {membership for membership in tables['athlete_teams'] if membership[0] != athlete_id}
+        tables['athlete_teams'].update((athlete_id, team_id) for team_id, name in tables['teams'].items() if name in teams)
+
+    def add_athlete(self, name, contact, teams):
+        with self._lock:
+            self._set_athlete_teams(self._insert('athletes', {'name': name, 'contact': contact}), teams)
+
+    def update_athlete(self, athlete_id, name, contact, teams):
+        with self._lock:
+            tables = self._tables
+            if athlete_id in tables['athletes']:
+                tables['athletes'][athlete_id] = {'name': name, 'contact': contact}
+                self._set_athlete_teams(athlete_id, teams)
+
+    # Function to delete the assignments matching a condition, giving their seats back
+    def _unassign(self, condition):
+        assignments = self._tables['assignments']
+        for assignment_id in [assignment_id for assignment_id, assignment in assignments.items() if condition(assignment)]:
+            car = self._tables['cars'].get(assignments.pop(assignment_id)['car_id'])
+            if car is not None:
+                car['seats'] += 1
+
+    def delete_athlete(self, athlete_id):
+        with self._lock:
+            tables = self._tables
+            self._unassign(lambda assignment: assignment['athlete_id'] == athlete_id)
+            tables['athletes'].pop(athlete_id, None)
+            self._set_athlete_teams(athlete_id, ())
+
+    def add_match(self, name, date, team, google_maps_link):
+        with self._lock:
+            self._insert('matches', {'name': name, 'date': date, 'google_maps_link': google_maps_link, 'team': team})
+
+    def update_match(self, match_id, name, date, team, google_maps_link):
+        with self._lock:
+            tables = self._tables
+            if match_id in tables['matches']:
+                tables['matches'][match_id] = {'name': name, 'date': date, 'google_maps_link': google_maps_link, 'team': team}
+
+    def delete_match(self, match_id):
+        with self._lock:
+            tables = self._tables
+            tables['assignments'] = {assignment_id: assignment for assignment_id, assignment in tables['assignments'].items()
+                                     if assignment['match_id'] != match_id}
+            tables['cars'] = {car_id: car for car_id, car in tables['cars'].items() if car['match_id'] != match_id}
+            tables['matches'].pop(match_id, None)
+
+    def add_car(self, match_id, driver, contact, seats):
+        with self._lock:
+            self._insert('cars', {'match_id': match_id, 'driver': driver, 'contact': contact, 'seats': seats})
+
+    def update_car(self, car_id, driver, contact, seats, expected_seats):
+        with self._lock:
+            tables = self._tables
+            car = tables['cars'].get(car_id)
+            # Change the seats only if no athlete was seated or removed since the edit started
+            if seats != expected_seats and (car is None or car['seats'] != expected_seats):
+                raise StorageError("os lugares do carro mudaram entretanto, tente novamente")
+            if car is not None:
+                car.update(driver=driver, contact=contact)
+                if seats != expected_seats:
+                    car['seats'] = seats
+
+    def delete_car(self, car_id):
+        with self._lock:
+            tables = self._tables
+            tables['assignments'] = {assignment_id: assignment for assignment_id, assignment in tables['assignments'].items()
+                                     if assignment['car_id'] != car_id}
+            tables['cars'].pop(car_id, None)
+
+    # Function to get the free seats of a car once the athletes matching a condition
+    # have given theirs back
+    def _free_seats(self, car_id, leaving):
+        car = self._tables['cars'].get(car_id)
+        if car is None or car['seats'] is None:
+            return 0
+        return car['seats'] + sum(1 for assignment in self._tables['assignments'].values()
+                                  if assignment['car_id'] == car_id and leaving(assignment))
+
+    def assign_athlete(self, match_id, car_id, athlete_id):
+        with self._lock:
+            def leaving(assignment):
+                return assignment['match_id'] == match_id and assignment['athlete_id'] == athlete_id
+
+            if self._free_seats(car_id, leaving) <= 0:
+                raise StorageError("o carro já não tem lugares disponíveis")
+            # Remove athlete from any other car in the match, giving that seat back
+            self._unassign(leaving)
+            self._tables['cars'][car_id]['seats'] -= 1
+            self._insert('assignments', {'match_id': match_id, 'car_id': car_id, 'athlete_id': athlete_id})
+
+    def remove_athlete(self, car_id, athlete_id):
+        with self._lock:
+            self._unassign(lambda assignment: assignment['car_id'] == car_id and assignment['athlete_id'] == athlete_id)
+
+    def assign_athletes(self, match_id, plan):
+        with self._lock:
+            # Skip athletes someone else assigned in the meantime
+            seated = {assignment['athlete_id'] for assignment in self._tables['assignments'].values()
+                      if assignment['match_id'] == match_id}
+            new_plan, needed = [], {}
+            for athlete_id, car_id in plan:
+                if athlete_id not in seated:
+                    seated.add(athlete_id)
+                    new_plan.append((athlete_id, car_id))
+                    needed[car_id] = needed.get(car_id, 0) + 1
+            if any(self._free_seats(car_id, lambda assignment: False) < count for car_id, count in needed.items()):
+                raise StorageError("os lugares dos carros mudaram entretanto, tente novamente")
+            for athlete_id, car_id in new_plan:
+                self._tables['cars'][car_id]['seats'] -= 1
+                self._insert('assignments', {'match_id': match_id, 'car_id': car_id, 'athlete_id': athlete_id})
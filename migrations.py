@@ -0,0 +1,327 @@
+# Schema migrations for athletes.db.
+#
+# The schema version is stored in PRAGMA user_version. Each migration runs once,
+# in its own transaction, and bumps the version to its position in MIGRATIONS.
+# To change the schema, append a new function to MIGRATIONS; never edit one
+# that has already shipped.
+
+
+# Function to check whether a table exists in the database
+def _table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+# 1: create the base tables (older databases already have them)
+def _create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            date TEXT,
+            google_maps_link TEXT,
+            team TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id INTEGER,
+            driver TEXT,
+            contact TEXT,
+            seats INTEGER,
+            FOREIGN KEY(match_id) REFERENCES matches(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS athletes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            contact TEXT,
+            teams TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assignments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id INTEGER,
+            car_id INTEGER,
+            athlete_id INTEGER,
+            FOREIGN KEY(match_id) REFERENCES matches(id),
+            FOREIGN KEY(car_id) REFERENCES cars(id),
+            FOREIGN KEY(athlete_id) REFERENCES athletes(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE
+        )
+    ''')
+
+
+# 2: move the comma-separated athletes.teams values into the athlete_teams junction table
+def _create_athlete_teams(conn):
+    if _table_exists(conn, 'athlete_teams'):
+        return
+    conn.execute('''
+        CREATE TABLE athlete_teams (
+            athlete_id INTEGER NOT NULL REFERENCES athletes(id) ON DELETE CASCADE,
+            team_id INTEGER NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+            PRIMARY KEY (athlete_id, team_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX idx_athlete_teams_team ON athlete_teams (team_id, athlete_id)')
+
+    team_ids = dict(conn.execute('SELECT name, id FROM teams'))
+    memberships = [
+        (athlete_id, team_ids[name.strip()])
+        for athlete_id, teams in conn.execute('SELECT id, teams FROM athletes WHERE teams IS NOT NULL')
+        for name in teams.split(',')
+        if name.strip() in team_ids
+    ]
+    conn.executemany('INSERT OR IGNORE INTO athlete_teams (athlete_id, team_id) VALUES (?, ?)', memberships)
+    # The old column is no longer kept up to date, so don't leave stale names behind
+    conn.execute('UPDATE athletes SET teams = NULL')
+
+
+# 3: turn ids that older versions stored as 8-byte blobs (numpy integers) back into integers
+def _fix_blob_ids(conn):
+    columns = [
+        ('cars', 'match_id'),
+        ('assignments', 'match_id'),
+        ('assignments', 'car_id'),
+        ('assignments', 'athlete_id'),
+    ]
+    for table, column in columns:
+        rows = conn.execute(
+            f"SELECT id, {column} FROM {table} WHERE typeof({column}) = 'blob' AND length({column}) = 8"
+        ).fetchall()
+        conn.executemany(
+            f'UPDATE {table} SET {column} = ? WHERE id = ?',
+            [(int.from_bytes(value, 'little', signed=True), row_id) for row_id, value in rows]
+        )
+
+
+# 4: secondary indexes for the lookups every page does
+def _create_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_matches_team_date ON matches (team, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cars_match ON cars (match_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_assignments_match_athlete ON assignments (match_id, athlete_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_assignments_car ON assignments (car_id)')
+
+
+# 5: indexes for the paginated athlete and match lists
+def _create_list_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_athletes_name ON athletes (name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date)')
+
+
+# 6: an athlete can only have one seat per match; drop duplicate assignments
+# (keeping the latest one and giving the other seats back) and enforce it
+def _unique_match_assignments(conn):
+    duplicates = conn.execute('''
+        SELECT id, car_id FROM assignments
+        WHERE id NOT IN (SELECT MAX(id) FROM assignments GROUP BY match_id, athlete_id)
+    ''').fetchall()
+    conn.executemany('UPDATE cars SET seats = seats + 1 WHERE id = ?', [(car_id,) for _, car_id in duplicates])
+    conn.executemany('DELETE FROM assignments WHERE id = ?', [(assignment_id,) for assignment_id, _ in duplicates])
+    conn.execute('DROP INDEX IF EXISTS idx_assignments_match_athlete')
+    conn.execute('CREATE UNIQUE INDEX idx_assignments_match_athlete ON assignments (match_id, athlete_id)')
+
+
+# 7: outbox of notifications about assignment changes, written in the same transaction
+# as the change and drained by the dispatcher in notifications.py
+def _create_outbox(conn):
+    conn.execute('''
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            event TEXT NOT NULL,
+            dedup_key TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_until REAL,
+            sent_at TEXT,
+            failed_at TEXT,
+            last_error TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX idx_outbox_pending ON outbox (next_attempt_at)
+        WHERE sent_at IS NULL AND failed_at IS NULL
+    ''')
+
+
+# 8: full-text index over athlete names and contacts for the accent-insensitive search
+# of search.py. It is an external-content FTS5 table (it stores only the index, reading
+# the text from athletes) kept in sync by triggers, so every insert, update and delete
+# of athletes, wherever it comes from, reaches the index in the same transaction.
+def _create_athlete_search(conn):
+    conn.execute('''
+        CREATE VIRTUAL TABLE athletes_fts USING fts5(
+            name, contact, content='athletes', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER athletes_fts_insert AFTER INSERT ON athletes BEGIN
+            INSERT INTO athletes_fts (rowid, name, contact) VALUES (new.id, new.name, new.contact);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER athletes_fts_delete AFTER DELETE ON athletes BEGIN
+            INSERT INTO athletes_fts (athletes_fts, rowid, name, contact) VALUES ('delete', old.id, old.name, old.contact);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER athletes_fts_update AFTER UPDATE OF name, contact ON athletes BEGIN
+            INSERT INTO athletes_fts (athletes_fts, rowid, name, contact) VALUES ('delete', old.id, old.name, old.contact);
+            INSERT INTO athletes_fts (rowid, name, contact) VALUES (new.id, new.name, new.contact);
+        END
+    ''')
+    # Index the athletes already in the database
+    conn.execute("INSERT INTO athletes_fts (athletes_fts) VALUES ('rebuild')")
+
+
+# 9: change counters of the tables, bumped by triggers on every write (wherever it comes
+# from) and read by db.load_table_versions() for the ETag and Last-Modified of api.py
+def _create_table_changes(conn):
+    conn.execute('''
+        CREATE TABLE table_changes (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at INTEGER NOT NULL
+        )
+    ''')
+    for table in ('teams', 'athletes', 'athlete_teams', 'matches', 'cars', 'assignments'):
+        conn.execute(
+            "INSERT INTO table_changes (table_name, changed_at) VALUES (?, CAST(strftime('%s', 'now') AS INTEGER))",
+            (table,)
+        )
+        for event in ('insert', 'update', 'delete'):
+            conn.execute(f'''
+                CREATE TRIGGER {table}_changes_{event} AFTER {event.upper()} ON {table} BEGIN
+                    UPDATE table_changes SET version = version + 1, changed_at = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE table_name = '{table}';
+                END
+            ''')
+
+
+# 10: append-only log of the carpool changes (see events.py), written in the transaction
+# making each change. Events outlive the cars and matches they are about, so there are
+# no foreign keys, and triggers refuse to update or delete them.
+def _create_carpool_events(conn):
+    conn.execute('''
+        CREATE TABLE carpool_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            match_id INTEGER NOT NULL,
+            car_id INTEGER,
+            athlete_id INTEGER,
+            data TEXT NOT NULL DEFAULT '{}',
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_carpool_events_match ON carpool_events (match_id, seq)')
+    for event in ('update', 'delete'):
+        conn.execute(f'''
+            CREATE TRIGGER carpool_events_no_{event} BEFORE {event.upper()} ON carpool_events BEGIN
+                SELECT RAISE(ABORT, 'carpool_events is append-only');
+            END
+        ''')
+
+
+# 11: team names are unique. Databases created by the first versions of the Jogos page
+# have a teams table without the UNIQUE constraint (migration 1 left it as it was), so
+# teams with the same name are merged into the oldest one, with their athletes, and the
+# names are enforced with a unique index. Matches keep the team name, which stays the same.
+def _unique_team_names(conn):
+    conn.execute('''
+        INSERT OR IGNORE INTO athlete_teams (athlete_id, team_id)
+        SELECT atm.athlete_id, keep.id FROM athlete_teams atm
+        JOIN teams t ON t.id = atm.team_id
+        JOIN (SELECT name, MIN(id) AS id FROM teams WHERE name IS NOT NULL GROUP BY name) keep ON keep.name = t.name
+        WHERE t.id != keep.id
+    ''')
+    duplicates = '''
+        SELECT id FROM teams
+        WHERE name IS NOT NULL AND id NOT IN (SELECT MIN(id) FROM teams WHERE name IS NOT NULL GROUP BY name)
+    '''
+    conn.execute(f'DELETE FROM athlete_teams WHERE team_id IN ({duplicates})')
+    conn.execute(f'DELETE FROM teams WHERE id IN ({duplicates})')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_teams_name ON teams (name)')
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _create_athlete_teams,
+    _fix_blob_ids,
+    _create_indexes,
+    _create_list_indexes,
+    _unique_match_assignments,
+    _create_outbox,
+    _create_athlete_search,
+    _create_table_changes,
+    _create_carpool_events,
+    _unique_team_names,
+]
+
+
+# Function to create the tables of the archive database (attached as `archive`), which
+# holds the finished seasons moved out of the live tables by archive.py. Kept apart from
+# MIGRATIONS since the archive is a separate file; assignments keep the athlete's name
+# and contact, as the athlete may later be deleted from the live database.
+def migrate_archive(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.matches (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            date TEXT,
+            google_maps_link TEXT,
+            team TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_matches_date ON matches (date, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.cars (
+            id INTEGER PRIMARY KEY,
+            match_id INTEGER,
+            driver TEXT,
+            contact TEXT,
+            seats INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_cars_match ON cars (match_id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.assignments (
+            id INTEGER PRIMARY KEY,
+            match_id INTEGER,
+            car_id INTEGER,
+            athlete_id INTEGER,
+            athlete_name TEXT,
+            athlete_contact TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_assignments_car ON assignments (car_id)')
+
+
+# Function to apply every migration the database hasn't seen yet
+def migrate(conn):
+    while True:
+        # Take the write lock before reading the version, so two processes
+        # starting at the same time don't run the same migration twice
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return
+            MIGRATIONS[version](conn)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
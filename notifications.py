@@ -0,0 +1,335 @@
+# Notifications to drivers and families about assignment changes.
+#
+# The pages call enqueue_assignment_changes() inside the transaction that assigns or
+# removes athletes, writing one row per configured channel to the outbox table, so a
+# notification exists if and only if the change was committed. A pool of background
+# workers (started with start_dispatcher(), or `python notifications.py` as a separate
+# process) claims pending rows in batches, hands them to their channel and marks them
+# sent, or schedules a retry with exponential backoff until MAX_ATTEMPTS.
+#
+# Every row has a unique dedup_key (event, assignment and channel), so enqueueing the
+# same change twice is a no-op; channels get the key too, so receivers can drop the
+# rare duplicate left by a worker that delivered a batch but died before recording it.
+#
+# Channels are configured with AAC_NOTIFY_CHANNELS (comma-separated, empty disables
+# notifications): 'file' (AAC_NOTIFY_FILE, for testing), 'webhook' (AAC_NOTIFY_WEBHOOK_URL)
+# and 'smtp' (AAC_SMTP_HOST, AAC_SMTP_PORT, AAC_SMTP_USER, AAC_SMTP_PASSWORD, AAC_SMTP_SENDER).
+# Other channels can be added with register_channel().
+#
+# Every club database has its own outbox and its own pool of workers (see tenants.py).
+
+import hashlib
+import json
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import urllib.request
+from email.message import EmailMessage
+
+from db import current_database, get_connection, use_database, write_transaction
+
+WORKERS = 2
+BATCH_SIZE = 50
+POLL_INTERVAL = 1.0  # seconds between polls when the outbox is empty
+CLAIM_TIMEOUT = 60.0  # seconds before a batch claimed by a dead worker is picked up again
+MAX_ATTEMPTS = 8
+RETRY_BACKOFF = 5.0  # seconds, doubled after every failed attempt
+MAX_RETRY_BACKOFF = 3600.0
+
+_log = logging.getLogger('aac.notifications')
+
+
+# Function to describe a notification as text, in the language of the app
+def message_text(event, payload):
+    date = '/'.join(reversed(payload['date'].split('-'))) if payload.get('date') else ''
+    if event == 'assigned':
+        action = f"{payload['athlete']} vai no carro de {payload['driver']}"
+    else:
+        action = f"{payload['athlete']} já não vai no carro de {payload['driver']}"
+    return f"{action} para o jogo {payload['match']} ({payload['team']}) de {date}."
+
+
+# Channel appending one JSON line per notification to a file (for testing)
+class FileChannel:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get('AAC_NOTIFY_FILE', 'notifications.jsonl'))
+
+    def send(self, notifications):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            for notification in notifications:
+                f.write(json.dumps(dict(notification, text=message_text(notification['event'], notification['payload'])),
+                                   ensure_ascii=False) + '\n')
+        return {}
+
+
+# Channel posting every batch as one JSON document to a webhook
+class WebhookChannel:
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ['AAC_NOTIFY_WEBHOOK_URL'])
+
+    def send(self, notifications):
+        body = json.dumps({'notifications': [
+            dict(notification, text=message_text(notification['event'], notification['payload']))
+            for notification in notifications
+        ]}, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'Idempotency-Key': hashlib.sha256(
+                '\n'.join(notification['dedup_key'] for notification in notifications).encode('utf-8')
+            ).hexdigest(),
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+        return {}
+
+
+# Channel sending an email to the driver and the family, for contacts that are email addresses
+class SmtpChannel:
+    def __init__(self, host, port, sender, user=None, password=None):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.user = user
+        self.password = password
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ['AAC_SMTP_HOST'], int(os.environ.get('AAC_SMTP_PORT', 587)),
+            os.environ['AAC_SMTP_SENDER'], os.environ.get('AAC_SMTP_USER'), os.environ.get('AAC_SMTP_PASSWORD'),
+        )
+
+    def send(self, notifications):
+        failed = {}
+        # One SMTP session for the whole batch
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            for notification in notifications:
+                payload = notification['payload']
+                recipients = sorted({
+                    str(contact).strip() for contact in (payload.get('driver_contact'), payload.get('athlete_contact'))
+                    if contact and '@' in str(contact)
+                })
+                if not recipients:
+                    continue
+                message = EmailMessage()
+                message['Subject'] = f"Carpool - {payload['match']}"
+                message['From'] = self.sender
+                message['To'] = ', '.join(recipients)
+                message['Message-ID'] = f"<{notification['dedup_key']}@aac-carpool>"
+                message.set_content(message_text(notification['event'], payload))
+                try:
+                    smtp.send_message(message)
+                except smtplib.SMTPException as e:
+                    failed[notification['id']] = str(e)
+        return failed
+
+
+# Factories of the channels that can be named in AAC_NOTIFY_CHANNELS. A channel has a
+# send(notifications) method returning {outbox id: error} for the notifications it
+# could not deliver (raising fails the whole batch).
+CHANNEL_FACTORIES = {
+    'file': FileChannel.from_env,
+    'webhook': WebhookChannel.from_env,
+    'smtp': SmtpChannel.from_env,
+}
+
+
+# Function to add a channel that can then be named in AAC_NOTIFY_CHANNELS
+def register_channel(name, factory):
+    CHANNEL_FACTORIES[name] = factory
+
+
+# Function to get the names of the configured channels
+def configured_channels():
+    names = [name.strip() for name in os.environ.get('AAC_NOTIFY_CHANNELS', '').split(',') if name.strip()]
+    return [name for name in names if name in CHANNEL_FACTORIES]
+
+
+# Function to write the notifications of an assignment change to the outbox, inside the
+# transaction making the change. `where` selects the rows of the assignments table `s`,
+# so removals must be enqueued before the assignments are deleted.
+def enqueue_assignment_changes(conn, event, where, params=()):
+    now = time.time()
+    for channel in configured_channels():
+        conn.execute(f'''
+            INSERT OR IGNORE INTO outbox (channel, event, dedup_key, payload, next_attempt_at)
+            SELECT ?, ?, ? || ':' || s.id || ':' || ?, json_object(
+                       'match_id', m.id, 'match', m.name, 'date', m.date, 'team', m.team,
+                       'car_id', c.id, 'driver', c.driver, 'driver_contact', c.contact,
+                       'athlete_id', a.id, 'athlete', a.name, 'athlete_contact', a.contact
+                   ), ?
+            FROM assignments s
+            JOIN cars c ON c.id = s.car_id
+            JOIN athletes a ON a.id = s.athlete_id
+            JOIN matches m ON m.id = s.match_id
+            WHERE {where}
+        ''', (channel, event, event, channel, now, *params))
+
+
+# Ids of the notifications of a channel due for delivery and not claimed by a live worker
+# (parameters: channel, now, now)
+_DUE_QUERY = '''
+    SELECT id FROM outbox
+    WHERE channel = ? AND sent_at IS NULL AND failed_at IS NULL AND next_attempt_at <= ?
+      AND (claimed_until IS NULL OR claimed_until < ?)
+'''
+
+
+# Pool of worker threads draining the outbox of one database to the channels
+class Dispatcher:
+    def __init__(self, channels, database, workers=WORKERS, batch_size=BATCH_SIZE):
+        self.channels = channels
+        self.database = database
+        self.workers = workers
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'outbox-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        use_database(self.database)
+        while not self._stop.is_set():
+            try:
+                delivered = self.drain_once()
+            except Exception:
+                # e.g. the database stayed locked; the claimed rows are retried after CLAIM_TIMEOUT
+                _log.exception('Outbox worker failed')
+                delivered = 0
+            if not delivered:
+                self._stop.wait(POLL_INTERVAL)
+
+    # Claim one batch per channel and deliver it. Returns the number of notifications handled.
+    def drain_once(self):
+        handled = 0
+        for name, channel in self.channels.items():
+            batch = self._claim(name)
+            if batch:
+                self._deliver(channel, batch)
+                handled += len(batch)
+        return handled
+
+    def _claim(self, channel_name):
+        now = time.time()
+        # A plain read first, so idle workers don't take the write lock on every poll
+        if get_connection().execute(_DUE_QUERY + ' LIMIT 1', (channel_name, now, now)).fetchone() is None:
+            return []
+        with write_transaction() as conn:
+            rows = conn.execute(f'''
+                UPDATE outbox SET claimed_until = ?
+                WHERE id IN ({_DUE_QUERY} ORDER BY id LIMIT ?)
+                RETURNING id, event, dedup_key, payload, attempts
+            ''', (now + CLAIM_TIMEOUT, channel_name, now, now, self.batch_size)).fetchall()
+        return [
+            {'id': row[0], 'event': row[1], 'dedup_key': row[2], 'payload': json.loads(row[3]), 'attempts': row[4]}
+            for row in sorted(rows)
+        ]
+
+    def _deliver(self, channel, batch):
+        try:
+            failed = channel.send([
+                {key: notification[key] for key in ('id', 'event', 'dedup_key', 'payload')} for notification in batch
+            ])
+        except Exception as e:
+            failed = {notification['id']: f"{type(e).__name__}: {e}" for notification in batch}
+
+        now = time.time()
+        retries, given_up = [], []
+        for notification in batch:
+            error = failed.get(notification['id'])
+            if error is None:
+                continue
+            attempts = notification['attempts'] + 1
+            if attempts >= MAX_ATTEMPTS:
+                given_up.append((attempts, error, notification['id']))
+            else:
+                delay = min(RETRY_BACKOFF * 2 ** notification['attempts'], MAX_RETRY_BACKOFF) * random.uniform(0.5, 1.5)
+                retries.append((attempts, error, now + delay, notification['id']))
+
+        with write_transaction() as conn:
+            conn.executemany(
+                'UPDATE outbox SET sent_at = CURRENT_TIMESTAMP, claimed_until = NULL WHERE id = ?',
+                [(notification['id'],) for notification in batch if notification['id'] not in failed]
+            )
+            conn.executemany(
+                'UPDATE outbox SET attempts = ?, last_error = ?, next_attempt_at = ?, claimed_until = NULL WHERE id = ?',
+                retries
+            )
+            conn.executemany(
+                'UPDATE outbox SET attempts = ?, last_error = ?, failed_at = CURRENT_TIMESTAMP, claimed_until = NULL WHERE id = ?',
+                given_up
+            )
+
+
+_dispatchers = {}
+_dispatcher_lock = threading.Lock()
+
+
+# Function to start the worker pool of the current database once per process,
+# if any channel is configured
+def start_dispatcher():
+    database = current_database()
+    with _dispatcher_lock:
+        if database not in _dispatchers:
+            channel_names = configured_channels()
+            if not channel_names:
+                return None
+            _dispatchers[database] = Dispatcher({name: CHANNEL_FACTORIES[name]() for name in channel_names}, database)
+            _dispatchers[database].start()
+        return _dispatchers[database]
+
+
+# Function to count the outbox rows per channel and status (for the administration page)
+def outbox_status():
+    return get_connection().execute('''
+        SELECT channel,
+               SUM(sent_at IS NULL AND failed_at IS NULL) AS pending,
+               SUM(sent_at IS NOT NULL) AS sent,
+               SUM(failed_at IS NOT NULL) AS failed
+        FROM outbox GROUP BY channel ORDER BY channel
+    ''').fetchall()
+
+
+if __name__ == '__main__':
+    from tenants import load_tenants, use_tenant
+
+    # Run the workers of every club in the foreground, e.g. as a separate service next to Streamlit
+    dispatchers = []
+    for tenant in load_tenants():
+        use_tenant(tenant)
+        dispatcher = start_dispatcher()
+        if dispatcher is None:
+            raise SystemExit('No notification channels configured (set AAC_NOTIFY_CHANNELS).')
+        dispatchers.append(dispatcher)
+    print(f"Dispatching notifications of {len(dispatchers)} club(s) to: {', '.join(dispatchers[0].channels)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for dispatcher in dispatchers:
+            dispatcher.stop()
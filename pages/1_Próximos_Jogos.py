@@ -1,77 +1,18 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
-import os
+from rows import format_date
+from storage import StorageError, get_storage
+from autoassign import plan_assignments
+from profiling import profile_page
+from tenants import require_login
 
-# Database initialization
-def init_db():
-    try:
-        if not os.path.exists('athletes.db'):
-            with sqlite3.connect('athletes.db') as conn:
-                c = conn.cursor()
-                
-                # Create the matches table if it doesn't exist
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS matches (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT,
-                        date TEXT,
-                        google_maps_link TEXT,
-                        team TEXT
-                    )
-                ''')
-
-                # Create the cars table if it doesn't exist
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS cars (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        match_id INTEGER,
-                        driver TEXT,
-                        contact TEXT,
-                        seats INTEGER,
-                        FOREIGN KEY(match_id) REFERENCES matches(id)
-                    )
-                ''')
-
-                # Create the athletes table if it doesn't exist
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS athletes (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT,
-                        contact TEXT,
-                        teams TEXT
-                    )
-                ''')
-
-                # Create the assignments table if it doesn't exist
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS assignments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        match_id INTEGER,
-                        car_id INTEGER,
-                        athlete_id INTEGER,
-                        FOREIGN KEY(match_id) REFERENCES matches(id),
-                        FOREIGN KEY(car_id) REFERENCES cars(id),
-                        FOREIGN KEY(athlete_id) REFERENCES athletes(id)
-                    )
-                ''')
-
-                # Create the teams table if it doesn't exist
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS teams (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT UNIQUE
-                    )
-                ''')
-                
-                conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao inicializar a base de dados: {e}")
-
-# Ensure the user is authenticated
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
-    st.error("Por favor, faça login a partir da página inicial.")
-    st.stop()
+# Profile this rerun when profiling is enabled
+profile_page()
+
+# Ensure the user is logged in to a club (every query then goes to the club's database)
+require_login()
+
+# Start the background workers sending the assignment notifications (if configured)
+get_storage().start_workers()
 
 # Custom CSS for mobile-friendly adjustments
 st.markdown(
@@ -90,138 +31,300 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Functions to keep the messages of the carpool board callbacks until the board shows them
+def notify(kind, message):
+    st.session_state.setdefault('board_messages', []).append((kind, message))
+
+def show_messages():
+    for kind, message in st.session_state.pop('board_messages', []):
+        st.toast(message, icon='✅' if kind == 'success' else '⚠️')
+
 # Function to add a car to the database
 def add_car(match_id, driver, contact, seats):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO cars (match_id, driver, contact, seats) 
-                VALUES (?, ?, ?, ?)
-            ''', (match_id, driver, contact, seats))
-            conn.commit()
-            st.success(f"Carro adicionado com sucesso!")
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao adicionar o carro: {e}")
-
-# Function to update car information in the database
-def update_car(car_id, driver, contact, seats):
+        get_storage().add_car(match_id, driver, contact, seats)
+        notify('success', f"Carro adicionado com sucesso!")
+    except StorageError as e:
+        notify('error', f"Ocorreu um erro ao adicionar o carro: {e}")
+
+# Function to update car information in the database, from the free seats the edit started from
+def update_car(car_id, driver, contact, seats, expected_seats):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('''
-                UPDATE cars 
-                SET driver = ?, contact = ?, seats = ? 
-                WHERE id = ?
-            ''', (driver, contact, seats, car_id))
-            conn.commit()
-            st.success(f"Carro atualizado com sucesso!")
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao atualizar o carro: {e}")
-
-# Function to delete a car from the database
+        get_storage().update_car(car_id, driver, contact, seats, expected_seats)
+        notify('success', f"Carro atualizado com sucesso!")
+    except StorageError as e:
+        notify('error', f"Ocorreu um erro ao atualizar o carro: {e}")
+
+# Function to delete a car and its assignments from the database
 def delete_car(car_id):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            # Remove all assignments related to this car
-            c.execute('DELETE FROM assignments WHERE car_id = ?', (car_id,))
-            # Delete the car
-            c.execute('DELETE FROM cars WHERE id = ?', (car_id,))
-            conn.commit()
-            st.success(f"Carro apagado com sucesso!")
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao apagar o carro: {e}")
-
-# Function to assign an athlete to a car
+        get_storage().delete_car(car_id)
+        notify('success', f"Carro apagado com sucesso!")
+    except StorageError as e:
+        notify('error', f"Ocorreu um erro ao apagar o carro: {e}")
+
+# Function to assign an athlete to a car (moving them out of any other car of the match)
 def assign_athlete_to_car(match_id, car_id, athlete_id):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            # Remove athlete from any other car in the match
-            c.execute('DELETE FROM assignments WHERE match_id = ? AND athlete_id = ?', (match_id, athlete_id))
-            # Insert new assignment
-            c.execute('''
-                INSERT INTO assignments (match_id, car_id, athlete_id) 
-                VALUES (?, ?, ?)
-            ''', (match_id, car_id, athlete_id))
-            # Decrease seats by 1
-            c.execute('UPDATE cars SET seats = seats - 1 WHERE id = ?', (car_id,))
-            conn.commit()
-            st.success(f"Atleta atribuído com sucesso!")
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao atribuir o atleta: {e}")
+        get_storage().assign_athlete(match_id, car_id, athlete_id)
+        notify('success', f"Atleta atribuído com sucesso!")
+    except StorageError as e:
+        notify('error', f"Ocorreu um erro ao atribuir o atleta: {e}")
 
 # Function to remove an athlete from a car
 def remove_athlete_from_car(car_id, athlete_id):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            # Remove athlete assignment
-            c.execute('DELETE FROM assignments WHERE car_id = ? AND athlete_id = ?', (car_id, athlete_id))
-            # Increase seats by 1
-            c.execute('UPDATE cars SET seats = seats + 1 WHERE id = ?', (car_id,))
-            conn.commit()
-            st.success(f"Atleta removido com sucesso!")
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao remover o atleta: {e}")
+        get_storage().remove_athlete(car_id, athlete_id)
+        notify('success', f"Atleta removido com sucesso!")
+    except StorageError as e:
+        notify('error', f"Ocorreu um erro ao remover o atleta: {e}")
+
+# Function to assign several athletes to cars in a single transaction
+def assign_athletes_to_cars(match_id, plan):
+    try:
+        get_storage().assign_athletes(match_id, plan)
+        notify('success', f"{len(plan)} atletas atribuídos com sucesso!")
+    except StorageError as e:
+        notify('error', f"Ocorreu um erro ao atribuir os atletas: {e}")
 
 # Function to fetch the next match for a specific team
 def fetch_next_match(team):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query(
-                "SELECT * FROM matches WHERE team = ? AND date >= DATE('now') ORDER BY date LIMIT 1", 
-                conn, params=(team,)
-            )
-    except sqlite3.Error as e:
+        return get_storage().next_match(team)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar o próximo jogo: {e}")
-        return pd.DataFrame()
+        return None
 
-# Function to fetch cars for a specific match
-def fetch_cars_for_match(match_id):
+# Function to fetch the cars of a match together with their assigned athletes
+def fetch_match_roster(match_id):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query(
-                "SELECT * FROM cars WHERE match_id = ?", conn, params=(match_id,)
-            )
-    except sqlite3.Error as e:
+        return get_storage().match_roster(match_id)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os carros: {e}")
-        return pd.DataFrame()
+        return [], {}
 
-# Function to fetch assigned athletes for a specific car
-def fetch_assigned_athletes(car_id):
+# Function to fetch available athletes for the match, filtered by team (and by a search)
+def fetch_available_athletes(match_id, team, search=''):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query(
-                '''
-                SELECT a.id, a.name, a.contact FROM athletes a
-                JOIN assignments ass ON a.id = ass.athlete_id
-                WHERE ass.car_id = ?
-                ''', conn, params=(car_id,)
-            )
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao buscar os atletas atribuídos: {e}")
-        return pd.DataFrame()
-
-# Function to fetch available athletes for the match, filtered by team
-def fetch_available_athletes(match_id, team):
-    try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query(
-                '''
-                SELECT * FROM athletes
-                WHERE id NOT IN (
-                    SELECT athlete_id FROM assignments WHERE match_id = ?
-                ) AND teams LIKE ?
-                ''', conn, params=(match_id, f'%{team}%')
-            )
-    except sqlite3.Error as e:
+        return get_storage().available_athletes(match_id, team, search)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os atletas: {e}")
-        return pd.DataFrame()
+        return []
+
+# Function to fetch the next match of every team with its seat and athlete counts
+def fetch_next_matches_overview():
+    try:
+        return get_storage().next_matches_overview()
+    except StorageError as e:
+        st.error(f"Ocorreu um erro ao buscar os próximos jogos: {e}")
+        return []
+
+# Tables the carpool board reads
+BOARD_TABLES = ('cars', 'assignments', 'athletes', 'athlete_teams')
+
+# Function to fetch the version of the tables of the board (None if the storage can't tell)
+def fetch_board_version():
+    try:
+        return get_storage().version(BOARD_TABLES)
+    except StorageError:
+        return None
+
+# Fragments of the carpool board. A click reruns only the fragments showing what it
+# changed (its car, the list of cars and/or the assignment forms), not the whole page.
+CARS_FRAGMENT = 'board_cars'
+ASSIGN_FRAGMENT = 'board_assign'
+
+# Seconds between the checks for changes made by other parents
+BOARD_REFRESH_SECONDS = 5
+
+def car_fragment_key(car_id):
+    return f'board_car_{car_id}'
+
+# Function to get the key of a widget of the edit form of a car. The key changes with the
+# values of the car, so the form is filled again from the database whenever the car changes.
+def edit_car_key(field, car):
+    return f'edit_car_{field}_{car.id}_{car.seats}_{car.driver}_{car.contact}'
+
+# Callbacks of the carpool board, each rerunning the fragments it changed
+def on_add_car(match_id):
+    add_car(match_id, st.session_state.new_car_driver.strip(), st.session_state.new_car_contact.strip(),
+            st.session_state.new_car_seats)
+    st.rerun(scope=[CARS_FRAGMENT, ASSIGN_FRAGMENT])
+
+def on_update_car(car):
+    update_car(car.id, st.session_state[edit_car_key('driver', car)].strip(),
+               st.session_state[edit_car_key('contact', car)].strip(), st.session_state[edit_car_key('seats', car)],
+               car.seats)
+    st.rerun(scope=[car_fragment_key(car.id), ASSIGN_FRAGMENT])
+
+def on_delete_car(car_id):
+    delete_car(car_id)
+    st.rerun(scope=[CARS_FRAGMENT, ASSIGN_FRAGMENT])
+
+def on_remove_athlete(car_id, athlete_id):
+    remove_athlete_from_car(car_id, athlete_id)
+    st.rerun(scope=[car_fragment_key(car_id), ASSIGN_FRAGMENT])
+
+def on_assign_athlete(match_id):
+    car_id = st.session_state.assign_car_id
+    assign_athlete_to_car(match_id, car_id, st.session_state.assign_athlete_id)
+    st.rerun(scope=[car_fragment_key(car_id), ASSIGN_FRAGMENT])
+
+def on_preview_auto_assign(match_id, athletes, cars):
+    plan, unassigned = plan_assignments(
+        athletes, cars, st.session_state.keep_siblings_together, st.session_state.prefer_own_driver
+    )
+    st.session_state.auto_assign_plan = {'match_id': match_id, 'plan': plan, 'unassigned': unassigned}
+
+def on_confirm_auto_assign(match_id):
+    assign_athletes_to_cars(match_id, st.session_state.auto_assign_plan['plan'])
+    st.session_state.auto_assign_plan = None
+    st.rerun(scope=[CARS_FRAGMENT, ASSIGN_FRAGMENT])
+
+def on_cancel_auto_assign():
+    st.session_state.auto_assign_plan = None
+
+# Fragment with the form to add a car
+@st.fragment(key='board_car_form')
+def car_form(match_id):
+    st.write("### Adicionar Carro")
+    with st.form(key='car_form'):
+        st.text_input('Condutor', key='new_car_driver')
+        st.text_input('Contacto', key='new_car_contact')
+        st.number_input('Lugares Disponíveis', min_value=1, step=1, key='new_car_seats')
+        st.form_submit_button('Adicionar', on_click=on_add_car, args=(match_id,))
+
+# Fragment with one car, its athletes and its edit form (rendered with a per-car key)
+def car_card(match_id, car_id):
+    cars, athletes_by_car = fetch_match_roster(match_id)
+    car = next((car for car in cars if car.id == car_id), None)
+    if car is None:
+        return
+
+    with st.container():
+        # Combine driver and contact information in one line
+        st.write(f"**Condutor:** {car.driver} ({car.contact})")
+        st.write(f"**Lugares Disponíveis:** {car.seats}")
+
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            # The edit form opens without a rerun
+            with st.popover("Editar"):
+                with st.form(key=f'edit_car_form_{car_id}'):
+                    st.text_input('Condutor', value=car.driver, key=edit_car_key('driver', car))
+                    st.text_input('Contacto', value=car.contact, key=edit_car_key('contact', car))
+                    st.number_input('Lugares Disponíveis', min_value=0, step=1, value=car.seats,
+                                    key=edit_car_key('seats', car))
+                    st.form_submit_button('Atualizar', on_click=on_update_car, args=(car,))
+        with col2:
+            st.button("Apagar", key=f"delete_car_{car_id}", on_click=on_delete_car, args=(car_id,))
+
+        # Display assigned athletes
+        assigned_athletes = athletes_by_car.get(car_id, [])
+        if assigned_athletes:
+            st.write(f"**Atletas no carro de {car.driver}**")
+            for athlete in assigned_athletes:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.write(f"{athlete.name} ({athlete.contact})")
+                with col2:
+                    st.button("Remover", key=f"remove_athlete_{athlete.id}_{car_id}",
+                              on_click=on_remove_athlete, args=(car_id, athlete.id))
+
+        st.markdown("---")
+
+# Fragment with the list of cars, each car in its own fragment
+@st.fragment(key=CARS_FRAGMENT)
+def cars_board(match_id):
+    st.write("### Carros Disponíveis")
+    cars, _ = fetch_match_roster(match_id)
+    for car in cars:
+        st.fragment(car_card, key=car_fragment_key(car.id))(match_id, car.id)
+
+# Fragment with the manual and automatic assignment of the athletes still without a car
+@st.fragment(key=ASSIGN_FRAGMENT)
+def assignment_forms(match_id, team):
+    # Every board callback reruns this fragment, so it shows their messages
+    show_messages()
+
+    st.write("### Escolher Carro para o Atleta")
+    # The version is read first, so a change landing while the board is read is caught
+    # by the next check of board_watch
+    version = fetch_board_version()
+    roster = fetch_match_roster(match_id)
+    cars, _ = roster
+    available_athletes = fetch_available_athletes(match_id, team)
+    # Every board rerun goes through this fragment, so it remembers what the board shows
+    st.session_state.board = {'match_id': match_id, 'version': version, 'data': (roster, available_athletes)}
+
+    # Check if there are available athletes and cars
+    if available_athletes and cars:
+        # Filter out cars with 0 seats
+        available_cars = [car for car in cars if car.seats > 0]
+        if available_cars:
+            athlete_names = {athlete.id: athlete.name for athlete in available_athletes}
+            drivers = {car.id: car.driver for car in available_cars}
+
+            # Type-ahead narrowing the athletes of the form by name or contact, accents aside
+            search = st.text_input('Procurar Atleta', key='assign_athlete_search').strip()
+            found_athletes = fetch_available_athletes(match_id, team, search) if search else available_athletes
+            if found_athletes:
+                with st.form(key='assign_athlete_form'):
+                    st.selectbox('Escolher Atleta', [athlete.id for athlete in found_athletes], key='assign_athlete_id',
+                                 format_func=athlete_names.get)
+                    st.selectbox('Escolher Carro', list(drivers), key='assign_car_id', format_func=drivers.get)
+                    st.form_submit_button('Confirmar', on_click=on_assign_athlete, args=(match_id,))
+            else:
+                st.write(f"Nenhum atleta encontrado para '{search}'.")
+
+            # Automatic assignment of all the remaining athletes
+            st.write("### Atribuição Automática")
+            with st.form(key='auto_assign_form'):
+                st.checkbox('Manter irmãos juntos (mesmo contacto)', value=True, key='keep_siblings_together')
+                st.checkbox('Preferir o carro da própria família', value=True, key='prefer_own_driver')
+                st.form_submit_button('Pré-visualizar', on_click=on_preview_auto_assign, args=(
+                    match_id, [athlete._asdict() for athlete in available_athletes],
+                    [car._asdict() for car in available_cars]
+                ))
+
+            # Preview of the automatic assignment, committed all at once
+            auto_assign = st.session_state.get('auto_assign_plan')
+            if auto_assign and auto_assign['match_id'] == match_id:
+                st.dataframe(
+                    [{'Atleta': athlete_names.get(athlete_id), 'Condutor': drivers.get(car_id)}
+                     for athlete_id, car_id in auto_assign['plan']],
+                    hide_index=True
+                )
+                if auto_assign['unassigned']:
+                    st.write(f"Sem lugar: {', '.join(athlete['name'] for athlete in auto_assign['unassigned'])}")
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    st.button("Confirmar Atribuição", key='confirm_auto_assign', disabled=not auto_assign['plan'],
+                              on_click=on_confirm_auto_assign, args=(match_id,))
+                with col2:
+                    st.button("Cancelar", key='cancel_auto_assign', on_click=on_cancel_auto_assign)
+
+    # Show message if there are no more athletes to assign
+    if not available_athletes:
+        st.write("Não existem mais atletas para o escalão deste jogo.")
 
-# Initialize the database
-init_db()
+# Fragment checking on a timer whether someone else changed the board. It only asks the
+# storage for the version of the board tables (a cheap check while nothing was written);
+# the board is read again, from the cache shared by every session, only when the version
+# moved, and the page reruns only when what this match shows changed. (Reruns of other
+# fragments by key are only allowed from callbacks, not from a fragment.)
+@st.fragment(key='board_watch', run_every=BOARD_REFRESH_SECONDS)
+def board_watch(match_id, team):
+    board = st.session_state.get('board')
+    if board is None or board['match_id'] != match_id:
+        return
+    version = fetch_board_version()
+    if version is None or version == board['version']:
+        return
+    if (fetch_match_roster(match_id), fetch_available_athletes(match_id, team)) == board['data']:
+        board['version'] = version
+    else:
+        st.rerun()
 
 # Display the logo on the top of the page
 st.image("logo_aac.png", width=100)
@@ -229,32 +332,49 @@ st.image("logo_aac.png", width=100)
 # Fetch available teams for the selectbox
 def fetch_teams():
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query("SELECT name FROM teams", conn)['name'].tolist()
-    except sqlite3.Error as e:
+        return [team.name for team in get_storage().teams()]
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar as equipas: {e}")
         return []
 
 # Fetch the list of teams
 teams = fetch_teams()
 
-# State to hold the currently edited car ID
-if 'edit_car_id' not in st.session_state:
-    st.session_state.edit_car_id = None
+# Overview of the next match of every team, instead of one team at a time
+if st.toggle('Ver todos os escalões', key='next_matches_overview'):
+    st.title("Próximos jogos de todos os escalões")
+    overview = [summary for summary in fetch_next_matches_overview() if summary.id is not None]
+    if overview:
+        st.dataframe(
+            [{
+                'Escalão': summary.team,
+                'Jogo': summary.name,
+                'Data': format_date(summary.date),
+                'Carros': summary.cars,
+                'Lugares': summary.free_seats + summary.filled_seats,
+                'Ocupados': summary.filled_seats,
+                'Livres': summary.free_seats,
+                'Atletas sem Carro': summary.unassigned,
+            } for summary in overview],
+            hide_index=True,
+        )
+    else:
+        st.write("Não foram encontrados próximos jogos.")
+    st.stop()
 
 # Team Selector for Filtering Matches
 selected_team = st.selectbox('Escolher Escalão', teams)
 
 # Display the next match for the selected team
 st.title(f"Próximo jogo dos {selected_team}")
-next_match_df = fetch_next_match(selected_team)
+next_match = fetch_next_match(selected_team)
 
-if not next_match_df.empty:
+if next_match is not None:
     # Extract match information
-    match_id = next_match_df['id'].values[0]
-    match_name = next_match_df['name'].values[0]
-    match_date = pd.to_datetime(next_match_df['date'].iloc[0]).strftime('%d/%m/%Y')
-    google_maps_link = next_match_df['google_maps_link'].values[0]
+    match_id = next_match.id
+    match_name = next_match.name
+    match_date = format_date(next_match.date)
+    google_maps_link = next_match.google_maps_link
 
     # Display match information
     st.write(f"### {match_name}")
@@ -263,88 +383,12 @@ if not next_match_df.empty:
 
     # Divider above the form
     st.markdown("---")
-    
-    # Add or edit car form
-    st.write("### Adicionar Carro")
-    with st.form(key='car_form'):
-        if st.session_state.edit_car_id is None:
-            driver_name = st.text_input('Condutor')
-            contact_info = st.text_input('Contacto')
-            seats_available = st.number_input('Lugares Disponíveis', min_value=1, step=1)
-            submit_label = 'Adicionar'
-        else:
-            # Fetch car details for editing
-            car_to_edit = fetch_cars_for_match(match_id)[fetch_cars_for_match(match_id)['id'] == st.session_state.edit_car_id]
-            driver_name = st.text_input('Condutor', value=car_to_edit['driver'].values[0])
-            contact_info = st.text_input('Contacto', value=car_to_edit['contact'].values[0])
-            seats_available = st.number_input('Lugares Disponíveis', min_value=1, step=1, value=car_to_edit['seats'].values[0])
-            submit_label = 'Atualizar'
-        
-        if st.form_submit_button(submit_label):
-            if st.session_state.edit_car_id is None:
-                add_car(match_id, driver_name.strip(), contact_info.strip(), seats_available)
-            else:
-                update_car(st.session_state.edit_car_id, driver_name.strip(), contact_info.strip(), seats_available)
-                st.session_state.edit_car_id = None
-            st.rerun()
+    car_form(match_id)
 
     # Divider above available cars
     st.markdown("---")
-    
-    # Fetch and display cars for this match
-    st.write("### Carros Disponíveis")
-    cars_df = fetch_cars_for_match(match_id)
-
-    if not cars_df.empty:
-        for index, car in cars_df.iterrows():
-            with st.container():
-                # Combine driver and contact information in one line
-                st.write(f"**Condutor:** {car['driver']} ({car['contact']})")
-                st.write(f"**Lugares Disponíveis:** {car['seats']}")
-
-                col1, col2 = st.columns([1, 1])
-                with col1:
-                    if st.button("Editar", key=f"edit_car_{car['id']}"):
-                        st.session_state.edit_car_id = car['id']
-                        st.rerun()
-                with col2:
-                    if st.button("Apagar", key=f"delete_car_{car['id']}"):
-                        delete_car(car['id'])
-                        st.rerun()
-
-                # Display assigned athletes
-                assigned_athletes_df = fetch_assigned_athletes(car['id'])
-                if not assigned_athletes_df.empty:
-                    st.write(f"**Atletas no carro de {car['driver']}**")
-                    for athlete_index, athlete in assigned_athletes_df.iterrows():
-                        col1, col2 = st.columns([4, 1])
-                        with col1:
-                            st.write(f"{athlete['name']} ({athlete['contact']})")
-                        with col2:
-                            if st.button("Remover", key=f"remove_athlete_{athlete['id']}_{car['id']}"):
-                                remove_athlete_from_car(car['id'], athlete['id'])
-                                st.rerun()
-
-                st.markdown("---")
-
-    # Athlete assignment form
-    st.write("### Escolher Carro para o Atleta")
-    available_athletes_df = fetch_available_athletes(match_id, selected_team)  # Pass the selected team for filtering
-
-    # Check if there are available athletes and cars
-    if not available_athletes_df.empty and not cars_df.empty:
-        # Filter out cars with 0 seats
-        available_cars_df = cars_df[cars_df['seats'] > 0]
-        if not available_cars_df.empty:
-            with st.form(key='assign_athlete_form'):
-                selected_athlete_id = st.selectbox('Escolher Atleta', available_athletes_df['id'], format_func=lambda x: available_athletes_df[available_athletes_df['id'] == x]['name'].values[0])
-                selected_car_id = st.selectbox('Escolher Carro', available_cars_df['id'], format_func=lambda x: available_cars_df[available_cars_df['id'] == x]['driver'].values[0])
-                if st.form_submit_button('Confirmar'):
-                    assign_athlete_to_car(match_id, selected_car_id, selected_athlete_id)
-                    st.rerun()
-
-    # Show message if there are no more athletes to assign
-    if available_athletes_df.empty:
-        st.write("Não existem mais atletas para o escalão deste jogo.")
+    cars_board(match_id)
+    assignment_forms(match_id, selected_team)
+    board_watch(match_id, selected_team)
 else:
     st.write(f"Não foram encontrados próximos jogos dos {selected_team}.")
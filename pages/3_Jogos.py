@@ -1,106 +1,79 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
-import os
+from datetime import date
+from rows import format_date
+from storage import StorageError, get_storage
+from pagination import PAGE_SIZES, current_cursor, page_navigation
+from profiling import profile_page
+from tenants import require_login
 
-# Ensure the user is authenticated
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
-    st.error("Por favor, faça login a partir da página inicial.")
-    st.stop()
+# Profile this rerun when profiling is enabled
+profile_page()
+
+# Ensure the user is logged in to a club (every query then goes to the club's database)
+require_login()
 
 # Initialize session state variables
 if 'edit_match_id' not in st.session_state:
     st.session_state.edit_match_id = None
 
-# Database initialization
-def init_db():
-    try:
-        if not os.path.exists('athletes.db'):
-            with sqlite3.connect('athletes.db') as conn:
-                c = conn.cursor()
-                # Create the matches table if it doesn't exist
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS matches (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT,
-                        date TEXT,
-                        team TEXT,
-                        google_maps_link TEXT
-                    )
-                ''')
-                # Create the teams table if it doesn't exist
-                c.execute('''
-                    CREATE TABLE IF NOT EXISTS teams (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT
-                    )
-                ''')
-                conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao inicializar a base de dados: {e}")
-
-# Function to fetch all matches from the database
-def fetch_matches():
+# Function to fetch one page of matches from the database, filtered by team and name
+def fetch_matches(teams, search, after, page_size, descending):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query("SELECT * FROM matches", conn)
-    except sqlite3.Error as e:
+        return get_storage().matches_page(tuple(teams), search, after, page_size, descending)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os jogos: {e}")
-        return pd.DataFrame()
+        return []
+
+# Function to fetch a single match from the database
+def fetch_match(match_id):
+    try:
+        return get_storage().match(match_id)
+    except StorageError as e:
+        st.error(f"Ocorreu um erro ao buscar o jogo: {e}")
+        return None
 
 # Function to fetch all teams from the database
 def fetch_teams():
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query("SELECT name FROM teams", conn)['name'].tolist()
-    except sqlite3.Error as e:
+        return [team.name for team in get_storage().teams()]
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os escalões: {e}")
         return []
 
 # Functions to add, update, and delete matches
 def add_match(name, date, team, google_maps_link):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('INSERT INTO matches (name, date, team, google_maps_link) VALUES (?, ?, ?, ?)', 
-                      (name, date, team, google_maps_link))
-            conn.commit()
-            st.success(f"Jogo '{name}' adicionado com sucesso!")
-    except sqlite3.Error as e:
+        get_storage().add_match(name, date, team, google_maps_link)
+        st.success(f"Jogo '{name}' adicionado com sucesso!")
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao adicionar um jogo: {e}")
 
 def update_match(match_id, new_name, new_date, new_team, new_link):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('UPDATE matches SET name = ?, date = ?, team = ?, google_maps_link = ? WHERE id = ?', 
-                      (new_name, new_date, new_team, new_link, match_id))
-            conn.commit()
-    except sqlite3.Error as e:
+        get_storage().update_match(match_id, new_name, new_date, new_team, new_link)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao atualizar o jogo: {e}")
 
 def delete_match(match_id):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM matches WHERE id = ?', (match_id,))
-            conn.commit()
-            st.success(f"Jogo apagado com sucesso!")
-    except sqlite3.Error as e:
+        # Also removes the cars and assignments of this match
+        get_storage().delete_match(match_id)
+        st.success(f"Jogo apagado com sucesso!")
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao apagar o jogo: {e}")
 
-# Initialize the database
-init_db()
-
 # Display the logo on the top of the page
 st.image("logo_aac.png", width=100)
 
+# Fetch the list of teams once for all the forms below
+team_options = fetch_teams()
+
 # Show the form to add a new match
 st.write("### Adicionar Jogo")
 with st.form(key='add_match_form'):
     new_match_name = st.text_input('Local')
     new_match_date = st.date_input('Data do Jogo')
-    new_team = st.selectbox('Escolher Escalão', ["Escolher um escalão..."] + fetch_teams())
+    new_team = st.selectbox('Escolher Escalão', ["Escolher um escalão..."] + team_options)
     new_google_maps_link = st.text_input('Link do Google Maps')
 
     if st.form_submit_button('Confirmar'):
@@ -116,39 +89,44 @@ with st.form(key='add_match_form'):
 
 # Add filter to select teams
 st.write("### Filtrar Jogos por Escalão")
-selected_teams = st.multiselect('Escolher Escalões', fetch_teams())
-
-# Fetch the current list of matches
-matches_df = fetch_matches()
-
-# Apply team filter to the match list if any teams are selected
-if not matches_df.empty and selected_teams:
-    matches_df = matches_df[matches_df['team'].isin(selected_teams)]
+selected_teams = st.multiselect('Escolher Escalões', team_options)
+search = st.text_input('Procurar por Local').strip()
+sort_col, size_col = st.columns([2, 1])
+with sort_col:
+    sort_order = st.selectbox('Ordenar', ['Data (mais antigos primeiro)', 'Data (mais recentes primeiro)'])
+with size_col:
+    page_size = st.selectbox('Jogos por Página', PAGE_SIZES, index=1)
+descending = sort_order == 'Data (mais recentes primeiro)'
+
+# Fetch only the current page of matches; filtering, sorting and paging happen in the query
+after = current_cursor('matches', (tuple(selected_teams), search, page_size, descending))
+matches_page = fetch_matches(selected_teams, search, after, page_size, descending)
+matches = matches_page[:page_size]
 
 # Display the list of matches
 st.write("### Lista de Jogos")
 
 # Display each match's data
-if not matches_df.empty:
-    for index, row in matches_df.iterrows():
+if matches:
+    for match in matches:
         with st.container():
             # Combine name, date, team, and link into one line
-            match_line = f"**{row['name']}** ({row['team']}) - {pd.to_datetime(row['date']).strftime('%d/%m/%Y')}"
-            if row['google_maps_link']:
-                match_line += f" - [Abrir Google Maps]({row['google_maps_link']})"
+            match_line = f"**{match.name}** ({match.team}) - {format_date(match.date)}"
+            if match.google_maps_link:
+                match_line += f" - [Abrir Google Maps]({match.google_maps_link})"
             st.markdown(match_line, unsafe_allow_html=True)
 
             # Create columns for Edit and Delete buttons
             button_col1, button_col2 = st.columns([1, 1])
             
             with button_col1:
-                if st.button("Editar", key=f"edit_{row['id']}"):
-                    st.session_state.edit_match_id = row['id']
+                if st.button("Editar", key=f"edit_{match.id}"):
+                    st.session_state.edit_match_id = match.id
                     st.rerun()
             
             with button_col2:
-                if st.button("Apagar", key=f"delete_{row['id']}"):
-                    delete_match(row['id'])
+                if st.button("Apagar", key=f"delete_{match.id}"):
+                    delete_match(match.id)
                     st.rerun()
 
             # Add a small divider line for spacing between matches
@@ -156,20 +134,23 @@ if not matches_df.empty:
 else:
     st.write("Nenhum jogo encontrado. Por favor, adicione jogos usando o formulário acima.")
 
+# Buttons to move between pages
+page_navigation('matches', matches_page, page_size, ['date', 'id'])
+
 # Show the edit form if a match ID is set
-if st.session_state.edit_match_id is not None:
-    match_id = st.session_state.edit_match_id
-    match_row = matches_df[matches_df['id'] == match_id]
-    match_name = match_row['name'].values[0]
-    match_date = pd.to_datetime(match_row['date']).values[0]
-    match_team = match_row['team'].values[0]
-    match_link = match_row['google_maps_link'].values[0]
+edited_match = fetch_match(st.session_state.edit_match_id) if st.session_state.edit_match_id is not None else None
+if edited_match is not None:
+    match_id = edited_match.id
+    match_name = edited_match.name
+    match_date = date.fromisoformat(edited_match.date)
+    match_team = edited_match.team
+    match_link = edited_match.google_maps_link
 
     st.write("### Editar Jogo")
     with st.form(key='edit_match_form'):
         new_name = st.text_input('Editar Local', value=match_name)
-        new_date = st.date_input('Editar Data', value=pd.to_datetime(match_date))
-        new_team = st.selectbox('Editar Escalão', fetch_teams(), index=fetch_teams().index(match_team))
+        new_date = st.date_input('Editar Data', value=match_date)
+        new_team = st.selectbox('Editar Escalão', team_options, index=team_options.index(match_team))
         new_link = st.text_input('Editar Link para Google Maps', value=match_link)
         if st.form_submit_button('Confirmar'):
             update_match(match_id, new_name.strip(), new_date.strftime('%Y-%m-%d'), new_team, new_link.strip())
@@ -1,11 +1,13 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
+from storage import StorageError, get_storage
+from profiling import profile_page
+from tenants import require_login
 
-# Ensure the user is authenticated
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
-    st.error("Por favor, faça login a partir da página inicial.")
-    st.stop()
+# Profile this rerun when profiling is enabled
+profile_page()
+
+# Ensure the user is logged in to a club (every query then goes to the club's database)
+require_login()
 
 # Initialize session state variables
 if 'edit_team_id' not in st.session_state:
@@ -14,38 +16,29 @@ if 'edit_team_id' not in st.session_state:
 # Function to fetch all teams from the database
 def fetch_teams():
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query("SELECT * FROM teams", conn)
-    except sqlite3.Error as e:
+        return get_storage().teams()
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os escalões: {e}")
-        return pd.DataFrame()  # Return an empty DataFrame if there's an error
+        return []  # Return an empty list if there's an error
 
 # Functions to add, update, and delete teams
 def add_team(name):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('INSERT INTO teams (name) VALUES (?)', (name,))
-            conn.commit()
-    except sqlite3.Error as e:
+        get_storage().add_team(name)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao adicionar o escalão: {e}")
 
 def update_team(team_id, new_name):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('UPDATE teams SET name = ? WHERE id = ?', (new_name, team_id))
-            conn.commit()
-    except sqlite3.Error as e:
+        # Matches store the team name, so it is renamed there too
+        get_storage().rename_team(team_id, new_name)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao atualizar o escalão: {e}")
 
 def delete_team(team_id):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM teams WHERE id = ?', (team_id,))
-            conn.commit()
-    except sqlite3.Error as e:
+        get_storage().delete_team(team_id)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao apagar o escalão: {e}")
 
 # Display the logo on the top of the page
@@ -62,31 +55,31 @@ with st.form(key='add_team_form'):
             st.rerun()
 
 # Fetch the current list of teams
-teams_df = fetch_teams()
+teams = fetch_teams()
 
 # Display the list of teams in a tabular format
 st.write("### Lista de Escalões")
 
 # Display each team's data in the columns
-if not teams_df.empty:
-    for index, row in teams_df.iterrows():
+if teams:
+    for team in teams:
         # Main container for each team
         with st.container():
             # Display team name
-            st.write(f"**{row['name']}**")
+            st.write(f"**{team.name}**")
 
             # Create columns for the buttons, adjusting the width
             button_col1, button_col2, space_col3 = st.columns([2, 2, 8])
             
             with button_col1:
-                if st.button("Editar", key=f"edit_team_{row['id']}"):
-                    st.session_state.edit_team_id = row['id']
+                if st.button("Editar", key=f"edit_team_{team.id}"):
+                    st.session_state.edit_team_id = team.id
                     st.rerun()
             
             with button_col2:
-                if st.button("Apagar", key=f"delete_team_{row['id']}"):
-                    delete_team(row['id'])
-                    st.success(f"Escalão '{row['name']}' apagado com sucesso!")
+                if st.button("Apagar", key=f"delete_team_{team.id}"):
+                    delete_team(team.id)
+                    st.success(f"Escalão '{team.name}' apagado com sucesso!")
                     st.rerun()
 
             with space_col3:
@@ -97,10 +90,10 @@ else:
 st.markdown("---")
 
 # Show the edit form if a team ID is set
-if st.session_state.edit_team_id is not None:
-    team_id = st.session_state.edit_team_id
-    team_row = teams_df[teams_df['id'] == team_id]
-    team_name = team_row['name'].values[0]
+edited_team = next((team for team in teams if team.id == st.session_state.edit_team_id), None)
+if edited_team is not None:
+    team_id = edited_team.id
+    team_name = edited_team.name
 
     st.write("### Editar Escalão")
     with st.form(key='edit_team_form'):
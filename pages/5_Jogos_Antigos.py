@@ -1,57 +1,54 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
-import os
+from rows import format_date
+from storage import StorageError, get_storage
+from pagination import PAGE_SIZES, current_cursor, page_navigation
+from exporter import ExportError, export_to_tempfile
+from profiling import profile_page
+from tenants import require_login
 
-# Ensure the user is authenticated
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
-    st.error("Por favor, faça login a partir da página inicial.")
-    st.stop()
+# Profile this rerun when profiling is enabled
+profile_page()
 
+# Ensure the user is logged in to a club (every query then goes to the club's database)
+require_login()
 
-# Function to fetch all past matches from the database
-def fetch_past_matches():
+
+# Function to fetch one page of past matches from the database, filtered by team, name and date
+def fetch_past_matches(teams, search, date_from, date_to, after, page_size):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query("SELECT * FROM matches WHERE date < DATE('now') ORDER BY date DESC", conn)
-    except sqlite3.Error as e:
+        return get_storage().past_matches_page(tuple(teams), search, date_from, date_to, after, page_size)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os jogos anteriores: {e}")
-        return pd.DataFrame()
+        return []
 
 # Function to fetch all teams from the database
 def fetch_teams():
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query("SELECT name FROM teams", conn)['name'].tolist()
-    except sqlite3.Error as e:
+        return [team.name for team in get_storage().teams()]
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os escalões: {e}")
         return []
 
-# Function to fetch carpool information for a specific match
-def fetch_cars_for_match(match_id):
+# Function to fetch carpool information for a specific match, with the assigned athletes of each car
+def fetch_match_roster(match_id):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query(
-                "SELECT * FROM cars WHERE match_id = ?", conn, params=(match_id,)
-            )
-    except sqlite3.Error as e:
+        return get_storage().past_match_roster(match_id)
+    except StorageError as e:
         st.error(f"Ocorreu um erro ao buscar os carros: {e}")
-        return pd.DataFrame()
+        return [], {}
 
-# Function to fetch assigned athletes for a specific car
-def fetch_assigned_athletes(car_id):
+# Function to export the carpool history with the current filters, as the bytes of the file
+# (None if it failed). The rows are streamed to a temporary file, but st.download_button
+# can't serve a file in chunks: the finished file is held in memory until it's downloaded.
+# Exports too large for that are made with the command line (python exporter.py --output ...).
+def export_history(file_format, teams, date_from, date_to):
     try:
-        with sqlite3.connect('athletes.db') as conn:
-            return pd.read_sql_query(
-                '''
-                SELECT a.name, a.contact FROM athletes a
-                JOIN assignments ass ON a.id = ass.athlete_id
-                WHERE ass.car_id = ?
-                ''', conn, params=(car_id,)
-            )
-    except sqlite3.Error as e:
-        st.error(f"Ocorreu um erro ao buscar os atletas atribuídos: {e}")
-        return pd.DataFrame()
+        with export_to_tempfile(file_format, date_from, date_to, teams) as export_file:
+            return export_file.read()
+    except (ExportError, StorageError, sqlite3.Error) as e:
+        st.error(f"Ocorreu um erro ao exportar o histórico: {e}")
+        return None
 
 # Display the logo on the top of the page
 st.image("logo_aac.png", width=100)
@@ -62,47 +59,78 @@ team_options = fetch_teams()
 # Add filter to select teams
 st.write("### Filtrar Jogos Anteriores por Escalão")
 selected_teams = st.multiselect('Escolher Escalões', team_options)  # Default to all teams
-
-# Fetch the current list of past matches
-past_matches_df = fetch_past_matches()
-
-# Apply team filter to the match list
-if not past_matches_df.empty and selected_teams:
-    past_matches_df = past_matches_df[past_matches_df['team'].isin(selected_teams)]
+search = st.text_input('Procurar por Local').strip()
+from_col, to_col, size_col = st.columns([2, 2, 1])
+with from_col:
+    date_from = st.date_input('De', value=None, format='DD/MM/YYYY')
+with to_col:
+    date_to = st.date_input('Até', value=None, format='DD/MM/YYYY')
+with size_col:
+    page_size = st.selectbox('Jogos por Página', PAGE_SIZES, index=1)
+date_from = date_from.strftime('%Y-%m-%d') if date_from else None
+date_to = date_to.strftime('%Y-%m-%d') if date_to else None
+
+# Fetch only the current page of past matches; all filters are applied in the query
+after = current_cursor('past_matches', (tuple(selected_teams), search, date_from, date_to, page_size))
+past_matches_page = fetch_past_matches(selected_teams, search, date_from, date_to, after, page_size)
+past_matches = past_matches_page[:page_size]
 
 # Display the list of past matches
 st.write("### Lista de Jogos Anteriores")
 
 # Display match selection dropdown if matches are found
-if not past_matches_df.empty:
-    match_names = [f"{row['name']} ({row['team']}) - {pd.to_datetime(row['date']).strftime('%d/%m/%Y')}" for index, row in past_matches_df.iterrows()]
-    selected_match = st.selectbox('Escolha um Jogo para ver Detalhes', ["Escolha um Jogo"] + match_names)
+if past_matches:
+    # Build the labels for the whole page at once
+    match_labels = {match.id: f"{match.name} ({match.team}) - {format_date(match.date)}" for match in past_matches}
+    selected_match_id = st.selectbox(
+        'Escolha um Jogo para ver Detalhes', [None] + list(match_labels),
+        format_func=lambda match_id: "Escolha um Jogo" if match_id is None else match_labels[match_id]
+    )
 
     # If a match is selected, fetch and display detailed carpooling information
-    if selected_match != "Escolha um Jogo":
-        match_index = match_names.index(selected_match)
-        selected_match_id = past_matches_df.iloc[match_index]['id']
+    if selected_match_id is not None:
+        # Fetch carpooling information for the selected match only
+        cars, athletes_by_car = fetch_match_roster(selected_match_id)
 
-        # Fetch carpooling information for the selected match
-        cars_df = fetch_cars_for_match(selected_match_id)
-
-        if not cars_df.empty:
-            st.write(f"### Informação para {selected_match}")
-            for index, car in cars_df.iterrows():
+        if cars:
+            st.write(f"### Informação para {match_labels[selected_match_id]}")
+            for car in cars:
                 with st.container():
-                    st.write(f"**Condutor:** {car['driver']} ({car['contact']}) - **Lugares Disponíveis:** {car['seats']}")
+                    st.write(f"**Condutor:** {car.driver} ({car.contact}) - **Lugares Disponíveis:** {car.seats}")
 
-                    # Fetch assigned athletes for this car
-                    assigned_athletes_df = fetch_assigned_athletes(car['id'])
-                    if not assigned_athletes_df.empty:
+                    # Display the athletes assigned to this car
+                    assigned_athletes = athletes_by_car.get(car.id, [])
+                    if assigned_athletes:
                         st.write("Atletas:")
-                        for _, athlete in assigned_athletes_df.iterrows():
-                            st.write(f"- {athlete['name']} ({athlete['contact']})")
+                        for athlete in assigned_athletes:
+                            st.write(f"- {athlete.name} ({athlete.contact})")
 
                     # Add a divider for each car
                     st.markdown("---")
         else:
             st.write("Nenhuma informação de carpool encontrada para este jogo.")
 else:
-    st.write("Nenhum jogo anterior encontrado para os escalões selecionados.")
-    
\ No newline at end of file
+    st.write("Nenhum jogo anterior encontrado para os filtros selecionados.")
+
+# Buttons to move between pages
+page_navigation('past_matches', past_matches_page, page_size, ['date', 'id'])
+    
+
+# Export the matches, cars and athletes of the selected teams and dates
+st.write("### Exportar Histórico")
+format_col, download_col = st.columns([1, 3])
+with format_col:
+    export_format = st.selectbox('Formato', ['csv', 'parquet'], format_func=str.upper)
+with download_col:
+    # The export is built on request, in the page run (so it reads the club of the session
+    # and a failure is shown here instead of being downloaded)
+    if st.button("Preparar Exportação"):
+        export_file = export_history(export_format, selected_teams, date_from, date_to)
+        if export_file is not None:
+            st.download_button(
+                "Descarregar",
+                export_file,
+                file_name=f"historico.{export_format}",
+                mime='text/csv' if export_format == 'csv' else 'application/vnd.apache.parquet',
+                on_click='ignore',
+            )
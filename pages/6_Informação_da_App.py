@@ -1,12 +1,15 @@
 import streamlit as st
+from profiling import profile_page
+from tenants import require_login
+
+# Profile this rerun when profiling is enabled
+profile_page()
 
 # Display the logo on the top of the page
 st.image("logo_aac.png", width=100)
 
-# Ensure the user is authenticated
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
-    st.error("Por favor, faça login a partir da página inicial.")
-    st.stop()
+# Ensure the user is logged in to a club (every query then goes to the club's database)
+require_login()
 
 # Display the text in Portuguese
 st.write("""
@@ -0,0 +1,152 @@
+import streamlit as st
+import pandas as pd
+import hmac
+import os
+import sqlite3
+from instrumentation import SLOW_QUERY_MS, SLOW_QUERY_LOG, query_stats, reset_stats
+from profiling import PROFILE_DIR, profile_page, recent_profiles, top_functions
+from notifications import configured_channels, outbox_status
+from events import latest_events
+from archive import archive_finished_seasons
+from sqlite_storage import SQLiteStorage
+from storage import get_storage
+from tenants import require_login
+
+# Profile this rerun when profiling is enabled
+profile_page()
+
+# Ensure the user is logged in to a club (every query then goes to the club's database)
+require_login()
+
+# Display the logo on the top of the page
+st.image("logo_aac.png", width=100)
+
+# Only administrators can see this page (password set in AAC_ADMIN_PASSWORD)
+if not st.session_state.get('admin'):
+    admin_password = os.environ.get('AAC_ADMIN_PASSWORD')
+    if not admin_password:
+        st.error("A página de administração está desativada. Defina AAC_ADMIN_PASSWORD para a ativar.")
+        st.stop()
+    with st.form(key='admin_login_form'):
+        password = st.text_input('Password de Administração:', type='password')
+        if st.form_submit_button('Entrar'):
+            if hmac.compare_digest(password.encode('utf-8'), admin_password.encode('utf-8')):
+                st.session_state.admin = True
+                st.rerun()
+            else:
+                st.error('Password Incorreta.')
+    st.stop()
+
+# The outbox, the event log and the archive are kept by SQLite databases only
+sqlite_club = isinstance(get_storage(), SQLiteStorage)
+
+# Per-statement aggregates of the SQL run by this process, for every club it serves
+st.write("### Consultas SQL")
+st.write(
+    f"Consultas de todos os clubes servidos por este processo. Consultas acima de {SLOW_QUERY_MS:g} ms "
+    f"são registadas em `{SLOW_QUERY_LOG}`."
+)
+
+stats_df = pd.DataFrame(query_stats())
+if not stats_df.empty:
+    st.dataframe(
+        stats_df.rename(columns={
+            'sql': 'SQL', 'count': 'Execuções', 'total_ms': 'Total (ms)', 'p50_ms': 'p50 (ms)',
+            'p95_ms': 'p95 (ms)', 'rows': 'Linhas', 'pages': 'Páginas',
+        }),
+        hide_index=True,
+        column_config={
+            'Total (ms)': st.column_config.NumberColumn(format='%.1f'),
+            'p50 (ms)': st.column_config.NumberColumn(format='%.2f'),
+            'p95 (ms)': st.column_config.NumberColumn(format='%.2f'),
+        },
+    )
+else:
+    st.write("Ainda não foram executadas consultas.")
+
+col1, col2 = st.columns([1, 1])
+with col1:
+    if st.button("Atualizar", key='refresh_query_stats'):
+        st.rerun()
+with col2:
+    if st.button("Limpar", key='reset_query_stats'):
+        reset_stats()
+        st.rerun()
+
+# Notifications waiting in the outbox, sent and given up, per channel
+st.write("### Notificações")
+channels = configured_channels()
+if channels:
+    st.write(f"Canais ativos: {', '.join(channels)}.")
+else:
+    st.write("As notificações estão desativadas. Defina AAC_NOTIFY_CHANNELS para as ativar.")
+if not sqlite_club:
+    st.info("As notificações só estão disponíveis para clubes com base de dados SQLite.")
+else:
+    outbox_df = pd.DataFrame(outbox_status(), columns=['Canal', 'Pendentes', 'Enviadas', 'Falhadas'])
+    if not outbox_df.empty:
+        st.dataframe(outbox_df, hide_index=True)
+
+# Show the latest changes of the carpool from the append-only event log (see events.py)
+st.write("### Histórico do Carpool")
+EVENT_LABELS = {
+    'car_added': 'Carro adicionado', 'car_updated': 'Carro editado', 'car_deleted': 'Carro apagado',
+    'athlete_assigned': 'Atleta atribuído', 'athlete_removed': 'Atleta removido',
+}
+if not sqlite_club:
+    st.info("O histórico de alterações só está disponível para clubes com base de dados SQLite.")
+else:
+    events_df = pd.DataFrame(
+        [(event.seq, event.created_at, EVENT_LABELS.get(event.event, event.event), event.match_id, event.car_id,
+          event.data.get('athlete') or event.data.get('driver')) for event in latest_events()],
+        columns=['Seq', 'Data', 'Alteração', 'Jogo', 'Carro', 'Atleta / Condutor'],
+    )
+    if events_df.empty:
+        st.write("Ainda não há alterações registadas.")
+    else:
+        st.dataframe(events_df, hide_index=True)
+
+# Move the finished seasons out of the live tables (normally done by a scheduled job)
+st.write("### Arquivo")
+st.write("Os jogos de épocas terminadas passam para o arquivo, que continua visível em Jogos Antigos.")
+if not sqlite_club:
+    st.info("O arquivo só está disponível para clubes com base de dados SQLite.")
+elif st.button("Arquivar Épocas Terminadas", key='archive_seasons'):
+    try:
+        moved = archive_finished_seasons()
+        st.success(f"{moved['matches']} jogos, {moved['cars']} carros e {moved['assignments']} atribuições arquivados.")
+    except sqlite3.Error as e:
+        st.error(f"Ocorreu um erro ao arquivar as épocas: {e}")
+
+# Top functions of the page reruns profiled by this process
+st.write("### Perfis de Execução")
+st.write(
+    f"Ative com `AAC_PROFILE=1` ou, nesta sessão de administração, abrindo a app com `?profile=1`. Cada execução é guardada em "
+    f"`{PROFILE_DIR}/` no formato de pilhas colapsadas (speedscope, flamegraph.pl)."
+)
+
+profiles = recent_profiles()
+if profiles:
+    profiles_by_path = {profile['path']: profile for profile in profiles}
+    profile = profiles_by_path[st.selectbox(
+        'Escolher Execução',
+        list(profiles_by_path),
+        format_func=lambda path: (
+            f"{profiles_by_path[path]['started_at'].strftime('%H:%M:%S')} - {profiles_by_path[path]['page']} "
+            f"({profiles_by_path[path]['duration_ms']:.0f} ms, {profiles_by_path[path]['samples']} amostras)"
+        ),
+    )]
+    st.dataframe(
+        pd.DataFrame(top_functions(profile)).rename(columns={
+            'function': 'Função', 'self_pct': 'Própria (%)', 'total_pct': 'Total (%)',
+        }),
+        hide_index=True,
+        column_config={
+            'Própria (%)': st.column_config.NumberColumn(format='%.1f'),
+            'Total (%)': st.column_config.NumberColumn(format='%.1f'),
+        },
+    )
+    with open(profile['path'], 'rb') as f:
+        st.download_button("Descarregar Perfil", f.read(), file_name=os.path.basename(profile['path']))
+else:
+    st.write("Ainda não foram registados perfis.")
@@ -0,0 +1,61 @@
+import streamlit as st
+import sqlite3
+import pandas as pd
+from importer import ImportFileError, import_file
+from profiling import profile_page
+from tenants import require_login
+
+# Profile this rerun when profiling is enabled
+profile_page()
+
+# Ensure the user is logged in to a club (every query then goes to the club's database)
+require_login()
+
+# Display the logo on the top of the page
+st.image("logo_aac.png", width=100)
+
+KIND_LABELS = {'teams': 'Escalões', 'athletes': 'Atletas', 'matches': 'Jogos'}
+
+# Function to import an uploaded file, showing its report
+def run_import(kind, uploaded_file, dry_run):
+    try:
+        report = import_file(kind, uploaded_file, uploaded_file.name, dry_run)
+    except ImportFileError as e:
+        st.error(str(e))
+        return
+    except sqlite3.Error as e:
+        st.error(f"Ocorreu um erro ao importar os dados: {e}")
+        return
+
+    if dry_run:
+        st.info(f"Simulação: {report['imported']} de {report['rows']} linhas seriam importadas.")
+    else:
+        st.success(f"{report['imported']} de {report['rows']} linhas importadas com sucesso!")
+    if report['duplicates']:
+        st.write(f"{report['duplicates']} linhas ignoradas por já existirem.")
+    if report['errors']:
+        st.write(f"{len(report['errors'])} linhas com erros (não importadas):")
+        st.dataframe(
+            pd.DataFrame(report['errors']).rename(columns={'line': 'Linha', 'error': 'Erro'}),
+            hide_index=True,
+        )
+
+st.write("### Importar Dados")
+st.write("""
+Carregue um ficheiro CSV ou Excel (.xlsx) com o cabeçalho na primeira linha:
+- **Escalões**: `name`
+- **Atletas**: `name`, `contact`, `teams` (escalões separados por vírgulas)
+- **Jogos**: `name` (local), `date` (AAAA-MM-DD ou DD/MM/AAAA), `team`, `google_maps_link`
+
+Importe os escalões antes dos atletas e dos jogos. Linhas repetidas ou já existentes são ignoradas.
+""")
+
+with st.form(key='import_form'):
+    kind = st.selectbox('Tipo de Dados', list(KIND_LABELS), format_func=KIND_LABELS.get)
+    uploaded_file = st.file_uploader('Ficheiro', type=['csv', 'xlsx'])
+    dry_run = st.checkbox('Simulação (não guarda nada)', value=True)
+    if st.form_submit_button('Importar'):
+        if uploaded_file is None:
+            st.error("Escolha um ficheiro para importar.")
+        else:
+            run_import(kind, uploaded_file, dry_run)
@@ -0,0 +1,35 @@
+import streamlit as st
+
+# Page sizes offered in the lists
+PAGE_SIZES = [10, 25, 50, 100]
+
+
+# Function to get the cursor of the current page of a keyset-paginated list.
+# Each list keeps a stack of cursors (the sort key of the last row of every
+# previous page) in the session state, reset whenever its filters change.
+def current_cursor(key, filters):
+    state = st.session_state.setdefault(f'{key}_pagination', {'filters': None, 'cursors': [None]})
+    if state['filters'] != filters:
+        state['filters'] = filters
+        state['cursors'] = [None]
+    return state['cursors'][-1]
+
+
+# Function to show the previous/next page buttons below a list.
+# `page_rows` holds one row more than the page size when there is a next page.
+def page_navigation(key, page_rows, page_size, cursor_columns):
+    state = st.session_state[f'{key}_pagination']
+    has_next_page = len(page_rows) > page_size
+
+    button_col1, button_col2, info_col3 = st.columns([2, 2, 8])
+    with button_col1:
+        if st.button("Anterior", key=f"{key}_previous_page", disabled=len(state['cursors']) == 1):
+            state['cursors'].pop()
+            st.rerun()
+    with button_col2:
+        if st.button("Seguinte", key=f"{key}_next_page", disabled=not has_next_page):
+            last_row = page_rows[page_size - 1]
+            state['cursors'].append(tuple(getattr(last_row, column) for column in cursor_columns))
+            st.rerun()
+    with info_col3:
+        st.write(f"Página {len(state['cursors'])}")
@@ -0,0 +1,445 @@
+# PostgreSQL storage backend (see storage.py), for running several Streamlit replicas
+# behind a load balancer on one database server. Needs psycopg 3 with its pool
+# (pip install "psycopg[binary,pool]").
+#
+# Every replica keeps a pool of POOL_MIN_SIZE to POOL_MAX_SIZE connections. Reads are
+# not cached in the process, since another replica may have written in the meantime.
+# The tables are created on first use, mirroring the SQLite schema (dates are kept as
+# 'YYYY-MM-DD' text, as the pages expect).
+#
+# To try it against a local server:
+#   createdb carpool
+#   python benchmarks/run_benchmarks.py --storage postgresql://localhost/carpool
+
+import functools
+import sqlite3
+
+from rows import Team, Match, Athlete, Passenger, MatchSummary, group_roster
+from search import ACCENTED, PLAIN, search_terms
+from storage import Storage, StorageError
+
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+POOL_TIMEOUT = 10  # seconds waiting for a free connection
+
+_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS teams (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        name TEXT UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS athletes (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        name TEXT,
+        contact TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS athlete_teams (
+        athlete_id BIGINT NOT NULL REFERENCES athletes(id) ON DELETE CASCADE,
+        team_id BIGINT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+        PRIMARY KEY (athlete_id, team_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS matches (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        name TEXT,
+        date TEXT,
+        google_maps_link TEXT,
+        team TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS cars (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        match_id BIGINT REFERENCES matches(id),
+        driver TEXT,
+        contact TEXT,
+        seats INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS assignments (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        match_id BIGINT REFERENCES matches(id),
+        car_id BIGINT REFERENCES cars(id),
+        athlete_id BIGINT REFERENCES athletes(id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_athlete_teams_team ON athlete_teams (team_id, athlete_id)',
+    'CREATE INDEX IF NOT EXISTS idx_matches_team_date ON matches (team, date)',
+    'CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_athletes_name ON athletes (name, id)',
+    'CREATE INDEX IF NOT EXISTS idx_cars_match ON cars (match_id)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_assignments_match_athlete ON assignments (match_id, athlete_id)',
+    'CREATE INDEX IF NOT EXISTS idx_assignments_car ON assignments (car_id)',
+]
+
+# Columns copied by load_sqlite(), in foreign key order
+_TABLE_COLUMNS = [
+    ('teams', ('id', 'name')),
+    ('athletes', ('id', 'name', 'contact')),
+    ('athlete_teams', ('athlete_id', 'team_id')),
+    ('matches', ('id', 'name', 'date', 'google_maps_link', 'team')),
+    ('cars', ('id', 'match_id', 'driver', 'contact', 'seats')),
+    ('assignments', ('id', 'match_id', 'car_id', 'athlete_id')),
+]
+
+_TODAY = "to_char(CURRENT_DATE, 'YYYY-MM-DD')"
+
+_MATCHES_QUERY = 'SELECT id, name, date, google_maps_link, team FROM matches'
+_ATHLETES_QUERY = '''
+    SELECT a.id, a.name, a.contact,
+           (SELECT string_agg(t.name, ',') FROM athlete_teams atm
+            JOIN teams t ON t.id = atm.team_id
+            WHERE atm.athlete_id = a.id) AS teams
+    FROM athletes a
+'''
+
+
+# Function to get the condition keeping the athletes (as `a`) found by a search (see
+# search.py): every word must start a word of the name or contact without accents
+def _athlete_search(search, params):
+    conditions = []
+    for term in search_terms(search):
+        conditions.append("lower(translate(concat_ws(' ', a.name, a.contact), %s, %s)) ~ %s")
+        params.extend([ACCENTED, PLAIN, '(^|[^[:alnum:]])' + term])
+    return ' AND '.join(conditions) or None
+
+
+# Function to finish a keyset-paginated query, like db._keyset_page with psycopg placeholders
+def _keyset_page(query, conditions, params, sort_columns, after, descending, page_size):
+    if after is not None:
+        conditions.append(f"({', '.join(sort_columns)}) {'<' if descending else '>'} ({', '.join(['%s'] * len(after))})")
+        params.extend(after)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    direction = 'DESC' if descending else 'ASC'
+    # One extra row tells the page whether there is a next page
+    query += f" ORDER BY {', '.join(f'{column} {direction}' for column in sort_columns)} LIMIT {int(page_size) + 1}"
+    return query, params
+
+
+# Decorator turning psycopg errors into StorageError
+def _translate_errors(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except self._psycopg.Error as e:
+            raise StorageError(str(e).strip()) from e
+    return wrapper
+
+
+class PostgresStorage(Storage):
+    def __init__(self, url, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE):
+        try:
+            import psycopg
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise StorageError('O PostgreSQL precisa dos pacotes psycopg e psycopg_pool (pip install "psycopg[binary,pool]").')
+        self._psycopg = psycopg
+        self._pool = ConnectionPool(url, min_size=min_size, max_size=max_size, timeout=POOL_TIMEOUT, open=True)
+        try:
+            with self._pool.connection() as conn:
+                # Replicas starting together wait for each other instead of racing on CREATE TABLE
+                conn.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ('aac_schema',))
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+        except psycopg.Error as e:
+            self._pool.close()
+            raise StorageError(str(e).strip()) from e
+
+    # Function to close the connections of the pool (used by tests and scripts)
+    def close(self):
+        self._pool.close()
+
+    # Function to replace the tables with those of a SQLite database (e.g. one made by
+    # benchmarks/generate_data.py)
+    @_translate_errors
+    def load_sqlite(self, path):
+        source = sqlite3.connect(path)
+        try:
+            with self._transaction() as conn:
+                conn.execute('TRUNCATE assignments, cars, matches, athlete_teams, athletes, teams')
+                for table, columns in _TABLE_COLUMNS:
+                    rows = source.execute(f"SELECT {', '.join(columns)} FROM {table}").fetchall()
+                    with conn.cursor() as cursor:
+                        cursor.executemany(
+                            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})", rows
+                        )
+                    # New rows continue after the copied ids
+                    if 'id' in columns:
+                        conn.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                                     f"FROM {table}")
+        finally:
+            source.close()
+
+    # Function to run a read query and return its rows as records of the given type
+    def _query(self, record, query, params=()):
+        with self._pool.connection() as conn:
+            return [record._make(row) for row in conn.execute(query, list(params))]
+
+    # Function to run a write transaction: the pool commits when the block ends
+    # and rolls back if it raises
+    def _transaction(self):
+        return self._pool.connection()
+
+    # Function to run one statement of a transaction and return its cursor
+    @staticmethod
+    def _execute(conn, query, params=()):
+        return conn.execute(query, list(params))
+
+    @_translate_errors
+    def teams(self):
+        return self._query(Team, 'SELECT id, name FROM teams ORDER BY id')
+
+    @_translate_errors
+    def matches_page(self, teams=(), search='', after=None, page_size=25, descending=False):
+        conditions, params = [], []
+        if teams:
+            conditions.append('team = ANY(%s)')
+            params.append(list(teams))
+        if search:
+            conditions.append('strpos(lower(name), lower(%s)) > 0')
+            params.append(search)
+        query, params = _keyset_page(_MATCHES_QUERY,
+                                     conditions, params, ('date', 'id'), after, descending, page_size)
+        return self._query(Match, query, params)
+
+    @_translate_errors
+    def match(self, match_id):
+        return next(iter(self._query(Match, _MATCHES_QUERY + ' WHERE id = %s', (match_id,))), None)
+
+    @_translate_errors
+    def next_match(self, team):
+        return next(iter(self._query(Match, _MATCHES_QUERY + f'''
+            WHERE team = %s AND date >= {_TODAY} ORDER BY date, id LIMIT 1
+        ''', (team,))), None)
+
+    @_translate_errors
+    def past_matches_page(self, teams=(), search='', date_from=None, date_to=None, after=None, page_size=25):
+        conditions, params = [f'date < {_TODAY}'], []
+        if teams:
+            conditions.append('team = ANY(%s)')
+            params.append(list(teams))
+        if search:
+            conditions.append('strpos(lower(name), lower(%s)) > 0')
+            params.append(search)
+        if date_from:
+            conditions.append('date >= %s')
+            params.append(date_from)
+        if date_to:
+            conditions.append('date <= %s')
+            params.append(date_to)
+        query, params = _keyset_page(_MATCHES_QUERY,
+                                     conditions, params, ('date', 'id'), after, True, page_size)
+        return self._query(Match, query, params)
+
+    @_translate_errors
+    def athletes_page(self, teams=(), search='', after=None, page_size=25, descending=False):
+        conditions, params = [], []
+        if teams:
+            conditions.append('''
+                a.id IN (
+                    SELECT atm.athlete_id FROM athlete_teams atm
+                    JOIN teams t ON t.id = atm.team_id
+                    WHERE t.name = ANY(%s)
+                )
+            ''')
+            params.append(list(teams))
+        condition = _athlete_search(search, params)
+        if condition:
+            conditions.append(condition)
+        query, params = _keyset_page(_ATHLETES_QUERY, conditions, params, ('a.name', 'a.id'), after, descending, page_size)
+        return self._query(Athlete, query, params)
+
+    @_translate_errors
+    def athlete(self, athlete_id):
+        return next(iter(self._query(Athlete, _ATHLETES_QUERY + ' WHERE a.id = %s', (athlete_id,))), None)
+
+    @_translate_errors
+    def match_roster(self, match_id):
+        with self._pool.connection() as conn:
+            return group_roster(conn.execute('''
+                SELECT c.id, c.match_id, c.driver, c.contact, c.seats, a.id, a.name, a.contact
+                FROM cars c
+                LEFT JOIN assignments ass ON ass.car_id = c.id
+                LEFT JOIN athletes a ON a.id = ass.athlete_id
+                WHERE c.match_id = %s
+                ORDER BY c.id, ass.id
+            ''', [match_id]))
+
+    # Finished seasons stay in the live tables (archive.py only handles SQLite)
+    def past_match_roster(self, match_id):
+        return self.match_roster(match_id)
+
+    @_translate_errors
+    def available_athletes(self, match_id, team, search=''):
+        params = [team, match_id]
+        condition = _athlete_search(search, params)
+        return self._query(Passenger, f'''
+            SELECT a.id, a.name, a.contact FROM athletes a
+            JOIN athlete_teams atm ON atm.athlete_id = a.id
+            JOIN teams t ON t.id = atm.team_id
+            WHERE t.name = %s AND NOT EXISTS (
+                SELECT 1 FROM assignments ass WHERE ass.match_id = %s AND ass.athlete_id = a.id
+            ) {f'AND {condition}' if condition else ''}
+            ORDER BY a.name
+        ''', params)
+
+    @_translate_errors
+    def next_matches_overview(self):
+        return self._query(MatchSummary, f'''
+            WITH next_matches AS (
+                SELECT id, name, date, team, google_maps_link FROM (
+                    SELECT m.*, ROW_NUMBER() OVER (PARTITION BY team ORDER BY date, id) AS position
+                    FROM matches m
+                    WHERE date >= {_TODAY}
+                ) ranked
+                WHERE position = 1
+            )
+            SELECT t.name AS team, nm.id, nm.name, nm.date, nm.google_maps_link,
+                   (SELECT COUNT(*) FROM cars c WHERE c.match_id = nm.id) AS cars,
+                   (SELECT COALESCE(SUM(c.seats), 0) FROM cars c WHERE c.match_id = nm.id) AS free_seats,
+                   (SELECT COUNT(*) FROM assignments ass WHERE ass.match_id = nm.id) AS filled_seats,
+                   (SELECT COUNT(*) FROM athlete_teams atm
+                    WHERE atm.team_id = t.id AND NOT EXISTS (
+                        SELECT 1 FROM assignments ass WHERE ass.match_id = nm.id AND ass.athlete_id = atm.athlete_id
+                    )) AS unassigned
+            FROM teams t
+            LEFT JOIN next_matches nm ON nm.team = t.name
+            ORDER BY t.id
+        ''')
+
+    @_translate_errors
+    def add_team(self, name):
+        with self._transaction() as conn:
+            self._execute(conn, 'INSERT INTO teams (name) VALUES (%s)', (name,))
+
+    @_translate_errors
+    def rename_team(self, team_id, name):
+        with self._transaction() as conn:
+            # Matches store the team name, so rename it there too
+            self._execute(conn, 'UPDATE matches SET team = %s WHERE team = (SELECT name FROM teams WHERE id = %s)',
+                          (name, team_id))
+            self._execute(conn, 'UPDATE teams SET name = %s WHERE id = %s', (name, team_id))
+
+    @_translate_errors
+    def delete_team(self, team_id):
+        with self._transaction() as conn:
+            self._execute(conn, 'DELETE FROM teams WHERE id = %s', (team_id,))
+
+    # Function to link an athlete to the teams with the given names
+    def _set_athlete_teams(self, conn, athlete_id, teams):
+        self._execute(conn, 'DELETE FROM athlete_teams WHERE athlete_id = %s', (athlete_id,))
+        self._execute(conn, '''
+            INSERT INTO athlete_teams (athlete_id, team_id) SELECT %s, id FROM teams WHERE name = ANY(%s)
+        ''', (athlete_id, list(teams)))
+
+    @_translate_errors
+    def add_athlete(self, name, contact, teams):
+        with self._transaction() as conn:
+            athlete_id = self._execute(conn, 'INSERT INTO athletes (name, contact) VALUES (%s, %s) RETURNING id',
+                                       (name, contact)).fetchone()[0]
+            self._set_athlete_teams(conn, athlete_id, teams)
+
+    @_translate_errors
+    def update_athlete(self, athlete_id, name, contact, teams):
+        with self._transaction() as conn:
+            self._execute(conn, 'UPDATE athletes SET name = %s, contact = %s WHERE id = %s', (name, contact, athlete_id))
+            self._set_athlete_teams(conn, athlete_id, teams)
+
+    @_translate_errors
+    def delete_athlete(self, athlete_id):
+        with self._transaction() as conn:
+            # Give the seats back and remove the athlete's assignments first
+            self._execute(conn, '''
+                UPDATE cars SET seats = seats + 1
+                WHERE id IN (SELECT car_id FROM assignments WHERE athlete_id = %s)
+            ''', (athlete_id,))
+            self._execute(conn, 'DELETE FROM assignments WHERE athlete_id = %s', (athlete_id,))
+            self._execute(conn, 'DELETE FROM athletes WHERE id = %s', (athlete_id,))
+
+    @_translate_errors
+    def add_match(self, name, date, team, google_maps_link):
+        with self._transaction() as conn:
+            self._execute(conn, 'INSERT INTO matches (name, date, team, google_maps_link) VALUES (%s, %s, %s, %s)',
+                          (name, date, team, google_maps_link))
+
+    @_translate_errors
+    def update_match(self, match_id, name, date, team, google_maps_link):
+        with self._transaction() as conn:
+            self._execute(conn, 'UPDATE matches SET name = %s, date = %s, team = %s, google_maps_link = %s WHERE id = %s',
+                          (name, date, team, google_maps_link, match_id))
+
+    @_translate_errors
+    def delete_match(self, match_id):
+        with self._transaction() as conn:
+            self._execute(conn, 'DELETE FROM assignments WHERE match_id = %s', (match_id,))
+            self._execute(conn, 'DELETE FROM cars WHERE match_id = %s', (match_id,))
+            self._execute(conn, 'DELETE FROM matches WHERE id = %s', (match_id,))
+
+    @_translate_errors
+    def add_car(self, match_id, driver, contact, seats):
+        with self._transaction() as conn:
+            self._execute(conn, 'INSERT INTO cars (match_id, driver, contact, seats) VALUES (%s, %s, %s, %s)',
+                          (match_id, driver, contact, seats))
+
+    @_translate_errors
+    def update_car(self, car_id, driver, contact, seats, expected_seats):
+        with self._transaction() as conn:
+            self._execute(conn, 'UPDATE cars SET driver = %s, contact = %s WHERE id = %s', (driver, contact, car_id))
+            # Change the seats only if no athlete was seated or removed since the edit started
+            # (the row lock taken above makes concurrent replicas wait and recheck the seats)
+            if seats != expected_seats and self._execute(
+                conn, 'UPDATE cars SET seats = %s WHERE id = %s AND seats = %s', (seats, car_id, expected_seats)
+            ).rowcount == 0:
+                raise StorageError("os lugares do carro mudaram entretanto, tente novamente")
+
+    @_translate_errors
+    def delete_car(self, car_id):
+        with self._transaction() as conn:
+            self._execute(conn, 'DELETE FROM assignments WHERE car_id = %s', (car_id,))
+            self._execute(conn, 'DELETE FROM cars WHERE id = %s', (car_id,))
+
+    @_translate_errors
+    def assign_athlete(self, match_id, car_id, athlete_id):
+        with self._transaction() as conn:
+            # Remove athlete from any other car in the match, giving that seat back
+            self._execute(conn, '''
+                UPDATE cars SET seats = seats + 1
+                WHERE id IN (SELECT car_id FROM assignments WHERE match_id = %s AND athlete_id = %s)
+            ''', (match_id, athlete_id))
+            self._execute(conn, 'DELETE FROM assignments WHERE match_id = %s AND athlete_id = %s', (match_id, athlete_id))
+            # Decrease seats by 1, only if the car still has a free seat (the row lock
+            # makes concurrent replicas wait and recheck the seats)
+            if self._execute(conn, 'UPDATE cars SET seats = seats - 1 WHERE id = %s AND seats > 0', (car_id,)).rowcount == 0:
+                raise StorageError("o carro já não tem lugares disponíveis")
+            self._execute(conn, 'INSERT INTO assignments (match_id, car_id, athlete_id) VALUES (%s, %s, %s)',
+                          (match_id, car_id, athlete_id))
+
+    @_translate_errors
+    def remove_athlete(self, car_id, athlete_id):
+        with self._transaction() as conn:
+            # Increase seats by 1, unless someone else already removed the athlete
+            if self._execute(conn, 'DELETE FROM assignments WHERE car_id = %s AND athlete_id = %s',
+                             (car_id, athlete_id)).rowcount:
+                self._execute(conn, 'UPDATE cars SET seats = seats + 1 WHERE id = %s', (car_id,))
+
+    @_translate_errors
+    def assign_athletes(self, match_id, plan):
+        with self._transaction() as conn:
+            for athlete_id, car_id in plan:
+                # Skip athletes someone else assigned in the meantime
+                if self._execute(conn, '''
+                    INSERT INTO assignments (match_id, car_id, athlete_id) VALUES (%s, %s, %s)
+                    ON CONFLICT (match_id, athlete_id) DO NOTHING
+                ''', (match_id, car_id, athlete_id)).rowcount:
+                    # Undo everything if the seats were taken in the meantime
+                    if self._execute(conn, 'UPDATE cars SET seats = seats - 1 WHERE id = %s AND seats > 0',
+                                     (car_id,)).rowcount == 0:
+                        raise StorageError("os lugares dos carros mudaram entretanto, tente novamente")
@@ -0,0 +1,139 @@
+# Opt-in sampling profiler for page reruns.
+#
+# Enabled with the AAC_PROFILE=1 environment variable or, in a session logged in to
+# the Administração page, by opening the app with ?profile=1 (remembered for the rest
+# of the session; profiles are written to disk, so visitors can't turn it on). Each
+# page calls profile_page() right after its imports: a background thread then samples the
+# stack of the script thread until the page script returns, stops or reruns.
+#
+# Every rerun is saved as profiles/<page>/<timestamp>.folded in the collapsed
+# stack format ("frame;frame;frame count" per line), which speedscope, inferno
+# and flamegraph.pl load directly. The most recent profiles are also kept in
+# memory for the summary on the Administração page.
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+import streamlit as st
+
+PROFILE_DIR = os.environ.get('AAC_PROFILE_DIR', 'profiles')
+SAMPLE_INTERVAL = 0.001  # seconds between samples
+
+# Number of profiles kept in memory for the summary
+RECENT_PROFILES = 50
+
+_recent = deque(maxlen=RECENT_PROFILES)
+_recent_lock = threading.Lock()
+
+
+# Function to check whether this rerun should be profiled
+def profiling_enabled():
+    if os.environ.get('AAC_PROFILE') == '1':
+        return True
+    # Only administrators can turn it on for their session
+    if st.query_params.get('profile') == '1' and st.session_state.get('admin'):
+        st.session_state.profile = True
+    return st.session_state.get('profile', False)
+
+
+# Function to describe a frame as "function (file:line)"
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# Background thread sampling the stack of one page script run
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id, page_frame, page):
+        super().__init__(name=f'profiler-{page}', daemon=True)
+        self.thread_id = thread_id
+        # The frame of this run, not its code: Streamlit runs the same compiled page code
+        # again on the same thread for the next rerun
+        self.page_frame = page_frame
+        self.page = page
+        self.stacks = Counter()
+
+    # Stack of the script thread from the page script down, or None once the script is done
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            if frame is self.page_frame:
+                return tuple(reversed(stack))
+            frame = frame.f_back
+        return None
+
+    def run(self):
+        started_at = datetime.now()
+        start = time.perf_counter()
+        while True:
+            stack = self._sample()
+            if stack is None:
+                break
+            self.stacks[stack] += 1
+            time.sleep(SAMPLE_INTERVAL)
+        _save_profile(self.page, started_at, time.perf_counter() - start, self.stacks)
+
+
+# Function to write a profile to disk and keep its summary in memory
+def _save_profile(page, started_at, duration, stacks):
+    if not stacks:
+        return
+    page_dir = os.path.join(PROFILE_DIR, os.path.splitext(page)[0])
+    os.makedirs(page_dir, exist_ok=True)
+    path = os.path.join(page_dir, f"{started_at.strftime('%Y%m%d-%H%M%S-%f')}.folded")
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.items():
+            f.write(f"{';'.join(frame.replace(';', ',') for frame in stack)} {count}\n")
+
+    # Self samples count the leaf frame only, total samples every frame on the stack once
+    self_samples = Counter()
+    total_samples = Counter()
+    for stack, count in stacks.items():
+        self_samples[stack[-1]] += count
+        for frame in set(stack):
+            total_samples[frame] += count
+
+    with _recent_lock:
+        _recent.appendleft({
+            'page': page,
+            'started_at': started_at,
+            'duration_ms': duration * 1000,
+            'samples': sum(stacks.values()),
+            'path': path,
+            'self_samples': self_samples,
+            'total_samples': total_samples,
+        })
+
+
+# Function to profile the rest of the calling page script, if profiling is enabled
+def profile_page():
+    if not profiling_enabled():
+        return
+    caller = sys._getframe(1)
+    page = os.path.basename(caller.f_code.co_filename)
+    _Sampler(threading.get_ident(), caller, page).start()
+
+
+# Function to get the profiles recorded by this process, most recent first
+def recent_profiles():
+    with _recent_lock:
+        return list(_recent)
+
+
+# Function to get the top functions of a profile, by self samples
+def top_functions(profile, limit=20):
+    samples = profile['samples']
+    return [
+        {
+            'function': function,
+            'self_pct': 100 * count / samples,
+            'total_pct': 100 * profile['total_samples'][function] / samples,
+        }
+        for function, count in profile['self_samples'].most_common(limit)
+    ]
@@ -0,0 +1,88 @@
+# Compact records for the rows the pages read (see storage.py).
+#
+# The hot reads return lists of these typed named tuples instead of DataFrames: building
+# them is a cheap tuple per row (no per-row __dict__), fields are read as attributes
+# (match.name) and, being immutable, the cached records are shared by every session:
+# the cache (cache.py) only gives each caller a shallow copy of the list holding them.
+# pandas is only imported by the few places doing real tabular work (stats, imports).
+
+from datetime import date
+from typing import NamedTuple, Optional
+
+
+class Team(NamedTuple):
+    id: int
+    name: str
+
+
+class Match(NamedTuple):
+    id: int
+    name: str
+    date: str  # YYYY-MM-DD
+    google_maps_link: Optional[str]
+    team: str
+
+
+class Athlete(NamedTuple):
+    id: int
+    name: str
+    contact: str
+    teams: Optional[str]  # team names separated by commas
+
+
+class Car(NamedTuple):
+    id: int
+    match_id: int
+    driver: str
+    contact: str
+    seats: int  # free seats
+
+
+# An athlete seated in a car, or available for one
+class Passenger(NamedTuple):
+    id: int
+    name: str
+    contact: str
+
+
+# The next match of a team with its seat and athlete counts (match fields are None
+# for teams without an upcoming match)
+class MatchSummary(NamedTuple):
+    team: str
+    id: Optional[int]
+    name: Optional[str]
+    date: Optional[str]
+    google_maps_link: Optional[str]
+    cars: int
+    free_seats: int
+    filled_seats: int
+    unassigned: int
+
+
+# A change of the carpool from the event log (see events.py), `data` decoded from JSON
+class CarpoolEvent(NamedTuple):
+    seq: int
+    event: str
+    match_id: int
+    car_id: Optional[int]
+    athlete_id: Optional[int]
+    data: dict
+    created_at: str
+
+
+# Function to group the rows of a roster query (car columns followed by the athlete id,
+# name and contact) into the cars and a dict mapping each car id to its athletes
+def group_roster(rows):
+    cars, athletes_by_car = [], {}
+    for row in rows:
+        car = Car._make(row[:5])
+        if not cars or cars[-1].id != car.id:
+            cars.append(car)
+        if row[5] is not None:
+            athletes_by_car.setdefault(car.id, []).append(Passenger._make(row[5:]))
+    return cars, athletes_by_car
+
+
+# Function to show a YYYY-MM-DD date as DD/MM/YYYY
+def format_date(value):
+    return date.fromisoformat(value).strftime('%d/%m/%Y') if value else ''
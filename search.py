@@ -0,0 +1,34 @@
+# Accent-insensitive athlete search.
+#
+# What is typed is split into words without accents, and an athlete matches when
+# every word starts one of the words of their name or contact, so "joa ines" finds
+# "João Inês" and "912" finds "912 345 678". SQLite answers it from the FTS5 index
+# athletes_fts (see migrations.py); the other backends apply the same rules.
+
+import re
+import unicodedata
+
+# Words are runs of letters and digits, like the unicode61 tokenizer of FTS5
+_WORD = re.compile(r'[^\W_]+')
+
+# Accented letters and their plain forms, for databases folding accents in SQL
+ACCENTED = 'áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ'
+PLAIN = 'aaaaaeeeeiiiiooooouuuucnAAAAAEEEEIIIIOOOOOUUUUCN'
+
+
+# Function to split a text into lowercase words without accents
+def search_terms(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return _WORD.findall(''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower())
+
+
+# Function to build the FTS5 MATCH expression of a search: every word, quoted, as a
+# prefix. Empty if the search has no words.
+def fts_query(search):
+    return ' '.join(f'"{term}"*' for term in search_terms(search))
+
+
+# Function to check whether the words of a search all start a word of the given texts
+def matches_search(terms, *texts):
+    words = search_terms(' '.join(text or '' for text in texts))
+    return all(any(word.startswith(term) for word in words) for term in terms)
@@ -0,0 +1,237 @@
+# SQLite storage backend (see storage.py): a database file per club, read through the
+# cached functions of db.py and written in write transactions that also enqueue the
+# notifications of assignment changes (see notifications.py) and log the carpool
+# changes (see events.py).
+
+import functools
+import sqlite3
+
+from db import (
+    current_database, using_database, write_transaction, load_table_versions, load_teams, load_matches_page,
+    load_match, load_next_match, load_past_matches_page, load_athletes_page, load_athlete, load_match_roster,
+    load_past_match_roster, load_available_athletes, load_next_matches_overview, today,
+)
+from events import record_assignment_events, record_car_events
+from notifications import enqueue_assignment_changes, start_dispatcher
+from storage import Storage, StorageError
+
+
+# Decorator running a method on the database of the backend, turning SQLite errors into StorageError
+def _on_database(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            with using_database(self.path):
+                return method(self, *args, **kwargs)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+    return wrapper
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path=None):
+        self.path = path or current_database()
+
+    @_on_database
+    def teams(self):
+        return load_teams()
+
+    @_on_database
+    def matches_page(self, teams=(), search='', after=None, page_size=25, descending=False):
+        return load_matches_page(tuple(teams), search, after, page_size, descending)
+
+    @_on_database
+    def match(self, match_id):
+        return load_match(match_id)
+
+    @_on_database
+    def next_match(self, team):
+        return load_next_match(today(), team)
+
+    @_on_database
+    def past_matches_page(self, teams=(), search='', date_from=None, date_to=None, after=None, page_size=25):
+        return load_past_matches_page(today(), tuple(teams), search, date_from, date_to, after, page_size)
+
+    @_on_database
+    def athletes_page(self, teams=(), search='', after=None, page_size=25, descending=False):
+        return load_athletes_page(tuple(teams), search, after, page_size, descending)
+
+    @_on_database
+    def athlete(self, athlete_id):
+        return load_athlete(athlete_id)
+
+    @_on_database
+    def match_roster(self, match_id):
+        return load_match_roster(match_id)
+
+    @_on_database
+    def past_match_roster(self, match_id):
+        return load_past_match_roster(match_id)
+
+    @_on_database
+    def available_athletes(self, match_id, team, search=''):
+        return load_available_athletes(match_id, team, search)
+
+    @_on_database
+    def next_matches_overview(self):
+        return load_next_matches_overview(today())
+
+    # The change counters of the tables (see db.load_table_versions()): a check of
+    # PRAGMA data_version while nothing was written
+    @_on_database
+    def version(self, tables):
+        versions = load_table_versions()
+        return tuple(versions[table][0] for table in tables)
+
+    @_on_database
+    def add_team(self, name):
+        with write_transaction('teams') as conn:
+            conn.execute('INSERT INTO teams (name) VALUES (?)', (name,))
+
+    @_on_database
+    def rename_team(self, team_id, name):
+        with write_transaction('matches', 'teams') as conn:
+            # Matches store the team name, so rename it there too
+            conn.execute('UPDATE matches SET team = ? WHERE team = (SELECT name FROM teams WHERE id = ?)', (name, team_id))
+            conn.execute('UPDATE teams SET name = ? WHERE id = ?', (name, team_id))
+
+    @_on_database
+    def delete_team(self, team_id):
+        with write_transaction('athlete_teams', 'teams') as conn:
+            conn.execute('DELETE FROM teams WHERE id = ?', (team_id,))
+
+    # Function to link an athlete to the teams with the given names
+    @staticmethod
+    def _set_athlete_teams(conn, athlete_id, teams):
+        conn.execute('DELETE FROM athlete_teams WHERE athlete_id = ?', (athlete_id,))
+        conn.executemany(
+            'INSERT INTO athlete_teams (athlete_id, team_id) SELECT ?, id FROM teams WHERE name = ?',
+            [(athlete_id, team) for team in teams]
+        )
+
+    @_on_database
+    def add_athlete(self, name, contact, teams):
+        with write_transaction('athletes', 'athlete_teams') as conn:
+            athlete_id = conn.execute('INSERT INTO athletes (name, contact) VALUES (?, ?)', (name, contact)).lastrowid
+            self._set_athlete_teams(conn, athlete_id, teams)
+
+    @_on_database
+    def update_athlete(self, athlete_id, name, contact, teams):
+        with write_transaction('athletes', 'athlete_teams') as conn:
+            conn.execute('UPDATE athletes SET name = ?, contact = ? WHERE id = ?', (name, contact, athlete_id))
+            self._set_athlete_teams(conn, athlete_id, teams)
+
+    @_on_database
+    def delete_athlete(self, athlete_id):
+        with write_transaction('cars', 'assignments', 'athlete_teams', 'athletes') as conn:
+            # Give the seats back and remove the athlete's assignments first (foreign keys are enforced)
+            conn.execute('''
+                UPDATE cars SET seats = seats + 1
+                WHERE id IN (SELECT car_id FROM assignments WHERE athlete_id = ?)
+            ''', (athlete_id,))
+            enqueue_assignment_changes(conn, 'removed', 's.athlete_id = ?', (athlete_id,))
+            record_assignment_events(conn, 'athlete_removed', 's.athlete_id = ?', (athlete_id,))
+            conn.execute('DELETE FROM assignments WHERE athlete_id = ?', (athlete_id,))
+            conn.execute('DELETE FROM athletes WHERE id = ?', (athlete_id,))
+
+    @_on_database
+    def add_match(self, name, date, team, google_maps_link):
+        with write_transaction('matches') as conn:
+            conn.execute('INSERT INTO matches (name, date, team, google_maps_link) VALUES (?, ?, ?, ?)',
+                         (name, date, team, google_maps_link))
+
+    @_on_database
+    def update_match(self, match_id, name, date, team, google_maps_link):
+        with write_transaction('matches') as conn:
+            conn.execute('UPDATE matches SET name = ?, date = ?, team = ?, google_maps_link = ? WHERE id = ?',
+                         (name, date, team, google_maps_link, match_id))
+
+    @_on_database
+    def delete_match(self, match_id):
+        with write_transaction('assignments', 'cars', 'matches') as conn:
+            # Remove the cars and assignments of this match first (foreign keys are enforced)
+            enqueue_assignment_changes(conn, 'removed', 's.match_id = ?', (match_id,))
+            record_assignment_events(conn, 'athlete_removed', 's.match_id = ?', (match_id,))
+            record_car_events(conn, 'car_deleted', 'c.match_id = ?', (match_id,))
+            conn.execute('DELETE FROM assignments WHERE match_id = ?', (match_id,))
+            conn.execute('DELETE FROM cars WHERE match_id = ?', (match_id,))
+            conn.execute('DELETE FROM matches WHERE id = ?', (match_id,))
+
+    @_on_database
+    def add_car(self, match_id, driver, contact, seats):
+        with write_transaction('cars') as conn:
+            car_id = conn.execute('INSERT INTO cars (match_id, driver, contact, seats) VALUES (?, ?, ?, ?)',
+                                  (match_id, driver, contact, seats)).lastrowid
+            record_car_events(conn, 'car_added', 'c.id = ?', (car_id,))
+
+    @_on_database
+    def update_car(self, car_id, driver, contact, seats, expected_seats):
+        with write_transaction('cars') as conn:
+            conn.execute('UPDATE cars SET driver = ?, contact = ? WHERE id = ?', (driver, contact, car_id))
+            # Change the seats only if no athlete was seated or removed since the edit started
+            if seats != expected_seats and conn.execute(
+                'UPDATE cars SET seats = ? WHERE id = ? AND seats = ?', (seats, car_id, expected_seats)
+            ).rowcount == 0:
+                raise StorageError("os lugares do carro mudaram entretanto, tente novamente")
+            record_car_events(conn, 'car_updated', 'c.id = ?', (car_id,))
+
+    @_on_database
+    def delete_car(self, car_id):
+        with write_transaction('assignments', 'cars') as conn:
+            # Remove all assignments related to this car
+            enqueue_assignment_changes(conn, 'removed', 's.car_id = ?', (car_id,))
+            record_assignment_events(conn, 'athlete_removed', 's.car_id = ?', (car_id,))
+            record_car_events(conn, 'car_deleted', 'c.id = ?', (car_id,))
+            conn.execute('DELETE FROM assignments WHERE car_id = ?', (car_id,))
+            conn.execute('DELETE FROM cars WHERE id = ?', (car_id,))
+
+    @_on_database
+    def assign_athlete(self, match_id, car_id, athlete_id):
+        with write_transaction('assignments', 'cars') as conn:
+            # Remove athlete from any other car in the match, giving that seat back
+            conn.execute('''
+                UPDATE cars SET seats = seats + 1
+                WHERE id IN (SELECT car_id FROM assignments WHERE match_id = ? AND athlete_id = ?)
+            ''', (match_id, athlete_id))
+            enqueue_assignment_changes(conn, 'removed', 's.match_id = ? AND s.athlete_id = ?', (match_id, athlete_id))
+            record_assignment_events(conn, 'athlete_removed', 's.match_id = ? AND s.athlete_id = ?', (match_id, athlete_id))
+            conn.execute('DELETE FROM assignments WHERE match_id = ? AND athlete_id = ?', (match_id, athlete_id))
+            # Decrease seats by 1, only if the car still has a free seat
+            if conn.execute('UPDATE cars SET seats = seats - 1 WHERE id = ? AND seats > 0', (car_id,)).rowcount == 0:
+                raise StorageError("o carro já não tem lugares disponíveis")
+            assignment_id = conn.execute(
+                'INSERT INTO assignments (match_id, car_id, athlete_id) VALUES (?, ?, ?)', (match_id, car_id, athlete_id)
+            ).lastrowid
+            enqueue_assignment_changes(conn, 'assigned', 's.id = ?', (assignment_id,))
+            record_assignment_events(conn, 'athlete_assigned', 's.id = ?', (assignment_id,))
+
+    @_on_database
+    def remove_athlete(self, car_id, athlete_id):
+        with write_transaction('assignments', 'cars') as conn:
+            enqueue_assignment_changes(conn, 'removed', 's.car_id = ? AND s.athlete_id = ?', (car_id, athlete_id))
+            record_assignment_events(conn, 'athlete_removed', 's.car_id = ? AND s.athlete_id = ?', (car_id, athlete_id))
+            # Increase seats by 1, unless someone else already removed the athlete
+            if conn.execute('DELETE FROM assignments WHERE car_id = ? AND athlete_id = ?', (car_id, athlete_id)).rowcount:
+                conn.execute('UPDATE cars SET seats = seats + 1 WHERE id = ?', (car_id,))
+
+    @_on_database
+    def assign_athletes(self, match_id, plan):
+        with write_transaction('assignments', 'cars') as conn:
+            for athlete_id, car_id in plan:
+                # Skip athletes someone else assigned in the meantime
+                c = conn.execute('''
+                    INSERT INTO assignments (match_id, car_id, athlete_id)
+                    SELECT ?, ?, ? WHERE NOT EXISTS (
+                        SELECT 1 FROM assignments WHERE match_id = ? AND athlete_id = ?
+                    )
+                ''', (match_id, car_id, athlete_id, match_id, athlete_id))
+                if c.rowcount:
+                    enqueue_assignment_changes(conn, 'assigned', 's.id = ?', (c.lastrowid,))
+                    record_assignment_events(conn, 'athlete_assigned', 's.id = ?', (c.lastrowid,))
+                    # Undo everything if the seats were taken in the meantime
+                    if conn.execute('UPDATE cars SET seats = seats - 1 WHERE id = ? AND seats > 0', (car_id,)).rowcount == 0:
+                        raise StorageError("os lugares dos carros mudaram entretanto, tente novamente")
+
+    def start_workers(self):
+        with using_database(self.path):
+            start_dispatcher()
@@ -0,0 +1,127 @@
+# Registry of the clubs (tenants) served by this deployment.
+#
+# Every club has its own database file, so one Streamlit process can host several
+# clubs: the club chosen at login is kept in the session and db.py routes every
+# connection, connection pool and cache namespace to that club's database.
+#
+# The registry is a JSON file (AAC_TENANTS_FILE, default tenants.json) such as:
+#   {
+#     "aac": {"name": "AAC", "database": "athletes.db", "password_salt": "...", "password_scrypt": "..."},
+#     "fcp": {"name": "FC Porto", "database": "clubs/fcp.db", "password_salt": "...", "password_scrypt": "..."}
+#   }
+# with the salted scrypt hash of each club's password, printed by: python tenants.py
+# "database" can also be a postgresql:// URL or memory://name (see storage.py).
+# Without the file a single club using athletes.db with the password 'aac' is served,
+# as before the registry existed.
+
+import argparse
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import warnings
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from db import DB_PATH, set_database_provider, use_database
+from storage import StorageError
+
+# Cost of the scrypt hash of the passwords (about 16 MB and 50 ms per hash)
+SCRYPT_PARAMS = {'n': 2 ** 14, 'r': 8, 'p': 1}
+
+
+# Function to hash a password with a new random salt, as the fields of a registry entry
+def hash_password(password):
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, **SCRYPT_PARAMS)
+    return {'password_salt': salt.hex(), 'password_scrypt': digest.hex()}
+
+
+DEFAULT_TENANTS = {
+    'aac': {'name': 'AAC', 'database': DB_PATH, **hash_password('aac')},
+}
+
+_registry = None
+
+# Passwords already checked by this process, so API clients sending them with every
+# request don't pay for scrypt each time. Kept as digests under a key of this process.
+_verified = set()
+_verified_key = os.urandom(32)
+
+
+# Function to load the registry of clubs, once per process
+def load_tenants():
+    global _registry
+    if _registry is None:
+        path = os.environ.get('AAC_TENANTS_FILE', 'tenants.json')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                _registry = json.load(f)
+        else:
+            _registry = DEFAULT_TENANTS
+    return _registry
+
+
+# Function to check the password of a club
+def check_password(tenant, password):
+    entry = load_tenants()[tenant]
+    stored = entry.get('password_scrypt', entry.get('password_sha256'))
+    verified = hmac.new(_verified_key, f'{tenant}\0{stored}\0{password}'.encode('utf-8'), 'sha256').digest()
+    if verified in _verified:
+        return True
+    if 'password_scrypt' in entry:
+        digest = hashlib.scrypt(password.encode('utf-8'), salt=bytes.fromhex(entry['password_salt']), **SCRYPT_PARAMS)
+        valid = hmac.compare_digest(digest.hex(), entry['password_scrypt'])
+    else:
+        # Registries written before the salted hashes
+        warnings.warn(f"The password of club '{tenant}' is an unsalted SHA-256 hash: replace it with "
+                      "the output of 'python tenants.py'")
+        valid = hmac.compare_digest(hashlib.sha256(password.encode('utf-8')).hexdigest(), entry['password_sha256'])
+    if valid:
+        _verified.add(verified)
+    return valid
+
+
+# Function to get the database file of a club
+def tenant_database(tenant):
+    return load_tenants()[tenant]['database']
+
+
+# Function to make the current thread work on the database of a club (scripts and workers)
+def use_tenant(tenant):
+    use_database(tenant_database(tenant))
+
+
+# Function to stop the page unless the session is logged in to a club of the registry
+def require_login():
+    if not st.session_state.get('authenticated') or st.session_state.get('tenant') not in load_tenants():
+        st.error("Por favor, faça login a partir da página inicial.")
+        st.stop()
+
+
+# Function to find the database of the club logged in to the current Streamlit session,
+# for threads that didn't choose one with use_database(). Without a club, the default
+# database (athletes.db) is only used when there is no registry: with several clubs it
+# may hold the data of another one.
+def _session_database():
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        tenant = st.session_state.get('tenant')
+        if tenant in load_tenants():
+            return tenant_database(tenant)
+    if load_tenants() is DEFAULT_TENANTS:
+        return None
+    raise StorageError("Nenhum clube escolhido. Faça login a partir da página inicial.")
+
+
+set_database_provider(_session_database)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the password fields of a club for the registry')
+    parser.parse_args()
+    password = getpass.getpass('Password do clube: ')
+    if password != getpass.getpass('Repita a password: '):
+        parser.exit(1, 'As passwords não coincidem.\n')
+    print(json.dumps(hash_password(password)))
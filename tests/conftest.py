@@ -0,0 +1,56 @@
+# Fixtures shared by the tests: a fresh, empty storage backend per test (see storage.py).
+# The PostgreSQL backend is tested too when AAC_TEST_POSTGRES_URL names a database that
+# can be emptied (e.g. postgresql://localhost/carpool_test).
+
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import StorageError, get_storage  # noqa: E402
+
+BACKENDS = ['sqlite', 'memory', 'postgres']
+
+
+@pytest.fixture(params=BACKENDS)
+def storage(request, tmp_path):
+    sqlite_path = str(tmp_path / 'athletes.db')
+    if request.param == 'sqlite':
+        yield get_storage(sqlite_path)
+    elif request.param == 'memory':
+        yield get_storage(f'memory://{request.node.name}')
+    else:
+        url = os.environ.get('AAC_TEST_POSTGRES_URL')
+        if not url:
+            pytest.skip('AAC_TEST_POSTGRES_URL is not set')
+        from postgres_storage import PostgresStorage
+        try:
+            postgres = PostgresStorage(url)
+        except StorageError as e:
+            pytest.skip(f'PostgreSQL is not available: {e}')
+        # Start from empty tables, copied from a new SQLite database
+        get_storage(sqlite_path).teams()
+        postgres.load_sqlite(sqlite_path)
+        yield postgres
+        postgres.close()
+
+
+# Function to add a team with athletes and a match in a few days, returning the match id
+# and the athlete ids
+def seed_match(storage, athletes=3, team='Sub-13'):
+    storage.add_team(team)
+    for number in range(athletes):
+        storage.add_athlete(f'Atleta {number}', f'91{number:07d}', [team])
+    storage.add_match('Porto', (date.today() + timedelta(days=3)).isoformat(), team, '')
+    match = storage.next_match(team)
+    return match.id, [athlete.id for athlete in storage.available_athletes(match.id, team)]
+
+
+# Function to add a car to a match, returning it
+def add_car(storage, match_id, seats, driver='Pai', contact='99'):
+    storage.add_car(match_id, driver, contact, seats)
+    cars, _ = storage.match_roster(match_id)
+    return max(cars, key=lambda car: car.id)
@@ -0,0 +1,138 @@
+# The read-only JSON API (api.py), served on a free port from a registry of one club
+
+import base64
+import json
+import sqlite3
+import threading
+from datetime import date, timedelta
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import api
+import tenants
+from storage import get_storage
+
+PASSWORD = 'segredo'
+
+
+@pytest.fixture
+def club(tmp_path, monkeypatch):
+    database = str(tmp_path / 'club.db')
+    registry = tmp_path / 'tenants.json'
+    registry.write_text(json.dumps({'club': {
+        'name': 'Clube', 'database': database, **tenants.hash_password(PASSWORD),
+    }}))
+    monkeypatch.setenv('AAC_TENANTS_FILE', str(registry))
+    monkeypatch.setattr(tenants, '_registry', None)
+    storage = get_storage(database)
+    storage.add_team('Sub-13')
+    yield database, storage
+
+
+@pytest.fixture
+def server(club):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), api.ApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# Function to send a GET request to the API, returning the response and its JSON body
+def _get(server, path, headers=None, user='club', password=PASSWORD):
+    headers = dict(headers or {})
+    if user is not None:
+        headers['Authorization'] = 'Basic ' + base64.b64encode(f'{user}:{password}'.encode()).decode()
+    conn = HTTPConnection(*server.server_address, timeout=5)
+    conn.request('GET', path, headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, json.loads(body) if body else None
+
+
+# Function to move the last change of every table back in time, as if it was long ago
+def _age_changes(database, seconds=60):
+    conn = sqlite3.connect(database)
+    with conn:
+        conn.execute('UPDATE table_changes SET changed_at = changed_at - ?', (seconds,))
+    conn.close()
+
+
+def test_authentication(server):
+    assert _get(server, '/api/club/teams', user=None)[0].status == 401
+    assert _get(server, '/api/club/teams', password='errada')[0].status == 401
+    response, body = _get(server, '/api/club/teams', user='outro')
+    assert response.status == 401
+    assert response.getheader('WWW-Authenticate').startswith('Basic')
+    assert _get(server, '/api/outro/teams')[0].status == 404
+
+    response, body = _get(server, '/api/club/teams')
+    assert response.status == 200
+    assert [team['name'] for team in body['teams']] == ['Sub-13']
+
+
+def test_etag(server, club):
+    database, storage = club
+    response, _ = _get(server, '/api/club/teams')
+    etag = response.getheader('ETag')
+    response, body = _get(server, '/api/club/teams', {'If-None-Match': etag})
+    assert (response.status, body) == (304, None)
+
+    storage.add_team('Sub-15')
+    response, body = _get(server, '/api/club/teams', {'If-None-Match': etag})
+    assert response.status == 200
+    assert len(body['teams']) == 2
+    assert response.getheader('ETag') != etag
+
+
+def test_last_modified(server, club):
+    database, storage = club
+    # A change in the current second may be followed by another with the same time
+    assert _get(server, '/api/club/teams')[0].getheader('Last-Modified') is None
+
+    _age_changes(database)
+    last_modified = _get(server, '/api/club/teams')[0].getheader('Last-Modified')
+    assert last_modified
+    assert _get(server, '/api/club/teams', {'If-Modified-Since': last_modified})[0].status == 304
+
+    storage.add_team('Sub-15')
+    assert _get(server, '/api/club/teams', {'If-Modified-Since': last_modified})[0].status == 200
+
+
+def test_past_matches_pages(server, club):
+    database, storage = club
+    for days in range(1, 6):
+        storage.add_match(f'Jogo {days}', (date.today() - timedelta(days=days)).isoformat(), 'Sub-13', '')
+
+    names, path = [], '/api/club/matches/past?limit=2'
+    while path:
+        response, body = _get(server, path)
+        assert response.status == 200
+        assert len(body['matches']) <= 2
+        names += [match['name'] for match in body['matches']]
+        path = body['next'] and f"/api/club/matches/past?limit=2&after={body['next']}"
+    assert names == [f'Jogo {days}' for days in range(1, 6)]
+
+
+@pytest.mark.parametrize('limit', ['-2', '-1', '0', str(api.MAX_PAGE_SIZE + 1), 'dez'])
+def test_bad_limit(server, limit):
+    response, body = _get(server, f'/api/club/matches/past?limit={limit}')
+    assert response.status == 400
+    assert "'limit'" in body['error']
+
+
+def test_bad_parameters(server):
+    assert _get(server, '/api/club/matches/99999999999999999999999/roster')[0].status == 400
+    assert _get(server, '/api/club/matches/past?after=2024-01-01,x')[0].status == 400
+
+
+def test_internal_error(server, monkeypatch):
+    def broken_storage(location):
+        raise RuntimeError('broken')
+    monkeypatch.setattr(api, 'get_storage', broken_storage)
+    response, body = _get(server, '/api/club/teams')
+    assert (response.status, body) == (500, {'error': 'internal error'})
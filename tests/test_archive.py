@@ -0,0 +1,125 @@
+# Moving finished seasons to the archive database (archive.py) and reading them back
+
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+
+import archive
+from conftest import add_car
+from db import archive_path, using_database
+from storage import get_storage
+
+
+@pytest.fixture
+def club(tmp_path):
+    path = str(tmp_path / 'club.db')
+    storage = get_storage(path)
+    storage.add_team('Sub-13')
+    for number in range(3):
+        storage.add_athlete(f'Atleta {number}', f'91{number:07d}', ['Sub-13'])
+    athletes = [athlete.id for athlete in storage.athletes_page()]
+    # Two matches of an old season with cars and athletes, and one of this season
+    for name, day in [('Braga', '2023-10-01'), ('Porto', '2024-03-01'), ('Faro', (date.today() - timedelta(days=1)).isoformat())]:
+        storage.add_match(name, day, 'Sub-13', '')
+        match = storage.past_matches_page(search=name)[0]
+        car = add_car(storage, match.id, 3)
+        storage.assign_athlete(match.id, car.id, athletes[0])
+        storage.assign_athlete(match.id, car.id, athletes[1])
+    yield path, storage
+
+
+# Function to read every past match with its roster, as the history page shows them
+def _history(storage):
+    return [
+        (match, storage.past_match_roster(match.id))
+        for match in storage.past_matches_page(page_size=100)
+    ]
+
+
+# Function to count the rows of a table in the live and in the archive database
+def _counts(path, table):
+    counts = []
+    for database in (path, archive_path(path)):
+        conn = sqlite3.connect(database)
+        counts.append(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0])
+        conn.close()
+    return tuple(counts)
+
+
+def test_archive_and_read_back(club):
+    path, storage = club
+    before = _history(storage)
+
+    with using_database(path):
+        moved = archive.archive_before('2024-08-01')
+    assert moved == {'matches': 2, 'cars': 2, 'assignments': 4}
+    assert _counts(path, 'matches') == (1, 2)
+    assert _counts(path, 'cars') == (1, 2)
+    assert _counts(path, 'assignments') == (2, 4)
+    # The archived seasons read back exactly as they were
+    assert _history(storage) == before
+
+    with using_database(path):
+        assert archive.archive_before('2024-08-01') == {'matches': 0, 'cars': 0, 'assignments': 0}
+    assert _history(storage) == before
+
+
+def test_interrupted_archive(club, monkeypatch):
+    path, storage = club
+    before = _history(storage)
+
+    # Crash after the copy to the archive committed, before the rows left the live database
+    transaction, calls = archive.write_transaction, []
+
+    @contextmanager
+    def crashing_transaction(*tables):
+        calls.append(tables)
+        if len(calls) == 2:
+            raise RuntimeError('crash')
+        with transaction(*tables) as conn:
+            yield conn
+
+    monkeypatch.setattr(archive, 'write_transaction', crashing_transaction)
+    with using_database(path), pytest.raises(RuntimeError):
+        archive.archive_before('2024-08-01')
+    assert _counts(path, 'matches') == (3, 2)
+    # Rows in both databases are read once
+    assert _history(storage) == before
+
+    monkeypatch.setattr(archive, 'write_transaction', transaction)
+    with using_database(path):
+        archive.archive_before('2024-08-01')
+    assert _counts(path, 'matches') == (1, 2)
+    assert _counts(path, 'assignments') == (2, 4)
+    assert _history(storage) == before
+
+
+def test_rows_added_while_archiving_stay_live(club, monkeypatch):
+    path, storage = club
+    old_match = storage.past_matches_page(search='Porto')[0]
+
+    # A car is added to an old match between the copy and the delete
+    transaction, calls = archive.write_transaction, []
+
+    @contextmanager
+    def late_car_transaction(*tables):
+        calls.append(tables)
+        if len(calls) == 2:
+            add_car(storage, old_match.id, 2, driver='Tio')
+        with transaction(*tables) as conn:
+            yield conn
+
+    monkeypatch.setattr(archive, 'write_transaction', late_car_transaction)
+    with using_database(path):
+        archive.archive_before('2024-08-01')
+    assert _counts(path, 'matches') == (2, 2)
+    assert [car.driver for car in storage.past_match_roster(old_match.id)[0]] == ['Pai', 'Tio']
+
+    monkeypatch.setattr(archive, 'write_transaction', transaction)
+    with using_database(path):
+        archive.archive_before('2024-08-01')
+    assert _counts(path, 'matches') == (1, 2)
+    assert _counts(path, 'cars') == (1, 3)
+    assert [car.driver for car in storage.past_match_roster(old_match.id)[0]] == ['Pai', 'Tio']
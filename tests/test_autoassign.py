@@ -0,0 +1,94 @@
+# Automatic assignment of athletes to cars (autoassign.py)
+
+from collections import Counter
+
+from autoassign import plan_assignments
+from conftest import add_car, seed_match
+
+
+# Functions to build the dicts plan_assignments works on
+def _athlete(athlete_id, contact=''):
+    return {'id': athlete_id, 'contact': contact}
+
+
+def _car(car_id, seats, contact=''):
+    return {'id': car_id, 'contact': contact, 'seats': seats}
+
+
+# Function to check that no car of a plan gets more athletes than its free seats
+def _assert_fits(plan, cars):
+    taken = Counter(car_id for _, car_id in plan)
+    for car in cars:
+        assert taken[car['id']] <= car['seats']
+
+
+def test_empty_pool():
+    assert plan_assignments([], [_car(1, 4)]) == ([], [])
+    athletes = [_athlete(1), _athlete(2)]
+    assert plan_assignments(athletes, []) == ([], athletes)
+    # Cars whose seats are all taken don't count
+    assert plan_assignments(athletes, [_car(1, 0), _car(2, '0')]) == ([], athletes)
+
+
+def test_seats_already_taken():
+    # `seats` is what is left after the athletes already in the car
+    cars = [_car(1, 1), _car(2, 2)]
+    plan, unassigned = plan_assignments([_athlete(number) for number in range(1, 5)], cars)
+    _assert_fits(plan, cars)
+    assert len(plan) == 3
+    assert len(unassigned) == 1
+
+
+def test_more_athletes_than_seats():
+    athletes = [_athlete(number, f'91{number}') for number in range(1, 8)]
+    cars = [_car(1, 3), _car(2, 2)]
+    plan, unassigned = plan_assignments(athletes, cars)
+    _assert_fits(plan, cars)
+    assert len(plan) == 5
+    # Every athlete is either seated once or left out
+    seated = [athlete_id for athlete_id, _ in plan]
+    assert sorted(seated + [athlete['id'] for athlete in unassigned]) == list(range(1, 8))
+    assert len(set(seated)) == len(seated)
+
+
+def test_siblings_travel_together():
+    athletes = [_athlete(1, '912 345 678'), _athlete(2, '111'), _athlete(3, '912345678')]
+    cars = [_car(10, 1), _car(20, 2)]
+    plan = dict(plan_assignments(athletes, cars)[0])
+    assert plan[1] == plan[3] == 20
+    assert plan[2] == 10
+
+    # Siblings that fit nowhere whole are split across the emptiest cars
+    plan, unassigned = plan_assignments([_athlete(number, '999') for number in range(1, 4)], [_car(1, 2), _car(2, 1)])
+    assert sorted(car_id for _, car_id in plan) == [1, 1, 2]
+    assert unassigned == []
+
+
+def test_own_driver_first():
+    athletes = [_athlete(1, '111'), _athlete(2, '222')]
+    cars = [_car(10, 1, '222'), _car(20, 1, '333')]
+    assert dict(plan_assignments(athletes, cars)[0]) == {2: 10, 1: 20}
+    # Without the preference, the order of the groups decides
+    plan = dict(plan_assignments(athletes, cars, keep_siblings_together=False, prefer_own_driver=False)[0])
+    assert sorted(plan.values()) == [10, 20]
+
+
+def test_plan_confirmed_after_changes(storage):
+    # Plans are previewed before they are confirmed: athletes seated by someone else in
+    # the meantime are skipped and the seats stay consistent
+    match_id, athletes = seed_match(storage, athletes=3)
+    car = add_car(storage, match_id, 3)
+    plan, unassigned = plan_assignments(
+        [_athlete(athlete_id) for athlete_id in athletes], [car._asdict()], keep_siblings_together=False
+    )
+    assert (len(plan), unassigned) == (3, [])
+
+    other_car = add_car(storage, match_id, 1, driver='Mãe')
+    storage.assign_athlete(match_id, other_car.id, athletes[0])
+    storage.assign_athletes(match_id, plan)
+
+    cars, athletes_by_car = storage.match_roster(match_id)
+    seats = {car.id: car.seats for car in cars}
+    assert sorted(athlete.id for athlete in athletes_by_car[car.id]) == athletes[1:]
+    assert [athlete.id for athlete in athletes_by_car[other_car.id]] == [athletes[0]]
+    assert (seats[car.id], seats[other_car.id]) == (1, 0)
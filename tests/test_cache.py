@@ -0,0 +1,61 @@
+# Cached reads of the SQLite backend roll over at midnight and see the writes of other processes
+
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import sqlite_storage
+from storage import get_storage
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    path = str(tmp_path / 'athletes.db')
+    storage = get_storage(path)
+    storage.add_team('Sub-13')
+    return path, storage
+
+
+def test_past_matches_roll_over_at_midnight(sqlite, monkeypatch):
+    path, storage = sqlite
+    today = date.today()
+    storage.add_match('Porto', today.isoformat(), 'Sub-13', '')
+    monkeypatch.setattr(sqlite_storage, 'today', lambda: today.isoformat())
+    assert storage.past_matches_page() == []
+
+    monkeypatch.setattr(sqlite_storage, 'today', lambda: (today + timedelta(days=1)).isoformat())
+    assert [match.name for match in storage.past_matches_page()] == ['Porto']
+
+
+def test_cached_reads_see_writes_of_other_processes(sqlite):
+    path, storage = sqlite
+    assert storage.past_matches_page() == []
+
+    # e.g. an import or another replica, writing without this process's cache
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO matches (name, date, team, google_maps_link) VALUES ('Braga', '2020-01-01', 'Sub-13', '')")
+    assert [match.name for match in storage.past_matches_page()] == ['Braga']
+
+
+def test_next_match_rolls_over_at_midnight(sqlite, monkeypatch):
+    path, storage = sqlite
+    today = date.today()
+    storage.add_match('Porto', today.isoformat(), 'Sub-13', '')
+    storage.add_match('Lisboa', (today + timedelta(days=7)).isoformat(), 'Sub-13', '')
+    monkeypatch.setattr(sqlite_storage, 'today', lambda: today.isoformat())
+    assert storage.next_match('Sub-13').name == 'Porto'
+
+    monkeypatch.setattr(sqlite_storage, 'today', lambda: (today + timedelta(days=1)).isoformat())
+    assert storage.next_match('Sub-13').name == 'Lisboa'
+
+
+def test_next_matches_overview_rolls_over_at_midnight(sqlite, monkeypatch):
+    path, storage = sqlite
+    today = date.today()
+    storage.add_match('Porto', today.isoformat(), 'Sub-13', '')
+    monkeypatch.setattr(sqlite_storage, 'today', lambda: today.isoformat())
+    assert [summary.name for summary in storage.next_matches_overview()] == ['Porto']
+
+    monkeypatch.setattr(sqlite_storage, 'today', lambda: (today + timedelta(days=1)).isoformat())
+    assert [summary.name for summary in storage.next_matches_overview()] == [None]
@@ -0,0 +1,75 @@
+# The free seats of a car under concurrent edits and assignments (see Storage.update_car)
+
+import threading
+
+import pytest
+
+from conftest import add_car, seed_match
+from storage import StorageError
+
+
+# Function to read a car again
+def _car(storage, match_id, car_id):
+    cars, _ = storage.match_roster(match_id)
+    return next(car for car in cars if car.id == car_id)
+
+
+def test_seat_edit_after_an_assignment_is_refused(storage):
+    match_id, athletes = seed_match(storage)
+    car = add_car(storage, match_id, seats=2)
+
+    # Another parent seats an athlete after the edit form was filled in
+    storage.assign_athlete(match_id, car.id, athletes[0])
+    with pytest.raises(StorageError):
+        storage.update_car(car.id, 'Mãe', '98', 5, car.seats)
+
+    car_now = _car(storage, match_id, car.id)
+    assert (car_now.driver, car_now.contact, car_now.seats) == ('Pai', '99', 1)
+
+
+def test_contact_edit_keeps_the_seats_taken_meanwhile(storage):
+    match_id, athletes = seed_match(storage)
+    car = add_car(storage, match_id, seats=2)
+
+    storage.assign_athlete(match_id, car.id, athletes[0])
+    storage.assign_athlete(match_id, car.id, athletes[1])
+    storage.update_car(car.id, 'Pai', '999', car.seats, car.seats)
+
+    car_now = _car(storage, match_id, car.id)
+    assert (car_now.contact, car_now.seats) == ('999', 0)
+    with pytest.raises(StorageError):
+        storage.assign_athlete(match_id, car.id, athletes[2])
+
+
+def test_concurrent_assignments_and_seat_edits_lose_no_update(storage):
+    match_id, athletes = seed_match(storage, athletes=10)
+    car = add_car(storage, match_id, seats=10)
+    edits = 5
+    start = threading.Barrier(len(athletes) + 1)
+
+    def assign(athlete_id):
+        start.wait()
+        storage.assign_athlete(match_id, car.id, athlete_id)
+
+    # The driver adds one seat at a time, from what the page last showed, retrying on conflict
+    def add_seats():
+        start.wait()
+        done = 0
+        while done < edits:
+            seats = _car(storage, match_id, car.id).seats
+            try:
+                storage.update_car(car.id, 'Pai', '99', seats + 1, seats)
+                done += 1
+            except StorageError:
+                pass
+
+    threads = [threading.Thread(target=assign, args=(athlete_id,)) for athlete_id in athletes]
+    threads.append(threading.Thread(target=add_seats))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cars, athletes_by_car = storage.match_roster(match_id)
+    assert len(athletes_by_car[car.id]) == len(athletes)
+    assert _car(storage, match_id, car.id).seats == 10 + edits - len(athletes)
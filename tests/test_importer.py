@@ -0,0 +1,109 @@
+# Bulk import of teams, athletes and matches from CSV files (importer.py)
+
+import io
+import sqlite3
+
+import pytest
+
+import importer
+from db import using_database
+from importer import ImportFileError, import_file
+from storage import get_storage
+
+
+@pytest.fixture
+def club(tmp_path):
+    path = str(tmp_path / 'club.db')
+    storage = get_storage(path)
+    storage.add_team('Sub-13')
+    with using_database(path):
+        yield path, storage
+
+
+# Function to import CSV text as an uploaded file would be
+def _import(kind, text, dry_run=False):
+    return import_file(kind, io.BytesIO(text.encode('utf-8')), f'{kind}.csv', dry_run)
+
+
+def test_import(club):
+    path, storage = club
+    report = _import('teams', 'name\nSub-15\nSub-17\n')
+    assert report == {'rows': 2, 'imported': 2, 'duplicates': 0, 'errors': []}
+
+    report = _import('athletes', 'name;contact;teams\nAna;912;Sub-13, Sub-15\nRui;913;\n')
+    assert report == {'rows': 2, 'imported': 2, 'duplicates': 0, 'errors': []}
+    assert [(athlete.name, athlete.teams) for athlete in storage.athletes_page()] == [
+        ('Ana', 'Sub-13,Sub-15'), ('Rui', None),
+    ]
+
+    report = _import('matches', 'name,date,team,google_maps_link\nPorto,01/09/2099,sub-13,http://maps\n')
+    assert report['imported'] == 1
+    match = storage.next_match('Sub-13')
+    assert (match.name, match.date, match.google_maps_link) == ('Porto', '2099-09-01', 'http://maps')
+
+
+def test_rejected_rows(club):
+    path, storage = club
+    report = _import('athletes', 'name,contact,teams\n,911,\nAna,912,Sub-99\nRui,913,Sub-13\n')
+    assert report['imported'] == 1
+    assert report['errors'] == [
+        {'line': 2, 'error': 'o nome está vazio'},
+        {'line': 3, 'error': 'escalão desconhecido: Sub-99'},
+    ]
+
+    report = _import('matches', 'name,date,team\nPorto,31/02/2099,Sub-13\nBraga,2099-09-01,\n')
+    assert report['imported'] == 0
+    assert [error['line'] for error in report['errors']] == [2, 3]
+
+    # Rows already in the database or earlier in the file are skipped
+    report = _import('athletes', 'name,contact\nrui,913\nAna,912\n Ana ,912\n')
+    assert (report['imported'], report['duplicates']) == (1, 2)
+    assert [athlete.name for athlete in storage.athletes_page()] == ['Ana', 'Rui']
+
+    with pytest.raises(ImportFileError):
+        _import('matches', 'name,team\nPorto,Sub-13\n')
+    with pytest.raises(ImportFileError):
+        import_file('teams', io.BytesIO(b'name\n'), 'teams.txt')
+
+
+def test_dry_run(club):
+    path, storage = club
+    report = _import('teams', 'name\nSub-13\nSub-15\n', dry_run=True)
+    assert (report['imported'], report['duplicates']) == (1, 1)
+    assert [team.name for team in storage.teams()] == ['Sub-13']
+
+
+# A CSV upload that checks, while it is being read, that no write lock is held
+class _LockCheckingFile(io.StringIO):
+    def __init__(self, text, path):
+        super().__init__(text)
+        self.path = path
+
+    def __next__(self):
+        conn = sqlite3.connect(self.path, timeout=0)
+        conn.execute('BEGIN IMMEDIATE')
+        conn.rollback()
+        conn.close()
+        return super().__next__()
+
+
+def test_file_read_before_write_lock(club):
+    path, storage = club
+    report = import_file('teams', _LockCheckingFile('name\nSub-15\nSub-17\n', path), 'teams.csv')
+    assert report['imported'] == 2
+
+
+def test_teams_changed_during_import(club, monkeypatch):
+    path, storage = club
+    # Another session renames the team after the file was validated
+    validate_rows = importer._validate_rows
+
+    def validate_then_rename(*args):
+        result = validate_rows(*args)
+        storage.rename_team(storage.teams()[0].id, 'Sub-14')
+        return result
+
+    monkeypatch.setattr(importer, '_validate_rows', validate_then_rename)
+    with pytest.raises(ImportFileError):
+        _import('athletes', 'name,contact,teams\nAna,912,Sub-13\n')
+    assert storage.athletes_page() == []
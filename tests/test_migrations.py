@@ -0,0 +1,52 @@
+# Migrations of databases created by older versions of the app (see migrations.py)
+
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from migrations import MIGRATIONS
+from storage import StorageError, get_storage
+
+
+# Function to create a database as the first version of the app did: the Jogos page made
+# matches and teams (without UNIQUE team names) and the other pages the rest, with the
+# teams of an athlete as comma-separated names
+def _legacy_database(path):
+    next_week = (date.today() + timedelta(days=7)).isoformat()
+    with sqlite3.connect(path) as conn:
+        conn.executescript(f'''
+            CREATE TABLE matches (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, date TEXT, team TEXT,
+                                  google_maps_link TEXT);
+            CREATE TABLE teams (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT);
+            CREATE TABLE athletes (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, contact TEXT, teams TEXT);
+            CREATE TABLE cars (id INTEGER PRIMARY KEY AUTOINCREMENT, match_id INTEGER, driver TEXT, contact TEXT,
+                               seats INTEGER, FOREIGN KEY(match_id) REFERENCES matches(id));
+            CREATE TABLE assignments (id INTEGER PRIMARY KEY AUTOINCREMENT, match_id INTEGER, car_id INTEGER,
+                                      athlete_id INTEGER);
+            INSERT INTO teams (name) VALUES ('Sub-13'), ('Sub-15'), ('Sub-13');
+            INSERT INTO athletes (name, contact, teams) VALUES ('Ana', '913', 'Sub-13'), ('Rui', '914', 'Sub-13,Sub-15');
+            INSERT INTO matches (name, date, team, google_maps_link) VALUES ('Porto', '{next_week}', 'Sub-13', '');
+        ''')
+    conn.close()
+
+
+def test_legacy_database_merges_duplicate_teams(tmp_path):
+    path = str(tmp_path / 'athletes.db')
+    _legacy_database(path)
+    storage = get_storage(path)
+
+    assert [(team.id, team.name) for team in storage.teams()] == [(1, 'Sub-13'), (2, 'Sub-15')]
+    assert [athlete.name for athlete in storage.athletes_page(teams=('Sub-13',))] == ['Ana', 'Rui']
+    assert storage.athletes_page(search='rui')[0].teams.split(',') == ['Sub-13', 'Sub-15']
+    match = storage.next_match('Sub-13')
+    assert match.name == 'Porto'
+    assert [athlete.name for athlete in storage.available_athletes(match.id, 'Sub-13')] == ['Ana', 'Rui']
+
+    with pytest.raises(StorageError):
+        storage.add_team('Sub-13')
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO teams (name) VALUES ('Sub-15')")
+    conn.close()
@@ -0,0 +1,47 @@
+# Notifications of the SQLite backend: every seat going away is enqueued, in its transaction
+
+import pytest
+
+import db
+import notifications
+from conftest import add_car, seed_match
+from storage import get_storage
+
+
+@pytest.fixture
+def sqlite(tmp_path, monkeypatch):
+    monkeypatch.setenv('AAC_NOTIFY_CHANNELS', 'file')
+    monkeypatch.setenv('AAC_NOTIFY_FILE', str(tmp_path / 'notifications.jsonl'))
+    path = str(tmp_path / 'athletes.db')
+    return path, get_storage(path)
+
+
+# Function to get the events and athlete ids in the outbox of a database
+def _outbox(path):
+    with db.using_database(path):
+        return db.get_connection().execute(
+            "SELECT event, json_extract(payload, '$.athlete_id') FROM outbox ORDER BY id"
+        ).fetchall()
+
+
+def test_deleting_an_athlete_or_a_match_notifies_the_removals(sqlite):
+    path, storage = sqlite
+    match_id, athletes = seed_match(storage, athletes=2)
+    car = add_car(storage, match_id, seats=2)
+    storage.assign_athletes(match_id, [(athlete_id, car.id) for athlete_id in athletes])
+
+    storage.delete_athlete(athletes[0])
+    storage.delete_match(match_id)
+    assert _outbox(path)[2:] == [('removed', athletes[0]), ('removed', athletes[1])]
+
+
+def test_idle_workers_dont_take_the_write_lock(sqlite, monkeypatch):
+    path, storage = sqlite
+    storage.teams()
+    dispatcher = notifications.Dispatcher({'file': notifications.FileChannel.from_env()}, path)
+    begun = []
+    monkeypatch.setattr(notifications, 'write_transaction', lambda *tables: begun.append(tables))
+
+    with db.using_database(path):
+        assert dispatcher.drain_once() == 0
+    assert begun == []
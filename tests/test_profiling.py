@@ -0,0 +1,46 @@
+# The per-rerun sampling profiler (profiling.py), on pages run with Streamlit's AppTest
+
+import time
+from datetime import timedelta
+
+from streamlit.testing.v1 import AppTest
+
+import profiling
+
+# A page rerunning itself twice, busy for 50 ms on every run, noting when each run starts
+PAGE = '''
+import time
+from datetime import datetime
+import streamlit as st
+from profiling import profile_page
+
+profile_page()
+
+st.session_state.setdefault('started_at', []).append(datetime.now())
+deadline = time.perf_counter() + 0.05
+while time.perf_counter() < deadline:
+    pass
+if len(st.session_state.started_at) < 3:
+    st.rerun()
+'''
+
+
+def test_one_profile_per_run(tmp_path, monkeypatch):
+    monkeypatch.setenv('AAC_PROFILE', '1')
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, '_recent', profiling.deque(maxlen=profiling.RECENT_PROFILES))
+    # Sparse samples, so a sampler is unlikely to look at the stack between two runs
+    monkeypatch.setattr(profiling, 'SAMPLE_INTERVAL', 0.02)
+
+    at = AppTest.from_string(PAGE, default_timeout=10).run()
+    assert len(at.session_state.started_at) == 3
+    time.sleep(0.2)  # the samplers notice the end of the last run
+
+    profiles = sorted(profiling.recent_profiles(), key=lambda profile: profile['started_at'])
+    assert len(profiles) == 3
+    # Every profile stops with its own run (within a sample or so) instead of carrying on
+    # into the next one, which runs the same page code on the same thread
+    for profile, next_run_started_at in zip(profiles, at.session_state.started_at[1:]):
+        ended_at = profile['started_at'] + timedelta(milliseconds=profile['duration_ms'])
+        assert ended_at - next_run_started_at < timedelta(milliseconds=30)
+    assert len(list(tmp_path.rglob('*.folded'))) == 3
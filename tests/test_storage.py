@@ -0,0 +1,174 @@
+# The contract of storage.Storage, run against every backend (see conftest.py)
+
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import add_car, seed_match
+from storage import StorageError
+
+
+# Function to get a date relative to today, as the backends store it
+def _day(days):
+    return (date.today() + timedelta(days=days)).isoformat()
+
+
+def test_teams(storage):
+    storage.add_team('Sub-13')
+    storage.add_team('Sub-15')
+    with pytest.raises(StorageError):
+        storage.add_team('Sub-13')
+    team_id = storage.teams()[0].id
+    storage.add_match('Porto', _day(3), 'Sub-13', '')
+
+    storage.rename_team(team_id, 'Sub-14')
+    assert [team.name for team in storage.teams()] == ['Sub-14', 'Sub-15']
+    assert storage.next_match('Sub-14').name == 'Porto'
+
+    storage.delete_team(storage.teams()[1].id)
+    assert [team.name for team in storage.teams()] == ['Sub-14']
+
+
+def test_athletes(storage):
+    storage.add_team('Sub-13')
+    storage.add_team('Sub-15')
+    storage.add_athlete('João Inês', '912 345 678', ['Sub-13'])
+    storage.add_athlete('Ana', '913', ['Sub-13', 'Sub-15'])
+    storage.add_athlete('Rui', '914', ['Sub-15'])
+
+    page = storage.athletes_page(page_size=2)
+    assert [athlete.name for athlete in page] == ['Ana', 'João Inês', 'Rui']  # one extra row: there is a next page
+    assert sorted(page[0].teams.split(',')) == ['Sub-13', 'Sub-15']
+    after = (page[1].name, page[1].id)
+    assert [athlete.name for athlete in storage.athletes_page(after=after, page_size=2)] == ['Rui']
+    assert [athlete.name for athlete in storage.athletes_page(descending=True)] == ['Rui', 'João Inês', 'Ana']
+    assert [athlete.name for athlete in storage.athletes_page(teams=('Sub-15',))] == ['Ana', 'Rui']
+
+    # Words start words of the name or contact, accents aside
+    assert [athlete.name for athlete in storage.athletes_page(search='joao ines')] == ['João Inês']
+    assert [athlete.name for athlete in storage.athletes_page(search='345')] == ['João Inês']
+    assert storage.athletes_page(search='oao') == []
+
+    rui = storage.athletes_page(search='rui')[0]
+    storage.update_athlete(rui.id, 'Rui Sá', '915', ['Sub-13'])
+    assert storage.athlete(rui.id)._replace(id=None) == (None, 'Rui Sá', '915', 'Sub-13')
+    storage.delete_athlete(rui.id)
+    assert storage.athlete(rui.id) is None
+
+
+def test_matches(storage):
+    storage.add_team('Sub-13')
+    storage.add_team('Sub-15')
+    storage.add_match('Braga', _day(-10), 'Sub-13', '')
+    storage.add_match('Porto', _day(3), 'Sub-13', 'https://maps')
+    storage.add_match('Lisboa', _day(10), 'Sub-13', '')
+    storage.add_match('Faro', _day(-2), 'Sub-15', '')
+
+    page = storage.matches_page(page_size=2)
+    assert [match.name for match in page] == ['Braga', 'Faro', 'Porto']
+    assert [match.name for match in storage.matches_page(after=(page[1].date, page[1].id), page_size=2)] == \
+        ['Porto', 'Lisboa']
+    assert [match.name for match in storage.matches_page(teams=('Sub-15',))] == ['Faro']
+    assert [match.name for match in storage.matches_page(search='orto')] == ['Porto']
+
+    porto = storage.next_match('Sub-13')
+    assert (porto.name, porto.date, porto.google_maps_link) == ('Porto', _day(3), 'https://maps')
+    assert storage.match(porto.id) == porto
+    assert storage.next_match('Sub-15') is None
+
+    assert [match.name for match in storage.past_matches_page()] == ['Faro', 'Braga']
+    assert [match.name for match in storage.past_matches_page(teams=('Sub-13',))] == ['Braga']
+    assert [match.name for match in storage.past_matches_page(date_from=_day(-5))] == ['Faro']
+
+    storage.update_match(porto.id, 'Porto', _day(20), 'Sub-13', '')
+    assert storage.next_match('Sub-13').name == 'Lisboa'
+    storage.delete_match(porto.id)
+    assert storage.match(porto.id) is None
+
+
+def test_cars_and_assignments(storage):
+    match_id, athletes = seed_match(storage, athletes=3)
+    car = add_car(storage, match_id, seats=2)
+    other_car = add_car(storage, match_id, seats=1, driver='Mãe')
+
+    storage.assign_athlete(match_id, car.id, athletes[0])
+    storage.assign_athlete(match_id, car.id, athletes[1])
+    cars, athletes_by_car = storage.match_roster(match_id)
+    assert {car.id: car.seats for car in cars} == {car.id: 0, other_car.id: 1}
+    assert [athlete.id for athlete in athletes_by_car[car.id]] == athletes[:2]
+    assert [athlete.id for athlete in storage.available_athletes(match_id, 'Sub-13')] == athletes[2:]
+    with pytest.raises(StorageError):
+        storage.assign_athlete(match_id, car.id, athletes[2])
+
+    # Moving an athlete gives the seat of the other car back
+    storage.assign_athlete(match_id, other_car.id, athletes[0])
+    cars, athletes_by_car = storage.match_roster(match_id)
+    assert {car.id: car.seats for car in cars} == {car.id: 1, other_car.id: 0}
+    assert [athlete.id for athlete in athletes_by_car[other_car.id]] == [athletes[0]]
+
+    storage.remove_athlete(car.id, athletes[1])
+    storage.remove_athlete(car.id, athletes[1])  # already removed: no seat given back twice
+    cars, athletes_by_car = storage.match_roster(match_id)
+    assert {car.id: car.seats for car in cars} == {car.id: 2, other_car.id: 0}
+    assert car.id not in athletes_by_car
+
+    storage.delete_car(other_car.id)
+    cars, athletes_by_car = storage.match_roster(match_id)
+    assert [car.id for car in cars] == [car.id]
+    assert len(storage.available_athletes(match_id, 'Sub-13')) == 3
+
+
+def test_assign_athletes_is_all_or_nothing(storage):
+    match_id, athletes = seed_match(storage, athletes=3)
+    car = add_car(storage, match_id, seats=2)
+
+    with pytest.raises(StorageError):
+        storage.assign_athletes(match_id, [(athlete_id, car.id) for athlete_id in athletes])
+    assert len(storage.available_athletes(match_id, 'Sub-13')) == 3
+
+    storage.assign_athlete(match_id, car.id, athletes[0])
+    # Athletes seated in the meantime are skipped
+    storage.assign_athletes(match_id, [(athletes[0], car.id), (athletes[1], car.id)])
+    cars, athletes_by_car = storage.match_roster(match_id)
+    assert cars[0].seats == 0
+    assert [athlete.id for athlete in athletes_by_car[car.id]] == athletes[:2]
+
+
+def test_deletes_give_the_seats_back(storage):
+    match_id, athletes = seed_match(storage, athletes=2)
+    car = add_car(storage, match_id, seats=2)
+    storage.assign_athletes(match_id, [(athlete_id, car.id) for athlete_id in athletes])
+
+    storage.delete_athlete(athletes[0])
+    cars, athletes_by_car = storage.match_roster(match_id)
+    assert cars[0].seats == 1
+    assert [athlete.id for athlete in athletes_by_car[car.id]] == athletes[1:]
+
+    storage.delete_match(match_id)
+    assert storage.match_roster(match_id) == ([], {})
+
+
+def test_next_matches_overview(storage):
+    match_id, athletes = seed_match(storage, athletes=3)
+    storage.add_team('Sub-15')
+    car = add_car(storage, match_id, seats=4)
+    storage.assign_athlete(match_id, car.id, athletes[0])
+
+    summaries = {summary.team: summary for summary in storage.next_matches_overview()}
+    sub13 = summaries['Sub-13']
+    assert (sub13.id, sub13.cars, sub13.free_seats, sub13.filled_seats, sub13.unassigned) == (match_id, 1, 3, 1, 2)
+    assert summaries['Sub-15'].id is None
+
+
+def test_past_match_roster(storage):
+    storage.add_team('Sub-13')
+    storage.add_athlete('Ana', '913', ['Sub-13'])
+    storage.add_match('Braga', _day(-3), 'Sub-13', '')
+    match_id = storage.past_matches_page()[0].id
+    car = add_car(storage, match_id, seats=3)
+    athlete_id = storage.athletes_page()[0].id
+    storage.assign_athlete(match_id, car.id, athlete_id)
+
+    cars, athletes_by_car = storage.past_match_roster(match_id)
+    assert [(car.driver, car.seats) for car in cars] == [('Pai', 2)]
+    assert [(athlete.id, athlete.name) for athlete in athletes_by_car[car.id]] == [(athlete_id, 'Ana')]
@@ -0,0 +1,55 @@
+# The registry of clubs (tenants.py): their passwords and the database of the caller
+
+import hashlib
+import json
+
+import pytest
+
+import tenants
+from db import DB_PATH, current_database, using_database
+from storage import StorageError
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps({
+        'aac': {'name': 'AAC', 'database': str(tmp_path / 'aac.db'), **tenants.hash_password('segredo')},
+        'old': {'name': 'Antigo', 'database': str(tmp_path / 'old.db'),
+                'password_sha256': hashlib.sha256(b'antiga').hexdigest()},
+    }))
+    monkeypatch.setenv('AAC_TENANTS_FILE', str(path))
+    monkeypatch.setattr(tenants, '_registry', None)
+    return tenants.load_tenants()
+
+
+def test_passwords(registry):
+    # Every hash has its own salt
+    assert tenants.hash_password('segredo') != tenants.hash_password('segredo')
+    assert 'segredo' not in json.dumps(registry)
+
+    assert tenants.check_password('aac', 'segredo')
+    assert tenants.check_password('aac', 'segredo')  # checked before
+    assert not tenants.check_password('aac', 'Segredo')
+    assert not tenants.check_password('aac', '')
+
+    with pytest.warns(UserWarning, match='unsalted'):
+        assert tenants.check_password('old', 'antiga')
+    with pytest.warns(UserWarning):
+        assert not tenants.check_password('old', 'segredo')
+
+
+def test_no_club_without_registry(tmp_path, monkeypatch):
+    monkeypatch.setenv('AAC_TENANTS_FILE', str(tmp_path / 'missing.json'))
+    monkeypatch.setattr(tenants, '_registry', None)
+    # A single-club deployment keeps using athletes.db
+    assert current_database() == DB_PATH
+    assert tenants.check_password('aac', 'aac')
+
+
+def test_no_club_with_registry(registry):
+    # Without a club, the default database could hold the data of another club
+    with pytest.raises(StorageError):
+        current_database()
+    with using_database(registry['aac']['database']):
+        assert current_database() == registry['aac']['database']